@@ -0,0 +1,207 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线基准测试
+
+生成合成视频和字幕，使用桩分析器代替 DeepFace 运行完整的选帧、解码、检测、裁剪、分析和写图流程，
+输出各阶段耗时、每秒处理帧数、峰值内存和缺页次数（JSON 格式），用于比较不同版本或配置的吞吐量和内存分配
+
+用法（在项目根目录下执行）:
+    python -m benchmark.run_benchmark
+    python -m benchmark.run_benchmark -s 720p_long_gop -o bench.json --set crop_storage=npy
+    python -m benchmark.run_benchmark -s 2160p_frame_path --set frame_buffer_pool=16
+"""
+import json
+import logging
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from benchmark.stub_analyzer import StubFaceAnalyzer
+from benchmark.synthetic_media import SyntheticMedia
+from utils.face_conf import PrivateConfig, PublicConfig
+from utils.face_util import FaceCaptureUtils
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+# 基准测试场景，detect_ms/analyze_ms 为桩分析器模拟的模型耗时
+SCENARIOS = {
+    '360p_short_gop': {'seconds': 20, 'width': 640, 'height': 360, 'fps': 25, 'gop_size': 12,
+                       'faces_per_frame': 2, 'cue_seconds': 2.0, 'gap_seconds': 1.0,
+                       'detect_ms': 0.0, 'analyze_ms': 0.0},
+    '720p_long_gop': {'seconds': 30, 'width': 1280, 'height': 720, 'fps': 30, 'gop_size': 250,
+                      'faces_per_frame': 2, 'cue_seconds': 1.5, 'gap_seconds': 3.0,
+                      'detect_ms': 0.0, 'analyze_ms': 0.0},
+    '1080p_model_cost': {'seconds': 10, 'width': 1920, 'height': 1080, 'fps': 24, 'gop_size': 48,
+                         'faces_per_frame': 3, 'cue_seconds': 2.0, 'gap_seconds': 2.0,
+                         'detect_ms': 20.0, 'analyze_ms': 30.0},
+    '2160p_frame_path': {'seconds': 6, 'width': 3840, 'height': 2160, 'fps': 24, 'gop_size': 6,
+                         'faces_per_frame': 2, 'cue_seconds': 2.0, 'gap_seconds': 1.0,
+                         'detect_ms': 0.0, 'analyze_ms': 0.0},
+}
+
+
+def reset_peak_rss():
+    """重置进程的峰值内存（Linux），使每个场景单独统计，不支持时返回 False"""
+    try:
+        Path('/proc/self/clear_refs').write_text('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb(reset_supported):
+    """读取进程的峰值内存（MB），不支持重置时为进程启动以来的峰值"""
+    if reset_supported:
+        for line in Path('/proc/self/status').read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return round(int(line.split()[1]) / 1024, 1)
+
+    # Linux 下 ru_maxrss 的单位为 KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def parse_overrides(public_config, overrides):
+    """按配置项默认值的类型解析 --set key=value 参数"""
+    for override in overrides:
+        key, _, value = override.partition('=')
+        if not hasattr(public_config, key):
+            raise ValueError('未知的配置项：%s' % key)
+
+        default = getattr(public_config, key)
+        if isinstance(default, bool):
+            value = value.lower() in ('true', '1', 'yes', 'y')
+        elif isinstance(default, (int, float)):
+            value = type(default)(value)
+
+        setattr(public_config, key, value)
+
+
+def run_scenario(name, scenario, work_dir, overrides):
+    """生成合成素材并运行一个场景，返回测试结果"""
+    video_path = work_dir / ('%s.mp4' % name)
+    sub_path = work_dir / ('%s.srt' % name)
+    output_path = work_dir / ('%s_output' % name)
+
+    if not video_path.exists():
+        SyntheticMedia.write_video(path=video_path,
+                                   seconds=scenario['seconds'],
+                                   width=scenario['width'],
+                                   height=scenario['height'],
+                                   fps=scenario['fps'],
+                                   gop_size=scenario['gop_size'],
+                                   faces_per_frame=scenario['faces_per_frame'])
+    # 每次运行使用空的输出目录，结果文件和分卷不与上次运行混在一起
+    shutil.rmtree(output_path, ignore_errors=True)
+
+    cue_count = SyntheticMedia.write_subtitles(path=sub_path,
+                                               seconds=scenario['seconds'],
+                                               cue_seconds=scenario['cue_seconds'],
+                                               gap_seconds=scenario['gap_seconds'])
+
+    public_config = PublicConfig()
+    # 重复运行时不复用进度记录，阶段耗时从运行报告中读取
+    public_config.checkpoint = False
+    public_config.perf_report = 'perf_report.json'
+    parse_overrides(public_config=public_config, overrides=overrides)
+
+    private_config = PrivateConfig()
+    FaceCaptureUtils.init(private_config=private_config, public_config=public_config)
+
+    FaceCaptureUtils.face_analyzer = StubFaceAnalyzer(faces_per_frame=scenario['faces_per_frame'],
+                                                      batch_size=public_config.analyze_batch_size,
+                                                      detect_ms=scenario['detect_ms'],
+                                                      analyze_ms=scenario['analyze_ms'])
+
+    try:
+        reset_supported = reset_peak_rss()
+        # 新分配的内存在首次写入时产生缺页，缺页次数反映处理过程中的内存分配量
+        page_faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+        start_time = time.perf_counter()
+        faces = FaceCaptureUtils.capture_avatar_from_files(video_path=video_path,
+                                                           sub_path=sub_path,
+                                                           avatar_output_path=output_path)
+        seconds = time.perf_counter() - start_time
+        page_faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - page_faults
+        peak_rss = peak_rss_mb(reset_supported)
+    finally:
+        FaceCaptureUtils.face_analyzer = None
+
+    with open(output_path / public_config.perf_report, 'r', encoding='utf-8') as file:
+        report = json.load(file)
+
+    stages = report['stages']
+    for total in stages.values():
+        total['per_second'] = round(total['count'] / total['seconds'], 2) if total['seconds'] else None
+
+    frame_count = stages.get('decode', {}).get('count', 0)
+
+    return {
+        'scenario': name,
+        'parameters': scenario,
+        'overrides': overrides,
+        'subtitle_cues': cue_count,
+        'frames': frame_count,
+        'faces': len(faces),
+        'seconds': round(seconds, 4),
+        'frames_per_second': round(frame_count / seconds, 2) if seconds else None,
+        'peak_rss_mb': peak_rss,
+        'minor_page_faults': page_faults,
+        'page_faults_per_frame': round(page_faults / frame_count, 1) if frame_count else None,
+        'stages': stages,
+        'counters': report['counters'],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = ArgumentParser(description='人脸捕捉离线基准测试')
+    parser.add_argument('-s', '--scenario', help='运行的场景，可重复指定，默认运行全部场景', action='append',
+                        choices=sorted(SCENARIOS), dest='scenarios')
+    parser.add_argument('-o', '--output', help='测试结果 JSON 文件，默认只输出到标准输出', dest='output')
+    parser.add_argument('-w', '--work-dir', help='合成素材和输出目录，默认使用临时目录', dest='work_dir')
+    parser.add_argument('--set', help='覆盖公共配置项，如 --set crop_storage=npy，可重复指定', action='append',
+                        default=[], dest='overrides')
+    args = parser.parse_args()
+
+    # 基准测试只关心耗时，不输出逐帧日志
+    hlog.get_logger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = Path(args.work_dir or temp_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+
+        results = [run_scenario(name=name, scenario=SCENARIOS[name], work_dir=work_dir, overrides=args.overrides)
+                   for name in args.scenarios or sorted(SCENARIOS)]
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import time
+
+import cv2
+import numpy as np
+
+from benchmark.synthetic_media import SyntheticMedia
+
+
+class StubFaceAnalyzer:
+    """
+    不加载模型的桩分析器，接口与 FaceAnalyzer 相同
+
+    检测结果为合成视频中人脸的固定位置，属性分析返回固定结果，可通过 detect_ms/analyze_ms 模拟模型耗时；
+    结果完全确定，用于在没有 TensorFlow 和真实视频的环境中测量流水线本身的吞吐量
+    """
+
+    ACTIONS = ('age', 'gender', 'race', 'emotion')
+
+    ATTRIBUTES = {
+        'age': 30,
+        'gender': {'Woman': 10.0, 'Man': 90.0},
+        'dominant_gender': 'Man',
+        'race': {'asian': 70.0, 'indian': 5.0, 'black': 5.0, 'white': 10.0, 'middle eastern': 5.0,
+                 'latino hispanic': 5.0},
+        'dominant_race': 'asian',
+        'emotion': {'angry': 5.0, 'disgust': 5.0, 'fear': 5.0, 'happy': 60.0, 'sad': 5.0, 'surprise': 5.0,
+                    'neutral': 15.0},
+        'dominant_emotion': 'happy',
+    }
+
+    # 对齐人脸尺寸，与 retinaface 对齐输出的量级相当
+    ALIGNED_SIZE = (152, 152)
+
+    def __init__(self, faces_per_frame, batch_size, detect_ms=0.0, analyze_ms=0.0):
+        """
+        参数:
+            faces_per_frame: 每帧返回的人脸数，与合成视频一致
+            batch_size: 属性分析批大小
+            detect_ms: 每帧检测模拟耗时（毫秒）
+            analyze_ms: 每个批次属性分析模拟耗时（毫秒）
+        """
+        self.faces_per_frame = faces_per_frame
+        self.batch_size = batch_size
+        self.detect_ms = detect_ms
+        self.analyze_ms = analyze_ms
+        self.actions = list(StubFaceAnalyzer.ACTIONS)
+        self.detector_backend = 'stub'
+        self.cascade = None
+        self.cascade_roi = False
+        self.model_identity = 'stub'
+
+    def warm_up(self):
+        pass
+
+    def detect(self, frame):
+        height, width = frame.shape[:2]
+
+        faces = []
+        for region in SyntheticMedia.face_regions(width=width, height=height, faces_per_frame=self.faces_per_frame):
+            crop = frame[region['y']:region['y'] + region['h'], region['x']:region['x'] + region['w']]
+            aligned = cv2.resize(crop, StubFaceAnalyzer.ALIGNED_SIZE)[:, :, ::-1].astype(np.float32) / 255.0
+            faces.append({'region': dict(region), 'face_confidence': 0.99, 'face': aligned})
+
+        if self.detect_ms:
+            time.sleep(self.detect_ms / 1000)
+
+        return faces
+
+    def analyze(self, faces):
+        for batch_start in range(0, len(faces), self.batch_size):
+            for face in faces[batch_start:batch_start + self.batch_size]:
+                for key, value in StubFaceAnalyzer.ATTRIBUTES.items():
+                    face[key] = dict(value) if isinstance(value, dict) else value
+
+            if self.analyze_ms:
+                time.sleep(self.analyze_ms / 1000)
+
+        return faces
+
+    def embed(self, faces):
+        for face in faces:
+            embedding = cv2.resize(face['face'], (8, 8)).astype(np.float32).flatten()
+            face['embedding'] = embedding / (np.linalg.norm(embedding) or 1.0)
+
+        return faces
+
+    def attributes_of(self, face):
+        if any(action not in face for action in self.actions):
+            return None
+
+        return {key: face[key] for key in StubFaceAnalyzer.ATTRIBUTES if key in face}
@@ -0,0 +1,123 @@
+from pathlib import Path
+
+import av
+import cv2
+import numpy as np
+
+
+class SyntheticMedia:
+    """
+    基准测试用的合成视频和字幕
+
+    视频中按固定位置绘制若干个带眼睛的"人脸"并叠加随机噪声和移动的背景，内容由随机种子决定，
+    相同参数生成的文件完全一致；字幕按固定的时长和间隔覆盖整个视频
+    """
+
+    @staticmethod
+    def face_regions(width, height, faces_per_frame):
+        """
+        合成视频中人脸的位置，桩分析器返回相同的检测结果
+
+        返回:
+            人脸位置列表 [{'x', 'y', 'w', 'h', 'left_eye', 'right_eye'}, ...]
+        """
+        regions = []
+        size = max(16, min(width // (faces_per_frame + 1), height // 2))
+
+        for index in range(faces_per_frame):
+            x = (index + 1) * width // (faces_per_frame + 1) - size // 2
+            y = height // 2 - size // 2
+            regions.append({
+                'x': x,
+                'y': y,
+                'w': size,
+                'h': size,
+                # 右眼在图像左侧，与 DeepFace 的约定一致
+                'left_eye': (x + size * 7 // 10, y + size * 2 // 5),
+                'right_eye': (x + size * 3 // 10, y + size * 2 // 5),
+            })
+
+        return regions
+
+    @staticmethod
+    def write_video(path, seconds, width, height, fps, gop_size, faces_per_frame, seed=0):
+        """
+        生成 H.264 编码的合成视频，libx264 不可用时使用 MPEG-4
+
+        参数:
+            path: 输出文件路径
+            seconds: 视频时长（秒）
+            width: 宽度
+            height: 高度
+            fps: 帧率
+            gop_size: 关键帧间隔（帧）
+            faces_per_frame: 每帧绘制的人脸数
+            seed: 随机种子
+        """
+        rng = np.random.default_rng(seed)
+        background = rng.integers(0, 256, size=(height, width * 2, 3), dtype=np.uint8)
+        background = cv2.GaussianBlur(background, (0, 0), 8)
+        regions = SyntheticMedia.face_regions(width=width, height=height, faces_per_frame=faces_per_frame)
+
+        codec = 'libx264' if 'libx264' in av.codecs_available else 'mpeg4'
+
+        with av.open(str(path), mode='w') as container:
+            stream = container.add_stream(codec, rate=fps)
+            stream.width = width
+            stream.height = height
+            stream.pix_fmt = 'yuv420p'
+            stream.gop_size = gop_size
+            if codec == 'libx264':
+                stream.options = {'preset': 'ultrafast', 'keyint': str(gop_size), 'min-keyint': str(gop_size),
+                                  'scenecut': '0'}
+
+            for frame_index in range(int(seconds * fps)):
+                offset = frame_index * 4 % width
+                image = np.ascontiguousarray(background[:, offset:offset + width])
+
+                for region in regions:
+                    center = (region['x'] + region['w'] // 2, region['y'] + region['h'] // 2)
+                    axes = (region['w'] // 2, region['h'] // 2)
+                    cv2.ellipse(image, center, axes, 0, 0, 360, (150, 180, 220), -1)
+                    for eye in (region['left_eye'], region['right_eye']):
+                        cv2.circle(image, eye, max(2, region['w'] // 16), (40, 40, 40), -1)
+
+                noise = rng.integers(0, 8, size=image.shape, dtype=np.uint8)
+                image = cv2.add(image, noise)
+
+                for packet in stream.encode(av.VideoFrame.from_ndarray(image, format='bgr24')):
+                    container.mux(packet)
+
+            for packet in stream.encode():
+                container.mux(packet)
+
+    @staticmethod
+    def format_time(seconds):
+        """将秒数转换为字幕时间字符串 (hh:mm:ss,ms)"""
+        milliseconds = int(round(seconds * 1000))
+        hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+        minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+        secs, milliseconds = divmod(milliseconds, 1000)
+
+        return '%02d:%02d:%02d,%03d' % (hours, minutes, secs, milliseconds)
+
+    @staticmethod
+    def write_subtitles(path, seconds, cue_seconds, gap_seconds):
+        """
+        生成覆盖整个视频的 SRT 字幕，每条字幕持续 cue_seconds 秒，字幕之间间隔 gap_seconds 秒
+        """
+        lines = []
+        start = gap_seconds
+        index = 1
+
+        while start + cue_seconds <= seconds:
+            lines.append('%s\n%s --> %s\n字幕 %s\n' % (index,
+                                                     SyntheticMedia.format_time(start),
+                                                     SyntheticMedia.format_time(start + cue_seconds),
+                                                     index))
+            start += cue_seconds + gap_seconds
+            index += 1
+
+        Path(path).write_text('\n'.join(lines), encoding='utf-8')
+
+        return index - 1
@@ -5,8 +5,8 @@ from os.path import join, dirname
 from pathlib import Path
 
 from utils.config_builder import ConfigBuilder
-from utils.face_util import interrupt_from_keyboard_handler, FaceCaptureUtils
 from utils.face_conf import PrivateConfig, PublicConfig
+from utils.face_pipeline import interrupt_from_keyboard_handler
 from happy_python import HappyLog, HappyConfigParser
 
 hlog = HappyLog.get_instance()
@@ -38,7 +38,7 @@ def build_help():
                         '--input_sub_file',
                         help='输入视频字幕文件',
                         type=str,
-                        dest='input_video_file',
+                        dest='input_sub_file',
                         )
 
     parser.add_argument('-o',
@@ -48,37 +48,71 @@ def build_help():
                         dest='output_face_img_dir',
                         )
 
+    parser.add_argument('-b',
+                        '--batch',
+                        help='批量处理目录（视频与同名 .srt 字幕配对）或清单文件（每行"视频路径,字幕路径"）',
+                        type=str,
+                        dest='batch_input',
+                        )
+
+    parser.add_argument('-j',
+                        '--shards',
+                        help='将单个视频按时间分片并行处理的进程数，默认使用配置文件中的 video_shards',
+                        type=int,
+                        dest='video_shards',
+                        )
+
+    parser.add_argument('--stream',
+                        help='流式输入模式：-i 为 -（标准输入）、命名管道、正在写入的文件或网络地址，-s 字幕文件在处理过程中增量读取',
+                        dest='stream',
+                        action='store_true')
+
+    parser.add_argument('--serve',
+                        help='以常驻服务方式运行，模型只加载一次，通过本地 HTTP 接口接收任务',
+                        dest='serve',
+                        action='store_true')
+
     return parser
 
 
-def get_face_info():
-    avatar_output_path = FaceCaptureUtils.private_config.avatar_output_path
-    sub_path = FaceCaptureUtils.private_config.sub_path
-    video_path = FaceCaptureUtils.private_config.video_path
-    subtitle_times = FaceCaptureUtils.parse_subtitles(str(sub_path))
+def get_face_info(mod_config_path):
+    from utils.face_util import FaceCaptureUtils
+    from utils.shard_runner import ShardRunner
+
+    if config.video_shards > 1 and config.face_tracking:
+        hlog.warning('人脸跟踪需要完整的视频时间线，分片处理已关闭')
+        config.video_shards = 1
 
-    face_data = []
+    if config.video_shards > 1:
+        video_frames_results = ShardRunner.run(video_path=private_config.video_path,
+                                               sub_path=private_config.sub_path,
+                                               avatar_output_path=private_config.avatar_output_path,
+                                               shard_count=config.video_shards,
+                                               mod_config_path=mod_config_path,
+                                               private_config=private_config,
+                                               public_config=config)
+    else:
+        video_frames_results = FaceCaptureUtils.capture_avatar_from_files(
+            video_path=private_config.video_path,
+            sub_path=private_config.sub_path,
+            avatar_output_path=private_config.avatar_output_path)
 
-    # video_frames_results = FaceCaptureUtils.capture_avatar_from_video(video_path=video_path,
-    #                                                                   subtitle_times=subtitle_times,
-    #                                                                   avatar_output_path=avatar_output_path,
-    #                                                                   frame_redundancy=FaceCaptureUtils.public_config.frame_redundancy,
-    #                                                                   target_size=(
-    #                                                                   FaceCaptureUtils.public_config.image_width,
-    #                                                                   FaceCaptureUtils.public_config.image_height),
-    #                                                                   eye_diff_threshold=FaceCaptureUtils.public_config.eye_diff_threshold)
+    hlog.info('处理完成，保存人脸数: %s' % len(video_frames_results))
+    if config.results_file:
+        hlog.info('人脸结果文件: %s' % (Path(private_config.avatar_output_path) / config.results_file))
 
-    video_frames_results = FaceCaptureUtils.capture_avatar_from_video(video_path=Path(video_path),
-                                                                      subtitle_times=subtitle_times,
-                                                                      avatar_output_path=Path(avatar_output_path),
-                                                                      frame_redundancy=50,
-                                                                      target_size=(
-                                                                      300,
-                                                                      300),
-                                                                      eye_diff_threshold=50)
 
+def plan_face_info(batch_input):
+    """试运行：输出选帧计划和预计处理量，不加载模型"""
+    from utils.run_planner import RunPlanner
 
-    hlog.info('video_frames_results->%s', video_frames_results)
+    if batch_input:
+        from utils.batch_runner import BatchRunner
+        jobs = BatchRunner.collect_jobs(batch_input)
+    else:
+        jobs = [(private_config.video_path, private_config.sub_path)]
+
+    RunPlanner.run(jobs=jobs, public_config=config)
 
 
 def main():
@@ -97,9 +131,47 @@ def main():
     private_config = PrivateConfig()
     HappyConfigParser.load(args.conf_file, private_config)
 
-    FaceCaptureUtils.init(private_config=private_config)
-
-    get_face_info()
+    # 命令行参数优先于配置文件
+    if args.input_video_file:
+        private_config.video_path = args.input_video_file
+    if args.input_sub_file:
+        private_config.sub_path = args.input_sub_file
+    if args.output_face_img_dir:
+        private_config.avatar_output_path = args.output_face_img_dir
+    if args.video_shards:
+        config.video_shards = args.video_shards
+    if args.verbose:
+        config.verbose = True
+
+    if config_builder.dry_run:
+        if args.serve or args.stream:
+            hlog.error('试运行不支持常驻服务和流式输入')
+            exit(1)
+
+        plan_face_info(batch_input=args.batch_input)
+        return
+
+    # 只有实际处理视频时才导入解码、图像处理和模型相关的依赖
+    from utils.face_util import FaceCaptureUtils
+    FaceCaptureUtils.init(private_config=private_config, public_config=config)
+
+    if args.serve:
+        from utils.face_service import FaceCaptureService
+        FaceCaptureService.serve(host=config.service_host, port=config.service_port)
+    elif args.stream:
+        FaceCaptureUtils.capture_avatar_from_stream(video_url=private_config.video_path,
+                                                    sub_path=private_config.sub_path,
+                                                    avatar_output_path=private_config.avatar_output_path)
+    elif args.batch_input:
+        from utils.batch_runner import BatchRunner
+        BatchRunner.run(batch_input=args.batch_input,
+                        avatar_output_path=private_config.avatar_output_path,
+                        workers=config.batch_workers,
+                        mod_config_path=config_builder.mod_config_path,
+                        private_config=private_config,
+                        public_config=config)
+    else:
+        get_face_info(mod_config_path=config_builder.mod_config_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,103 @@
+import json
+import tarfile
+
+import numpy as np
+
+from benchmark.stub_analyzer import StubFaceAnalyzer
+from benchmark.synthetic_media import SyntheticMedia
+from utils.crop_writer import CropWriter
+from utils.face_conf import PrivateConfig, PublicConfig
+from utils.face_util import FaceCaptureUtils
+
+TARGET_SIZE = (16, 16)
+
+
+def read_index(output_path):
+    with open(output_path / CropWriter.NPY_INDEX_FILE, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+def write_crops(writer, frames):
+    for frame in frames:
+        for face_index in (0, 1):
+            writer.write(name='frame_%s_face_%s' % (frame, face_index),
+                         image=np.full(TARGET_SIZE + (3,), frame, dtype=np.uint8))
+    writer.close()
+
+
+def open_writer(storage, output_path):
+    return CropWriter.open(storage=storage, output_path=output_path, image_format='png', quality=95,
+                           png_compression=3, target_size=TARGET_SIZE, shard_size=3)
+
+
+def test_resume_keeps_only_completed_frames(tmp_path):
+    for storage in ('tar', 'npy'):
+        output_path = tmp_path / storage
+        output_path.mkdir()
+        write_crops(open_writer(storage, output_path), frames=[10, 20, 30])
+
+        CropWriter.retain_frames(output_path, frames={10, 30})
+        # 恢复运行重新处理未完成的第 20 帧
+        write_crops(open_writer(storage, output_path), frames=[20])
+
+        if storage == 'tar':
+            names = []
+            for path in CropWriter.shard_paths(output_path):
+                with tarfile.open(path, 'r') as archive:
+                    names.extend(archive.getnames())
+        else:
+            rows = read_index(output_path)
+            names = [row['name'] for row in rows]
+            # 保留的行号不变，仍指向原来的人脸
+            for row in rows:
+                shard = np.load(output_path / row['shard'], mmap_mode='r')
+                assert shard[row['row']][0, 0, 0] == CropWriter.frame_of(row['name'])
+
+        assert sorted(CropWriter.frame_of(name) for name in names) == [10, 10, 20, 20, 30, 30]
+
+
+def test_fresh_run_removes_previous_shards(tmp_path):
+    for storage in ('tar', 'npy'):
+        output_path = tmp_path / storage
+        output_path.mkdir()
+        write_crops(open_writer(storage, output_path), frames=[10, 20, 30])
+
+        CropWriter.remove_shards(output_path)
+        write_crops(open_writer(storage, output_path), frames=[10])
+
+        assert len(CropWriter.shard_paths(output_path)) == 1
+
+
+def capture(video_path, sub_path, output_path):
+    public_config = PublicConfig()
+    public_config.results_file = ''
+    public_config.perf_report = ''
+    public_config.checkpoint = False
+    public_config.crop_storage = 'npy'
+    public_config.crop_shard_size = 16
+    FaceCaptureUtils.init(private_config=PrivateConfig(), public_config=public_config)
+    FaceCaptureUtils.face_analyzer = StubFaceAnalyzer(faces_per_frame=2, batch_size=public_config.analyze_batch_size)
+
+    try:
+        return FaceCaptureUtils.capture_avatar_from_files(video_path=video_path,
+                                                          sub_path=sub_path,
+                                                          avatar_output_path=output_path)
+    finally:
+        FaceCaptureUtils.face_analyzer = None
+
+
+def test_rerun_does_not_duplicate_index_rows(tmp_path):
+    video_path = tmp_path / 'video.mp4'
+    sub_path = tmp_path / 'video.srt'
+    output_path = tmp_path / 'output'
+    SyntheticMedia.write_video(path=video_path, seconds=6, width=640, height=360, fps=10, gop_size=5,
+                               faces_per_frame=2)
+    SyntheticMedia.write_subtitles(path=sub_path, seconds=6, cue_seconds=1.5, gap_seconds=0.5)
+
+    capture(video_path=video_path, sub_path=sub_path, output_path=output_path)
+    faces = capture(video_path=video_path, sub_path=sub_path, output_path=output_path)
+
+    assert faces
+    assert len(read_index(output_path)) == len(faces)
+    assert {row['shard'] for row in read_index(output_path)} == {path.name for path in
+                                                                 CropWriter.shard_paths(output_path)}
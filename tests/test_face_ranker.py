@@ -0,0 +1,78 @@
+import numpy as np
+
+from utils.face_ranker import FaceRanker
+from utils.subtitle_index import SubtitleIndex
+
+FPS = 10
+
+SUBTITLE_TIMES = [('00:00:01,000', '00:00:02,000'), ('00:00:04,000', '00:00:05,000')]
+
+
+def make_face(frame_count, face_index, sharpness, size=100):
+    """生成人脸，sharpness 越大裁剪图的纹理越强，清晰度得分越高"""
+    rng = np.random.default_rng(frame_count * 10 + face_index)
+    crop = np.full((size, size, 3), 128, dtype=np.uint8)
+    crop += (rng.integers(0, 2, size=crop.shape) * sharpness).astype(np.uint8)
+    region = {'x': 0, 'y': 0, 'w': size, 'h': size,
+              'left_eye': (size * 7 // 10, size * 2 // 5), 'right_eye': (size * 3 // 10, size * 2 // 5)}
+
+    return {'frame_count': frame_count, 'face_index': face_index, 'region': region, 'crop': crop}
+
+
+def create_ranker(top_k):
+    return FaceRanker(top_k=top_k, target_size=(100, 100), subtitle_index=SubtitleIndex(SUBTITLE_TIMES),
+                      frame_redundancy=0)
+
+
+def test_keeps_top_k_per_cue():
+    ranker = create_ranker(top_k=2)
+
+    faces = [make_face(10, 0, sharpness=2), make_face(10, 1, sharpness=60)]
+    assert ranker.add(frame_count=10, fps=FPS, faces=faces) == []
+    assert ranker.add(frame_count=15, fps=FPS, faces=[make_face(15, 0, sharpness=40)]) == []
+
+    # 第二条字幕的帧到达后释放第一条字幕，只保留分数最高的两个人脸
+    released = ranker.add(frame_count=40, fps=FPS, faces=[make_face(40, 0, sharpness=10)])
+    assert [(frame, [face['face_index'] for face in faces]) for frame, faces in released] == [(10, [1]), (15, [0])]
+    assert ranker.dropped_count == 1
+
+    # 输入结束时释放其余字幕
+    assert [(frame, len(faces)) for frame, faces in ranker.flush()] == [(40, 1)]
+    assert ranker.ranked_count == 4
+
+
+def test_frames_without_faces_are_released_with_their_cue():
+    ranker = create_ranker(top_k=1)
+    ranker.add(frame_count=10, fps=FPS, faces=[])
+    ranker.add(frame_count=12, fps=FPS, faces=[make_face(12, 0, sharpness=30)])
+
+    released = ranker.add(frame_count=40, fps=FPS, faces=[])
+    assert [(frame, len(faces)) for frame, faces in released] == [(10, 0), (12, 1)]
+
+
+def test_expire_releases_finished_cues_without_new_frames():
+    ranker = create_ranker(top_k=1)
+    ranker.add(frame_count=10, fps=FPS, faces=[make_face(10, 0, sharpness=30)])
+
+    assert ranker.expire(timestamp=1.5, fps=FPS) == []
+    assert [(frame, len(faces)) for frame, faces in ranker.expire(timestamp=3.0, fps=FPS)] == [(10, 1)]
+    assert ranker.flush() == []
+
+
+def test_overlapping_cues_rank_separately():
+    subtitle_index = SubtitleIndex([('00:00:00,000', '00:00:10,000'), ('00:00:02,000', '00:00:03,000')])
+    ranker = FaceRanker(top_k=1, target_size=(100, 100), subtitle_index=subtitle_index, frame_redundancy=0)
+
+    ranker.add(frame_count=25, fps=FPS, faces=[make_face(25, 0, sharpness=30)])
+    # 第 5 秒只属于较长的字幕，不会挤掉较短字幕中的人脸
+    released = ranker.add(frame_count=50, fps=FPS, faces=[make_face(50, 0, sharpness=60)])
+
+    assert [(frame, len(faces)) for frame, faces in released] == [(25, 1)]
+    assert ranker.dropped_count == 0
+
+
+def test_score_prefers_sharper_faces():
+    ranker = create_ranker(top_k=1)
+    faces = ranker.score([make_face(10, 0, sharpness=2), make_face(10, 1, sharpness=60)])
+
+    assert 0 <= faces[0]['quality'] < faces[1]['quality'] <= 1
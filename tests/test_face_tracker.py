@@ -0,0 +1,52 @@
+import numpy as np
+
+from utils.face_tracker import FaceTracker
+
+
+def make_face(x, confidence, embedding):
+    return {
+        'region': {'x': x, 'y': 10, 'w': 40, 'h': 40},
+        'face_confidence': confidence,
+        'face': np.zeros((8, 8, 3), dtype=np.float32),
+        'crop': np.zeros((40, 40, 3), dtype=np.uint8),
+        'embedding': np.asarray(embedding, dtype=np.float32),
+    }
+
+
+def create_tracker():
+    return FaceTracker(iou_threshold=0.3, similarity_threshold=0.9, reanalyze_similarity=0.5, max_frame_gap=5)
+
+
+def test_track_keeps_only_best_crop():
+    tracker = create_tracker()
+    faces = []
+    for frame_count, confidence in enumerate([0.5, 0.9, 0.7, 0.95, 0.6]):
+        face = make_face(x=10 + frame_count, confidence=confidence, embedding=[1.0, 0.0])
+        faces.append(face)
+        pending_faces = tracker.update(frame_count=frame_count, faces=[face])
+        tracker.release_analyzed(pending_faces)
+
+    # 只有第一个人脸做了属性分析，之后的人脸特征没有变化
+    assert tracker.analyze_count == 1
+    assert [face for face in faces if 'crop' in face] == [faces[3]]
+    assert not [face for face in faces if 'face' in face]
+
+    identities = tracker.finish()
+    assert len(identities) == 1
+    assert identities[0]['best_face'] is faces[3]
+    assert identities[0]['frames'] == [0, 1, 2, 3, 4]
+
+
+def test_changed_face_is_reanalyzed():
+    tracker = create_tracker()
+    first = make_face(x=10, confidence=0.9, embedding=[1.0, 0.0])
+    changed = make_face(x=11, confidence=0.5, embedding=[0.0, 1.0])
+
+    assert tracker.update(frame_count=0, faces=[first]) == [first]
+    # 位置相同但特征变化较大，同一轨迹中重新分析
+    assert tracker.update(frame_count=1, faces=[changed]) == [changed]
+    assert 'face' in changed
+    # 分析前不是最佳人脸的裁剪图已释放
+    assert 'crop' not in changed
+    assert 'crop' in first
+    assert tracker.track_count == 1
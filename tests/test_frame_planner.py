@@ -0,0 +1,103 @@
+from utils.frame_planner import FramePlanner
+
+
+def test_merge_intervals_sorts_and_merges_overlapping_and_adjacent():
+    assert FramePlanner.merge_intervals([(50, 60), (0, 10), (11, 20), (5, 8), (30, 40), (35, 45)]) == \
+        [(0, 20), (30, 45), (50, 60)]
+
+
+def test_merge_intervals_empty():
+    assert FramePlanner.merge_intervals([]) == []
+
+
+def test_build_intervals_adds_redundancy_and_clamps():
+    subtitle_times = [('00:00:00,500', '00:00:01,000'), ('00:00:01,200', '00:00:02,000'),
+                      ('00:00:09,000', '00:00:12,000')]
+
+    # 10 fps，前后各扩展 3 帧，第一条字幕不早于第 0 帧，最后一条不超过总帧数
+    assert FramePlanner.build_intervals(subtitle_times=subtitle_times, fps=10, frame_redundancy=3,
+                                        total_frames=100) == [(2, 23), (87, 99)]
+
+
+def test_build_cue_ranges_keeps_each_cue():
+    subtitle_times = [('00:00:03,000', '00:00:04,000'), ('00:00:01,000', '00:00:03,500')]
+
+    assert FramePlanner.build_cue_ranges(subtitle_times=subtitle_times, fps=10) == [(10, 35), (30, 40)]
+
+
+def test_split_intervals_covers_all_frames_without_overlap():
+    intervals = [(0, 9), (20, 24), (40, 54)]
+    shards = FramePlanner.split_intervals(intervals=intervals, shard_count=3)
+
+    assert len(shards) == 3
+    frames = [frame for shard in shards for start, end in shard for frame in range(start, end + 1)]
+    assert frames == [frame for start, end in intervals for frame in range(start, end + 1)]
+    assert [sum(end - start + 1 for start, end in shard) for shard in shards] == [10, 10, 10]
+
+
+def test_split_intervals_single_shard_or_empty():
+    assert FramePlanner.split_intervals(intervals=[(0, 9)], shard_count=1) == [[(0, 9)]]
+    assert FramePlanner.split_intervals(intervals=[], shard_count=4) == []
+    # 分片数多于帧数时丢弃空分片
+    assert FramePlanner.split_intervals(intervals=[(5, 6)], shard_count=4) == [[(5, 5)], [(6, 6)]]
+
+
+def test_split_intervals_whole_intervals_keeps_intervals_intact():
+    intervals = [(0, 9), (20, 24), (40, 54), (60, 61)]
+    shards = FramePlanner.split_intervals(intervals=intervals, shard_count=3, whole_intervals=True)
+
+    assert shards == [[(0, 9), (20, 24)], [(40, 54)], [(60, 61)]]
+    # 只有一个区间时不切分
+    assert FramePlanner.split_intervals(intervals=[(0, 99)], shard_count=4, whole_intervals=True) == [[(0, 99)]]
+
+
+def test_allocate_budget_within_budget_uses_frames_per_cue():
+    assert FramePlanner.allocate_budget(cue_count=4, frames_per_cue=3, frame_budget=0) == [3, 3, 3, 3]
+    assert FramePlanner.allocate_budget(cue_count=4, frames_per_cue=3, frame_budget=12) == [3, 3, 3, 3]
+
+
+def test_allocate_budget_spreads_remainder():
+    counts = FramePlanner.allocate_budget(cue_count=5, frames_per_cue=3, frame_budget=7)
+
+    assert sum(counts) == 7
+    assert max(counts) - min(counts) <= 1
+    assert counts == [2, 1, 2, 1, 1]
+
+
+def test_allocate_budget_fewer_frames_than_cues():
+    counts = FramePlanner.allocate_budget(cue_count=4, frames_per_cue=3, frame_budget=2)
+
+    assert counts == [1, 0, 1, 0]
+
+
+def test_allocate_budget_never_exceeds_budget():
+    for cue_count in range(1, 20):
+        for frame_budget in range(1, 40):
+            counts = FramePlanner.allocate_budget(cue_count=cue_count, frames_per_cue=3, frame_budget=frame_budget)
+
+            assert len(counts) == cue_count
+            assert sum(counts) == min(frame_budget, cue_count * 3)
+
+
+def test_sample_range_uniform_without_keyframes():
+    assert FramePlanner.sample_range(start=0, end=29, count=3) == [4, 14, 24]
+
+
+def test_sample_range_prefers_keyframes_in_segment():
+    assert FramePlanner.sample_range(start=0, end=29, count=3, keyframes=[0, 12, 25]) == [0, 12, 25]
+
+
+def test_sample_range_follows_weights():
+    # 后半段权重较高，采样集中在后半段
+    assert FramePlanner.sample_range(start=0, end=9, count=2, weights=[1] * 5 + [9] * 5) == [5, 8]
+
+
+def test_sample_range_empty():
+    assert FramePlanner.sample_range(start=0, end=29, count=0) == []
+    assert FramePlanner.sample_range(start=10, end=9, count=2) == []
+
+
+def test_motion_weights_use_average_for_keyframes_and_missing_frames():
+    packets = {0: (1000, True), 1: (10, False), 2: (30, False)}
+
+    assert FramePlanner.motion_weights(start=0, end=3, packets=packets) == [40.0, 30.0, 50.0, 40.0]
@@ -0,0 +1,51 @@
+import json
+import sqlite3
+
+from utils.result_sink import ResultSink
+
+
+def write_records(path, frames):
+    sink = ResultSink.open(path)
+    for frame in frames:
+        for face_index in (0, 1):
+            sink.write({'video': 'video.mp4', 'frame': frame, 'face_index': face_index})
+    sink.close()
+
+
+def read_keys(path):
+    if path.suffix == '.jsonl':
+        with open(path, 'r', encoding='utf-8') as file:
+            return sorted((record['frame'], record['face_index']) for record in map(json.loads, file))
+
+    db = sqlite3.connect(str(path))
+    try:
+        return sorted(db.execute('SELECT frame, face_index FROM faces').fetchall())
+    finally:
+        db.close()
+
+
+def test_resume_keeps_only_completed_frames(tmp_path):
+    for name in ('results.jsonl', 'results.sqlite'):
+        path = tmp_path / name
+        write_records(path, frames=[10, 20, 30])
+        if path.suffix == '.jsonl':
+            # 中断时没有写完整的最后一行
+            with open(path, 'a', encoding='utf-8') as file:
+                file.write('{"video": "video.mp4", "fra')
+
+        ResultSink.retain_frames(path, frames={10, 30})
+        # 恢复运行重新处理未完成的第 20 帧
+        write_records(path, frames=[20])
+
+        assert read_keys(path) == [(10, 0), (10, 1), (20, 0), (20, 1), (30, 0), (30, 1)]
+
+
+def test_fresh_run_removes_previous_results(tmp_path):
+    for name in ('results.jsonl', 'results.sqlite'):
+        path = tmp_path / name
+        write_records(path, frames=[10, 20])
+
+        ResultSink.remove(path)
+        write_records(path, frames=[10, 20])
+
+        assert read_keys(path) == [(10, 0), (10, 1), (20, 0), (20, 1)]
@@ -0,0 +1,141 @@
+from benchmark.stub_analyzer import StubFaceAnalyzer
+from benchmark.synthetic_media import SyntheticMedia
+from utils.face_conf import PrivateConfig, PublicConfig
+from utils.face_util import FaceCaptureUtils
+from utils.run_checkpoint import RunCheckpoint
+
+SUBTITLE_TIMES = [('00:00:01,000', '00:00:02,000'), ('00:00:03,000', '00:00:04,500')]
+
+SETTINGS = {'frame_redundancy': 50, 'crop_format': 'jpg'}
+
+
+def create_checkpoint(tmp_path, settings=None):
+    video_path = tmp_path / 'video.mp4'
+    if not video_path.exists():
+        video_path.write_bytes(bytes(range(256)) * 64)
+
+    return RunCheckpoint(avatar_output_path=tmp_path,
+                         video_path=video_path,
+                         subtitle_times=SUBTITLE_TIMES,
+                         settings=SETTINGS if settings is None else settings)
+
+
+def test_load_without_progress(tmp_path):
+    checkpoint = create_checkpoint(tmp_path)
+
+    assert not checkpoint.load()
+    assert checkpoint.plan is None
+    assert checkpoint.remaining_frames([1, 2, 3]) == [1, 2, 3]
+
+
+def test_resume_skips_completed_frames(tmp_path):
+    checkpoint = create_checkpoint(tmp_path)
+    checkpoint.save_plan([10, 20, 30])
+    checkpoint.begin_frame(frame_count=10, face_count=2)
+    checkpoint.face_done(frame_count=10, face_index=1, result=('b.jpg', 30))
+    checkpoint.face_done(frame_count=10, face_index=0, result=('a.jpg', 25))
+    checkpoint.begin_frame(frame_count=20, face_count=0)
+    # 第 30 帧只完成了部分人脸，恢复时重新处理
+    checkpoint.begin_frame(frame_count=30, face_count=2)
+    checkpoint.face_done(frame_count=30, face_index=0, result=('c.jpg', 40))
+    checkpoint.close()
+
+    resumed = create_checkpoint(tmp_path)
+    assert resumed.load()
+    assert resumed.plan == [10, 20, 30]
+    assert resumed.remaining_frames(resumed.plan) == [30]
+    # 同一帧的结果按人脸序号排列
+    assert resumed.completed_results() == [('a.jpg', 25), ('b.jpg', 30)]
+
+
+def test_resume_ignores_truncated_last_line(tmp_path):
+    checkpoint = create_checkpoint(tmp_path)
+    checkpoint.save_plan([10, 20])
+    checkpoint.begin_frame(frame_count=10, face_count=1)
+    checkpoint.face_done(frame_count=10, face_index=0, result=('a.jpg', 25))
+    checkpoint.close()
+
+    # 模拟写入第 20 帧的记录时中断
+    with open(checkpoint.results_path, 'a', encoding='utf-8') as file:
+        file.write('{"frame": 20, "results": [["b.j')
+
+    resumed = create_checkpoint(tmp_path)
+    assert resumed.load()
+    assert resumed.remaining_frames(resumed.plan) == [20]
+    assert resumed.completed_results() == [('a.jpg', 25)]
+
+
+def test_failed_frame_stays_pending(tmp_path):
+    checkpoint = create_checkpoint(tmp_path)
+    checkpoint.save_plan([10, 20, 30])
+    checkpoint.begin_frame(frame_count=10, face_count=0)
+    # 第 20 帧检测出错，不调用 begin_frame
+    checkpoint.begin_frame(frame_count=30, face_count=0)
+    checkpoint.close()
+
+    resumed = create_checkpoint(tmp_path)
+    assert resumed.load()
+    assert resumed.remaining_frames(resumed.plan) == [20]
+
+
+def test_settings_change_invalidates_progress(tmp_path):
+    checkpoint = create_checkpoint(tmp_path)
+    checkpoint.save_plan([10])
+    checkpoint.begin_frame(frame_count=10, face_count=0)
+    checkpoint.close()
+
+    changed = create_checkpoint(tmp_path, settings=dict(SETTINGS, crop_format='webp'))
+    assert changed.key != checkpoint.key
+    assert not changed.load()
+    assert changed.remaining_frames([10]) == [10]
+
+
+class FailingStubAnalyzer(StubFaceAnalyzer):
+    """每 fail_every 次检测出错一次的桩分析器"""
+
+    def __init__(self, fail_every, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_every = fail_every
+        self.detect_calls = 0
+
+    def detect(self, frame):
+        self.detect_calls += 1
+        if self.fail_every and self.detect_calls % self.fail_every == 0:
+            raise RuntimeError('模拟检测出错')
+
+        return super().detect(frame)
+
+
+def capture(video_path, sub_path, output_path, fail_every=0):
+    public_config = PublicConfig()
+    public_config.results_file = ''
+    public_config.perf_report = ''
+    FaceCaptureUtils.init(private_config=PrivateConfig(), public_config=public_config)
+    FaceCaptureUtils.face_analyzer = FailingStubAnalyzer(fail_every=fail_every,
+                                                         faces_per_frame=2,
+                                                         batch_size=public_config.analyze_batch_size)
+
+    try:
+        return FaceCaptureUtils.capture_avatar_from_files(video_path=video_path,
+                                                          sub_path=sub_path,
+                                                          avatar_output_path=output_path)
+    finally:
+        FaceCaptureUtils.face_analyzer = None
+
+
+def test_resume_retries_failed_frames(tmp_path):
+    video_path = tmp_path / 'video.mp4'
+    sub_path = tmp_path / 'video.srt'
+    SyntheticMedia.write_video(path=video_path, seconds=6, width=640, height=360, fps=10, gop_size=5,
+                               faces_per_frame=2)
+    SyntheticMedia.write_subtitles(path=sub_path, seconds=6, cue_seconds=1.5, gap_seconds=0.5)
+
+    clean_faces = capture(video_path=video_path, sub_path=sub_path, output_path=tmp_path / 'clean')
+    assert clean_faces
+
+    failed_faces = capture(video_path=video_path, sub_path=sub_path, output_path=tmp_path / 'resumed', fail_every=3)
+    assert len(failed_faces) < len(clean_faces)
+
+    # 检测出错的帧没有记录为已完成，恢复运行时重新处理
+    resumed_faces = capture(video_path=video_path, sub_path=sub_path, output_path=tmp_path / 'resumed')
+    assert len(resumed_faces) == len(clean_faces)
@@ -0,0 +1,29 @@
+import os
+import time
+
+from benchmark.synthetic_media import SyntheticMedia
+from utils.stream_source import StreamFrameSource
+
+
+def test_stream_source_reads_finished_mp4_without_waiting(tmp_path):
+    video_path = tmp_path / 'video.mp4'
+    sub_path = tmp_path / 'video.srt'
+    SyntheticMedia.write_video(path=video_path, seconds=10, width=160, height=120, fps=10, gop_size=5,
+                               faces_per_frame=1)
+    SyntheticMedia.write_subtitles(path=sub_path, seconds=10, cue_seconds=1.0, gap_seconds=2.0)
+
+    # 已经写完的文件，普通 MP4 的 moov 在文件末尾，需要按可定位的方式打开
+    modified = time.time() - 10
+    for path in (video_path, sub_path):
+        os.utime(path, (modified, modified))
+
+    source = StreamFrameSource(video_url=str(video_path), sub_path=sub_path, frame_redundancy=0, subtitle_delay=5.0,
+                               poll_interval=0.05, idle_timeout=1.0)
+
+    start_time = time.monotonic()
+    frames = [frame_count for frame_count, _ in source.iter_frames()]
+
+    # 字幕已经写完时没有字幕的关键帧直接丢弃，不按 subtitle_delay 等待
+    assert time.monotonic() - start_time < 5.0
+    assert frames
+    assert all(source.subtitle_index.covers(frame_count / source.fps) for frame_count in frames)
@@ -0,0 +1,80 @@
+import os
+import time
+
+from utils.stream_source import SubtitleTail
+from utils.subtitle_index import SubtitleIndex
+
+
+def test_find_returns_covering_cue():
+    index = SubtitleIndex([('00:00:01,000', '00:00:02,000'), ('00:00:04,000', '00:00:05,000')])
+
+    assert index.find(1.5) == (0, '00:00:01,000', '00:00:02,000')
+    assert index.find(4.0) == (1, '00:00:04,000', '00:00:05,000')
+
+
+def test_find_returns_nearest_cue_outside_cues():
+    index = SubtitleIndex([('00:00:01,000', '00:00:02,000'), ('00:00:04,000', '00:00:05,000')])
+
+    assert index.find(0.2)[0] == 0
+    assert index.find(2.5)[0] == 0
+    assert index.find(3.5)[0] == 1
+    assert index.find(9.0)[0] == 1
+
+
+def test_find_with_overlapping_cues():
+    index = SubtitleIndex([('00:00:00,000', '00:00:10,000'),
+                           ('00:00:02,000', '00:00:03,000'),
+                           ('00:00:20,000', '00:00:21,000')])
+
+    # 较长的字幕 A 覆盖较短的字幕 B 之后的时间点
+    assert index.find(5.0)[0] == 0
+    # 两条字幕都覆盖时取开始最晚的一条
+    assert index.find(2.5)[0] == 1
+    # 不在任何字幕内时，较早开始的长字幕比较短的字幕更近
+    assert index.find(12.0)[0] == 0
+    assert index.find(16.0)[0] == 2
+
+
+def test_find_empty():
+    assert SubtitleIndex().find(1.0) is None
+
+
+def test_index_follows_insertion_order():
+    index = SubtitleIndex()
+
+    assert index.add(start_time='00:00:05,000', end_time='00:00:06,000') == 0
+    assert index.add(start_time='00:00:01,000', end_time='00:00:02,000') == 1
+    assert index.find(1.5)[0] == 1
+    assert len(index) == 2
+
+
+def test_covers_with_margin_and_prune():
+    index = SubtitleIndex([('00:00:01,000', '00:00:02,000'), ('00:00:10,000', '00:00:11,000')])
+
+    assert index.covers(2.0)
+    assert not index.covers(2.5)
+    assert index.covers(2.5, margin=0.5)
+
+    index.prune(before_seconds=5.0)
+    assert len(index) == 1
+    assert index.find(1.5)[0] == 1
+
+
+def test_subtitle_tail_reads_complete_cues_and_detects_finished_file(tmp_path):
+    sub_path = tmp_path / 'live.srt'
+    tail = SubtitleTail(sub_path)
+    assert tail.poll() == []
+    assert not tail.finished(idle_timeout=1.0)
+
+    sub_path.write_text('1\n00:00:01,000 --> 00:00:02,000\n字幕\n\n2\n00:00:03,000 --> 00:00:0', encoding='utf-8')
+    assert tail.poll() == [('00:00:01,000', '00:00:02,000')]
+    assert not tail.finished(idle_timeout=1.0)
+
+    with open(sub_path, 'a', encoding='utf-8') as file:
+        file.write('4,000\n')
+    assert tail.poll() == [('00:00:03,000', '00:00:04,000')]
+
+    # 读到文件结尾且超过 idle_timeout 没有修改时认为字幕已写完
+    modified = time.time() - 10
+    os.utime(sub_path, (modified, modified))
+    assert tail.finished(idle_timeout=1.0)
@@ -0,0 +1,224 @@
+import json
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from utils.face_conf import PrivateConfig, PublicConfig
+from utils.face_pipeline import FacePipeline
+from utils.face_util import FaceCaptureUtils
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class BatchRunner:
+    """
+    多视频批处理
+
+    从目录或清单文件中读取视频和字幕对，分发到进程池中处理，每个工作进程只加载一次模型并复用到它处理的所有视频
+    """
+
+    VIDEO_SUFFIXES = ('.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm', '.ts', '.m4v')
+
+    SUMMARY_FILE = 'summary.json'
+
+    # 工作进程收到终止信号后置位，之后分配到该进程的视频不再处理
+    interrupted = False
+
+    @staticmethod
+    def collect_jobs(batch_input):
+        """
+        收集需要处理的视频和字幕对
+
+        参数:
+            batch_input: 目录或清单文件路径。目录中的视频与同名 .srt 字幕配对；
+                         清单文件每行为 "视频路径,字幕路径"（也可用制表符分隔），相对路径以清单文件所在目录为准，# 开头的行为注释
+
+        返回:
+            [(video_path, sub_path), ...]
+        """
+        batch_input = Path(batch_input)
+        jobs = []
+
+        if batch_input.is_dir():
+            for video_path in sorted(batch_input.iterdir()):
+                if video_path.suffix.lower() not in BatchRunner.VIDEO_SUFFIXES:
+                    continue
+
+                sub_path = video_path.with_suffix('.srt')
+                if not sub_path.exists():
+                    hlog.warning('视频（%s）没有对应的字幕文件，跳过' % video_path)
+                    continue
+
+                jobs.append((video_path, sub_path))
+        elif batch_input.is_file():
+            with open(batch_input, 'r', encoding='utf-8') as file:
+                for line_number, line in enumerate(file, start=1):
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+
+                    fields = [field.strip() for field in line.replace('\t', ',').split(',')]
+                    if len(fields) != 2:
+                        hlog.error('清单文件第 %s 行格式错误: %s' % (line_number, line))
+                        continue
+
+                    jobs.append(tuple(batch_input.parent / field for field in fields))
+        else:
+            raise FileNotFoundError('批处理输入（%s）不存在' % batch_input)
+
+        return jobs
+
+    @staticmethod
+    def build_output_dirs(jobs, avatar_output_path):
+        """为每个视频分配独立的输出子目录，同名视频追加序号区分"""
+        output_dirs = []
+        used_names = set()
+
+        for video_path, _ in jobs:
+            name = video_path.stem
+            suffix = 1
+            while name in used_names:
+                suffix += 1
+                name = '%s_%s' % (video_path.stem, suffix)
+
+            used_names.add(name)
+            output_dirs.append(Path(avatar_output_path) / name)
+
+        return output_dirs
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def interrupt_worker_handler(signum, frame):
+        """
+        工作进程的终止信号处理：只通知运行中的流水线停止，不退出进程
+
+        工作进程中抛出的 SystemExit 会被进程池捕获并继续处理下一个视频，由主进程负责取消未开始的任务
+        """
+        BatchRunner.interrupted = True
+        FacePipeline.stop_all()
+
+    @staticmethod
+    def init_worker(mod_config_path, private_config: PrivateConfig, public_config: PublicConfig):
+        """工作进程初始化：配置日志和终止信号处理，并预先加载模型"""
+        signal.signal(signal.SIGINT, BatchRunner.interrupt_worker_handler)
+        HappyLog.get_instance(mod_config_path)
+
+        FaceCaptureUtils.init(private_config=private_config, public_config=public_config)
+        FaceCaptureUtils.get_face_analyzer().warm_up()
+
+    @staticmethod
+    def process_job(video_path, sub_path, output_dir):
+        """在工作进程中处理一个视频，返回该视频的处理摘要"""
+        start_time = time.time()
+        summary = {
+            'video_path': str(video_path),
+            'sub_path': str(sub_path),
+            'output_dir': str(output_dir),
+            'faces': [],
+            'error': None,
+        }
+
+        try:
+            if not BatchRunner.interrupted:
+                summary['faces'] = FaceCaptureUtils.capture_avatar_from_files(video_path=video_path,
+                                                                              sub_path=sub_path,
+                                                                              avatar_output_path=output_dir)
+        except Exception as e:
+            hlog.error('处理视频（%s）时出现错误: %s' % (video_path, e))
+            summary['error'] = str(e)
+
+        # 中断时流水线提前结束，结果只包括已完成的部分
+        if BatchRunner.interrupted and summary['error'] is None:
+            summary['error'] = '已中断'
+
+        summary['face_count'] = len(summary['faces'])
+        summary['seconds'] = round(time.time() - start_time, 3)
+
+        return summary
+
+    @staticmethod
+    def run(batch_input, avatar_output_path, workers, mod_config_path, private_config, public_config):
+        """
+        使用进程池批量处理视频，并在输出目录中生成汇总文件
+
+        返回:
+            汇总信息字典
+        """
+        jobs = BatchRunner.collect_jobs(batch_input)
+        output_dirs = BatchRunner.build_output_dirs(jobs=jobs, avatar_output_path=avatar_output_path)
+        hlog.info('批处理视频数: %s，工作进程数: %s' % (len(jobs), workers))
+
+        start_time = time.time()
+        videos = []
+
+        # TensorFlow 不支持 fork 后继续使用，工作进程使用 spawn 方式启动
+        executor = ProcessPoolExecutor(max_workers=max(1, workers),
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=BatchRunner.init_worker,
+                                       initargs=(mod_config_path, private_config, public_config))
+        futures = []
+        collected = set()
+
+        try:
+            futures = [executor.submit(BatchRunner.process_job, video_path, sub_path, output_dir)
+                       for (video_path, sub_path), output_dir in zip(jobs, output_dirs)]
+
+            for future in as_completed(futures):
+                video_summary = future.result()
+                videos.append(video_summary)
+                collected.add(future)
+                hlog.info('视频（%s）处理完成，人脸数: %s，耗时: %s 秒' % (video_summary['video_path'],
+                                                                        video_summary['face_count'],
+                                                                        video_summary['seconds']))
+        except (KeyboardInterrupt, SystemExit):
+            # 取消未开始的视频，工作进程收到同一终止信号后停止当前视频，等待其返回已完成的部分后写入汇总
+            hlog.warning('批处理被中断，取消未开始的视频')
+            executor.shutdown(wait=True, cancel_futures=True)
+
+            for future in futures:
+                if future not in collected and future.done() and not future.cancelled() \
+                        and future.exception() is None:
+                    videos.append(future.result())
+
+            BatchRunner.write_summary(videos=videos,
+                                      avatar_output_path=avatar_output_path,
+                                      seconds=time.time() - start_time,
+                                      interrupted=True)
+            raise
+        finally:
+            executor.shutdown(wait=True)
+
+        return BatchRunner.write_summary(videos=videos,
+                                         avatar_output_path=avatar_output_path,
+                                         seconds=time.time() - start_time)
+
+    @staticmethod
+    def write_summary(videos, avatar_output_path, seconds, interrupted=False):
+        """在输出目录中生成汇总文件，interrupted 为 True 时汇总只包括中断前已完成的视频"""
+        videos.sort(key=lambda item: item['video_path'])
+        summary = {
+            'video_count': len(videos),
+            'failed_count': sum(1 for item in videos if item['error']),
+            'face_count': sum(item['face_count'] for item in videos),
+            'seconds': round(seconds, 3),
+            'interrupted': interrupted,
+            'videos': videos,
+        }
+
+        FaceCaptureUtils.ensure_directory_exists(avatar_output_path)
+        summary_path = Path(avatar_output_path) / BatchRunner.SUMMARY_FILE
+        with open(summary_path, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, ensure_ascii=False, indent=2)
+
+        hlog.info('批处理%s，视频数: %s，失败数: %s，人脸数: %s，耗时: %s 秒，汇总文件: %s' % ('中断' if interrupted else '完成',
+                                                                                 summary['video_count'],
+                                                                                 summary['failed_count'],
+                                                                                 summary['face_count'],
+                                                                                 summary['seconds'],
+                                                                                 summary_path))
+
+        return summary
@@ -3,10 +3,12 @@ from argparse import ArgumentParser
 from pathlib import Path
 from typing import Any
 
-from utils.face_util import interrupt_from_keyboard_handler, hlog
 from utils.face_conf import PublicConfig
+from utils.face_pipeline import interrupt_from_keyboard_handler
 from happy_python import HappyLog, HappyConfigParser
 
+hlog = HappyLog.get_instance()
+
 
 class ConfigBuilder:
     mod_conf: dict[Any, Any]
@@ -33,6 +35,11 @@ class ConfigBuilder:
 
         self._dry_run_convert = True if str(self._dry_run).lower() in ['true', '1', 't', 'y', 'yes', 'yeah'] else False
 
+    @property
+    def dry_run(self):
+        """命令行参数或配置文件是否指定了试运行"""
+        return self._dry_run_convert
+
     @staticmethod
     def build_help_parser(prog: str, description: str, version: str, config_file_path: str) -> ArgumentParser:
         parser = ArgumentParser(prog=prog + ' ' + version, description=description)
@@ -45,7 +52,7 @@ class ConfigBuilder:
 
         parser.add_argument('-n',
                             '--dry-run',
-                            help='在不做任何更改的情况下试运行，通常和"-v"参数一起使用',
+                            help='试运行：只解析字幕并计算选帧计划，输出预计的解码和分析帧数，不加载模型、不输出结果',
                             dest='dry_run',
                             action='store_true')
 
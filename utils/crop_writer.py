@@ -0,0 +1,355 @@
+import io
+import json
+import os
+import re
+import tarfile
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class CropWriter:
+    """
+    人脸图片输出
+
+    按配置的格式和质量编码人脸图片，保存为独立文件，或打包写入只追加的 tar 分卷，
+    或写入可内存映射的定长 .npy 数组分卷（附带索引文件），避免大量小文件；分卷和索引文件在已有文件之后继续写入，
+    新的运行开始前由调用方通过 remove_shards 删除旧分卷，从进度记录恢复时通过 retain_frames 只保留已完成帧的人脸
+    """
+
+    FORMATS = ('jpg', 'webp', 'png')
+    STORAGES = ('files', 'tar', 'npy')
+
+    SHARD_PREFIX = 'crops_'
+    NPY_INDEX_FILE = 'crops_index.jsonl'
+
+    # 按帧保存的人脸名称为 frame_<帧号>_face_<序号>
+    FRAME_NAME_PATTERN = re.compile(r'^frame_(\d+)_face_\d+')
+
+    @staticmethod
+    def open(storage, output_path, image_format, quality, png_compression, target_size, shard_size):
+        """
+        按存储方式创建人脸图片输出
+
+        参数:
+            storage: 存储方式，files（独立文件）、tar（tar 分卷）或 npy（.npy 数组分卷）
+            output_path: 输出目录
+            image_format: 图片格式，jpg、webp 或 png，npy 方式保存原始像素，不使用该参数
+            quality: JPEG/WebP 编码质量（0-100）
+            png_compression: PNG 压缩级别（0-9）
+            target_size: 人脸图片尺寸 (宽, 高)
+            shard_size: 每个分卷保存的人脸图片数
+        """
+        if storage not in CropWriter.STORAGES:
+            raise ValueError('无效的人脸图片存储方式：%s' % storage)
+
+        if image_format not in CropWriter.FORMATS:
+            raise ValueError('无效的人脸图片格式：%s' % image_format)
+
+        if storage == 'npy':
+            return NpyCropWriter(output_path=output_path, target_size=target_size, shard_size=shard_size)
+
+        if image_format == 'jpg':
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif image_format == 'webp':
+            params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+        else:
+            params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+
+        if storage == 'tar':
+            return TarCropWriter(output_path=output_path, image_format=image_format, params=params,
+                                 shard_size=shard_size)
+
+        return FileCropWriter(output_path=output_path, image_format=image_format, params=params)
+
+    @staticmethod
+    def frame_of(name):
+        """从人脸名称或分卷成员名中取出帧号，不是按帧保存的人脸时返回 None"""
+        match = CropWriter.FRAME_NAME_PATTERN.match(name)
+
+        return int(match.group(1)) if match else None
+
+    @staticmethod
+    def shard_paths(output_path):
+        """输出目录中已有的 tar 和 .npy 分卷"""
+        return sorted(path for suffix in ('.tar', '.npy')
+                      for path in Path(output_path).glob('%s*%s' % (CropWriter.SHARD_PREFIX, suffix)))
+
+    @staticmethod
+    def remove_shards(output_path):
+        """删除输出目录中已有的分卷和 .npy 索引文件；新的运行开始前调用，人脸图片不与之前的运行重复"""
+        for path in CropWriter.shard_paths(output_path) + [Path(output_path) / CropWriter.NPY_INDEX_FILE]:
+            if path.exists():
+                path.unlink()
+
+    @staticmethod
+    def retain_frames(output_path, frames):
+        """
+        只保留已有分卷中指定帧的人脸，从进度记录恢复时删除未完成帧的人脸，这些帧重新处理后再次写入
+
+        tar 分卷重写为只包含保留的成员；.npy 分卷的行号已记录在结果中，不能移动，只删除索引文件中的行，
+        不再被索引引用的分卷整体删除
+
+        参数:
+            output_path: 输出目录
+            frames: 需要保留的帧号集合
+        """
+        def retained(name):
+            frame = CropWriter.frame_of(name)
+            return frame is None or frame in frames
+
+        for path in CropWriter.shard_paths(output_path):
+            if path.suffix == '.tar':
+                CropWriter.retain_tar_members(path, retained)
+
+        index_path = Path(output_path) / CropWriter.NPY_INDEX_FILE
+        if not index_path.exists():
+            return
+
+        # 使用临时文件替换，中断时不会留下不完整的索引文件；中断时没有写完整的最后一行同时被丢弃
+        referenced_shards = set()
+        temp_path = index_path.with_name(index_path.name + '.tmp')
+        with open(index_path, 'r', encoding='utf-8') as source, open(temp_path, 'w', encoding='utf-8') as target:
+            for line in source:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+
+                if retained(row['name']):
+                    referenced_shards.add(row['shard'])
+                    target.write(line if line.endswith('\n') else line + '\n')
+        os.replace(temp_path, index_path)
+
+        for path in CropWriter.shard_paths(output_path):
+            if path.suffix == '.npy' and path.name not in referenced_shards:
+                path.unlink()
+
+    @staticmethod
+    def retain_tar_members(path, retained):
+        """重写 tar 分卷，只保留 retained(成员名) 为真的成员；中断时没有写完整的成员被丢弃，没有保留的成员时删除分卷"""
+        temp_path = path.with_name(path.name + '.tmp')
+        kept_count = 0
+        removed_count = 0
+
+        with tarfile.open(temp_path, 'w') as target:
+            try:
+                source = tarfile.open(path, 'r')
+            except tarfile.TarError:
+                # 创建分卷后还没有写入任何成员
+                source = None
+                removed_count += 1
+
+            while source is not None:
+                try:
+                    info = source.next()
+                    if info is None:
+                        break
+                    data = source.extractfile(info).read() if info.isfile() else b''
+                except tarfile.TarError:
+                    removed_count += 1
+                    break
+
+                if not retained(info.name):
+                    removed_count += 1
+                    continue
+
+                target.addfile(info, io.BytesIO(data))
+                kept_count += 1
+
+            if source is not None:
+                source.close()
+
+        if not removed_count:
+            temp_path.unlink()
+        elif kept_count:
+            os.replace(temp_path, path)
+        else:
+            temp_path.unlink()
+            path.unlink()
+
+    @staticmethod
+    def claim_shard_path(output_path, suffix):
+        """
+        以独占方式创建下一个未使用的分卷文件，多个进程写入同一目录时不会使用同一分卷
+
+        返回:
+            分卷文件路径
+        """
+        shard_index = len(list(Path(output_path).glob('%s*%s' % (CropWriter.SHARD_PREFIX, suffix))))
+
+        while True:
+            path = Path(output_path) / ('%s%05d%s' % (CropWriter.SHARD_PREFIX, shard_index, suffix))
+            try:
+                open(path, 'xb').close()
+                return path
+            except FileExistsError:
+                shard_index += 1
+
+
+class FileCropWriter:
+    """每个人脸保存为一个独立的图片文件"""
+
+    def __init__(self, output_path, image_format, params):
+        self.output_path = Path(output_path)
+        self.extension = image_format
+        self.params = params
+
+    def entry_name(self, name):
+        """人脸图片在输出中的名称"""
+        return '%s.%s' % (name, self.extension)
+
+    def write(self, name, image):
+        """保存人脸图片，返回图片路径"""
+        path = self.output_path / self.entry_name(name)
+        ok, encoded = cv2.imencode('.%s' % self.extension, image, self.params)
+        if not ok:
+            raise ValueError('人脸图片编码失败：%s' % path)
+
+        path.write_bytes(encoded.tobytes())
+
+        return str(path)
+
+    def close(self):
+        pass
+
+
+class TarCropWriter:
+    """人脸图片打包写入只追加的 tar 分卷，每个分卷写满 shard_size 个人脸后新建分卷"""
+
+    def __init__(self, output_path, image_format, params, shard_size):
+        self.output_path = Path(output_path)
+        self.extension = image_format
+        self.params = params
+        self.shard_size = shard_size
+        self.lock = threading.Lock()
+        self.shard_path = None
+        self.archive = None
+        self.shard_count = 0
+
+    def _open_shard(self):
+        self.shard_path = CropWriter.claim_shard_path(output_path=self.output_path, suffix='.tar')
+        self.archive = tarfile.open(self.shard_path, 'w')
+        self.shard_count = 0
+
+    def entry_name(self, name):
+        """人脸图片在分卷中的成员名"""
+        return '%s.%s' % (name, self.extension)
+
+    def write(self, name, image):
+        """写入人脸图片，返回 分卷路径/成员名"""
+        member_name = self.entry_name(name)
+        ok, encoded = cv2.imencode('.%s' % self.extension, image, self.params)
+        if not ok:
+            raise ValueError('人脸图片编码失败：%s' % member_name)
+
+        data = encoded.tobytes()
+        info = tarfile.TarInfo(name=member_name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+
+        with self.lock:
+            if self.archive is None or self.shard_count >= self.shard_size:
+                self.close_shard()
+                self._open_shard()
+
+            self.archive.addfile(info, io.BytesIO(data))
+            # 写入后立即刷新，运行中即可读取已完成的成员
+            self.archive.fileobj.flush()
+            self.shard_count += 1
+
+            return '%s/%s' % (self.shard_path, member_name)
+
+    def close_shard(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+    def close(self):
+        with self.lock:
+            self.close_shard()
+
+
+class NpyCropWriter:
+    """
+    人脸图片以 BGR 原始像素写入定长 .npy 数组分卷，训练任务可直接通过 np.load(mmap_mode='r') 读取
+
+    每个分卷为 (shard_size, 高, 宽, 3) 的 uint8 数组，索引文件中每行记录一个人脸的名称、分卷文件和行号
+    """
+
+    def __init__(self, output_path, target_size, shard_size):
+        self.output_path = Path(output_path)
+        self.extension = 'npy'
+        self.target_size = target_size
+        self.shard_size = shard_size
+        self.lock = threading.Lock()
+        self.shard_path = None
+        self.array = None
+        self.shard_count = 0
+        self.index_file = open(self.output_path / CropWriter.NPY_INDEX_FILE, 'a', encoding='utf-8')
+
+    def _open_shard(self):
+        width, height = self.target_size
+        self.shard_path = CropWriter.claim_shard_path(output_path=self.output_path, suffix='.npy')
+        self.array = np.lib.format.open_memmap(self.shard_path, mode='w+', dtype=np.uint8,
+                                               shape=(self.shard_size, height, width, 3))
+        self.shard_count = 0
+
+    def entry_name(self, name):
+        """人脸图片在索引文件中的名称"""
+        return name
+
+    def write(self, name, image):
+        """写入人脸图片，返回 分卷路径:行号"""
+        with self.lock:
+            if self.array is None or self.shard_count >= self.shard_size:
+                self.close_shard()
+                self._open_shard()
+
+            row = self.shard_count
+            self.array[row] = image
+            self.shard_count += 1
+
+            self.index_file.write(json.dumps({'name': name, 'shard': self.shard_path.name, 'row': row},
+                                             ensure_ascii=False) + '\n')
+            self.index_file.flush()
+
+            return '%s:%s' % (self.shard_path, row)
+
+    def close_shard(self):
+        """关闭当前分卷，未写满时截断为实际行数"""
+        if self.array is None:
+            return
+
+        self.array.flush()
+        shape = self.array.shape
+        offset = self.array.offset
+        row_bytes = self.array[0].nbytes
+        del self.array
+        self.array = None
+
+        if self.shard_count < shape[0]:
+            header = io.BytesIO()
+            np.lib.format.write_array_header_1_0(header, {'descr': '|u1',
+                                                          'fortran_order': False,
+                                                          'shape': (self.shard_count,) + shape[1:]})
+
+            # 新文件头长度相同时才能原地替换，否则保留定长分卷，实际行数以索引文件为准
+            if len(header.getvalue()) == offset:
+                with open(self.shard_path, 'r+b') as file:
+                    file.write(header.getvalue())
+                    file.truncate(offset + row_bytes * self.shard_count)
+            else:
+                hlog.warning('分卷（%s）未截断，实际行数: %s' % (self.shard_path, self.shard_count))
+
+    def close(self):
+        with self.lock:
+            self.close_shard()
+            self.index_file.close()
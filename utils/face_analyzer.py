@@ -0,0 +1,255 @@
+from importlib.metadata import version
+
+import cv2
+import numpy as np
+
+from deepface import DeepFace
+from deepface.models.demography import Gender, Race, Emotion
+from deepface.modules import preprocessing
+
+from utils.face_tracker import FaceTracker
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class FaceAnalyzer:
+    """
+    先检测后分析的人脸分析器
+
+    检测阶段只运行人脸检测模型，属性分析阶段只对通过过滤的人脸对齐图像按批次运行所需的属性模型
+    """
+
+    # 支持的属性分析项及对应的 DeepFace 模型名称
+    ATTRIBUTE_MODELS = {
+        'age': 'Age',
+        'gender': 'Gender',
+        'race': 'Race',
+        'emotion': 'Emotion',
+    }
+
+    # 属性模型的输入尺寸
+    ATTRIBUTE_INPUT_SIZE = (224, 224)
+
+    # 属性模型输入的预处理方式，变化后结果缓存中的属性分析结果不再复用
+    INPUT_PREPROCESSING = 'deepface_resize_pad'
+
+    # 候选区域检测时，区域四周各扩大的比例
+    ROI_PADDING = 0.5
+
+    # 候选区域较小时放大到的最小边长（像素）
+    ROI_MIN_SIZE = 320
+
+    def __init__(self, actions, batch_size, detector_backend='retinaface', embedding_model=None, cascade=None,
+                 cascade_roi=False):
+        """
+        参数:
+            actions: 需要分析的属性列表，可选 age、gender、race、emotion，为空时只检测和裁剪人脸
+            batch_size: 属性模型每批次处理的人脸数量
+            detector_backend: DeepFace 人脸检测模型
+            embedding_model: 用于人脸跟踪的 DeepFace 人脸特征模型，为空时不提取人脸特征
+            cascade: 检测前的快速筛选器 FaceCascade，为 None 时每帧都直接检测
+            cascade_roi: 为 True 时只在筛选出的候选区域（放大后）上运行人脸检测模型
+        """
+        for action in actions:
+            if action not in FaceAnalyzer.ATTRIBUTE_MODELS:
+                raise ValueError('无效的属性分析项：%s' % action)
+
+        self.actions = list(actions)
+        self.batch_size = max(1, batch_size)
+        self.detector_backend = detector_backend
+        self.cascade = cascade
+        self.cascade_roi = cascade_roi
+        self.models = {action: DeepFace.build_model(model_name=FaceAnalyzer.ATTRIBUTE_MODELS[action],
+                                                    task='facial_attribute')
+                       for action in self.actions}
+        self.embedding_model = DeepFace.build_model(model_name=embedding_model,
+                                                    task='facial_recognition') if embedding_model else None
+
+    def warm_up(self):
+        """预先加载人脸检测模型，属性模型已在创建时加载"""
+        DeepFace.build_model(model_name=self.detector_backend, task='face_detector')
+
+    @property
+    def model_identity(self):
+        """检测与分析模型及预处理方式的标识，用于结果缓存的键"""
+        cascade = 'none' if self.cascade is None else '%s:%s:%s' % (self.cascade.detector,
+                                                                    self.cascade.max_width,
+                                                                    self.cascade_roi)
+
+        return 'deepface=%s;detector=%s;cascade=%s;input=%s' % (version('deepface'), self.detector_backend, cascade,
+                                                                FaceAnalyzer.INPUT_PREPROCESSING)
+
+    def attributes_of(self, face):
+        """获取人脸中已有的属性分析结果，缺少任一所需属性时返回 None"""
+        attributes = {}
+        for action in self.actions:
+            if action not in face:
+                return None
+
+            attributes[action] = face[action]
+            if 'dominant_%s' % action in face:
+                attributes['dominant_%s' % action] = face['dominant_%s' % action]
+
+        return attributes
+
+    @staticmethod
+    def parse_actions(actions):
+        """将配置中逗号分隔的属性分析项转换为列表"""
+        return [action.strip().lower() for action in actions.split(',') if action.strip()]
+
+    def detect(self, frame):
+        """
+        检测图像中的人脸，配置了快速筛选器时先筛选，没有候选人脸的帧不再运行人脸检测模型
+
+        返回:
+            人脸列表，每项包含 region（原图坐标的位置及左右眼坐标）、face_confidence（检测置信度）
+            和 face（对齐后的 RGB 人脸图像）
+        """
+        if self.cascade is None:
+            return self.detect_in_image(frame)
+
+        candidates = self.cascade.find_candidates(frame)
+        if not candidates:
+            return []
+
+        if not self.cascade_roi:
+            return self.detect_in_image(frame)
+
+        faces = []
+        for candidate in candidates:
+            for face in self.detect_in_roi(frame=frame, candidate=candidate):
+                # 相邻候选区域可能检测到同一张人脸，保留置信度较高的一个
+                duplicates = [other for other in faces
+                              if FaceTracker.region_iou(other['region'], face['region']) > 0.5]
+                if all(face['face_confidence'] > other['face_confidence'] for other in duplicates):
+                    faces = [other for other in faces if other not in duplicates]
+                    faces.append(face)
+
+        return faces
+
+    def detect_in_image(self, image):
+        faces = DeepFace.extract_faces(img_path=image,
+                                       detector_backend=self.detector_backend,
+                                       enforce_detection=False,
+                                       align=True)
+
+        return [{'region': face['facial_area'],
+                 'face_confidence': face['confidence'],
+                 'face': face['face']} for face in faces]
+
+    def detect_in_roi(self, frame, candidate):
+        """在候选区域周围裁剪并放大后检测人脸，并把人脸位置映射回原图坐标"""
+        x, y, w, h = candidate
+        padding = int(max(w, h) * FaceAnalyzer.ROI_PADDING)
+        x1 = max(0, x - padding)
+        y1 = max(0, y - padding)
+        x2 = min(frame.shape[1], x + w + padding)
+        y2 = min(frame.shape[0], y + h + padding)
+
+        roi = frame[y1:y2, x1:x2]
+        if roi.size == 0:
+            return []
+
+        scale = max(1.0, FaceAnalyzer.ROI_MIN_SIZE / min(roi.shape[:2]))
+        if scale > 1.0:
+            roi = cv2.resize(roi, (int(roi.shape[1] * scale), int(roi.shape[0] * scale)),
+                             interpolation=cv2.INTER_CUBIC)
+
+        faces = self.detect_in_image(roi)
+        for face in faces:
+            region = face['region']
+            mapped_region = {
+                'x': x1 + int(region['x'] / scale),
+                'y': y1 + int(region['y'] / scale),
+                'w': int(region['w'] / scale),
+                'h': int(region['h'] / scale),
+            }
+
+            for eye in ('left_eye', 'right_eye'):
+                if region.get(eye) is not None:
+                    mapped_region[eye] = (x1 + int(region[eye][0] / scale), y1 + int(region[eye][1] / scale))
+                else:
+                    mapped_region[eye] = None
+
+            face['region'] = mapped_region
+
+        return faces
+
+    def analyze(self, faces):
+        """
+        按批次对人脸运行属性模型，并将结果按 DeepFace.analyze 的格式写回每个人脸
+
+        参数:
+            faces: detect 返回的人脸列表
+        """
+        for batch_start in range(0, len(faces), self.batch_size):
+            batch = faces[batch_start:batch_start + self.batch_size]
+            images = [FaceAnalyzer.prepare_model_input(face=face['face'], target_size=FaceAnalyzer.ATTRIBUTE_INPUT_SIZE)
+                      for face in batch]
+
+            for action in self.actions:
+                predictions = self.models[action].predict(images)
+
+                if action == 'age':
+                    ages = np.reshape(predictions, (len(batch),))
+                    for face, age in zip(batch, ages):
+                        face['age'] = int(age)
+                elif action == 'gender':
+                    FaceAnalyzer.assign_predictions(faces=batch,
+                                                    action=action,
+                                                    labels=Gender.labels,
+                                                    predictions=predictions,
+                                                    normalize=False)
+                elif action == 'race':
+                    FaceAnalyzer.assign_predictions(faces=batch,
+                                                    action=action,
+                                                    labels=Race.labels,
+                                                    predictions=predictions,
+                                                    normalize=True)
+                elif action == 'emotion':
+                    FaceAnalyzer.assign_predictions(faces=batch,
+                                                    action=action,
+                                                    labels=Emotion.labels,
+                                                    predictions=predictions,
+                                                    normalize=True)
+
+        return faces
+
+    def embed(self, faces):
+        """按批次提取人脸特征向量，归一化后写回每个人脸的 embedding，未配置特征模型时不做处理"""
+        if self.embedding_model is None:
+            return faces
+
+        height, width = self.embedding_model.input_shape
+        for batch_start in range(0, len(faces), self.batch_size):
+            batch = faces[batch_start:batch_start + self.batch_size]
+            images = np.stack([FaceAnalyzer.prepare_model_input(face=face['face'], target_size=(width, height))
+                               for face in batch])
+            embeddings = np.reshape(np.asarray(self.embedding_model.forward(images), dtype=np.float32),
+                                    (len(batch), -1))
+
+            for face, embedding in zip(batch, embeddings):
+                face['embedding'] = embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+        return faces
+
+    @staticmethod
+    def prepare_model_input(face, target_size):
+        """
+        将对齐后的 RGB 人脸转换为模型所需尺寸的 BGR 输入
+
+        使用 DeepFace.analyze 相同的预处理，按比例缩放后填充到目标尺寸，不拉伸人脸
+        """
+        return preprocessing.resize_image(img=face[:, :, ::-1], target_size=target_size)[0]
+
+    @staticmethod
+    def assign_predictions(faces, action, labels, predictions, normalize):
+        """将一个批次的分类预测结果转换为百分比，并写回每个人脸"""
+        predictions = np.reshape(predictions, (len(faces), len(labels)))
+
+        for face, prediction in zip(faces, predictions):
+            total = prediction.sum() if normalize else 1
+            face[action] = {label: float(100 * prediction[i] / total) for i, label in enumerate(labels)}
+            face['dominant_%s' % action] = labels[int(np.argmax(prediction))]
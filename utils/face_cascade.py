@@ -0,0 +1,80 @@
+import cv2
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class FaceCascade:
+    """
+    人脸检测前置快速筛选
+
+    在缩小后的图像上运行 OpenCV 自带的轻量人脸检测器（Haar 级联或 YuNet），判断帧中是否可能有人脸，
+    并给出映射回原图坐标的候选区域，只有存在候选人脸的帧才交给 retinaface 检测
+    """
+
+    DETECTORS = ('haar', 'yunet')
+
+    HAAR_MODEL = 'haarcascade_frontalface_default.xml'
+
+    def __init__(self, detector, max_width, yunet_model_path=''):
+        """
+        参数:
+            detector: 筛选检测器，haar 或 yunet
+            max_width: 筛选前将图像缩小到不超过该宽度
+            yunet_model_path: YuNet ONNX 模型文件路径，detector 为 yunet 时必填
+        """
+        if detector not in FaceCascade.DETECTORS:
+            raise ValueError('无效的筛选检测器：%s' % detector)
+
+        self.detector = detector
+        self.max_width = max_width
+        self.checked_count = 0
+        self.rejected_count = 0
+
+        if detector == 'haar':
+            if not hasattr(cv2, 'CascadeClassifier'):
+                raise ValueError('当前 OpenCV 版本不包含 Haar 级联检测器，请改用 yunet')
+
+            self.model = cv2.CascadeClassifier(cv2.data.haarcascades + FaceCascade.HAAR_MODEL)
+        else:
+            if not yunet_model_path:
+                raise ValueError('使用 YuNet 筛选时必须配置 yunet_model_path')
+
+            self.model = cv2.FaceDetectorYN.create(yunet_model_path, '', (320, 320))
+
+    def find_candidates(self, frame):
+        """
+        在缩小后的图像上查找候选人脸
+
+        返回:
+            原图坐标下的候选区域列表 [(x, y, w, h), ...]
+        """
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.max_width / width)
+        small = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+
+        if self.detector == 'haar':
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            boxes = self.model.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=3, minSize=(12, 12))
+        else:
+            self.model.setInputSize((small.shape[1], small.shape[0]))
+            _, faces = self.model.detect(small)
+            boxes = [] if faces is None else [face[:4] for face in faces]
+
+        candidates = [tuple(int(value / scale) for value in box) for box in boxes]
+
+        self.checked_count += 1
+        if not candidates:
+            self.rejected_count += 1
+
+        return candidates
+
+    def log_summary(self):
+        """输出并清空筛选统计"""
+        hlog.info('人脸快速筛选完成，检查帧数: %s，无人脸帧数: %s，retinaface 调用: %s 次' % (
+            self.checked_count, self.rejected_count, self.checked_count - self.rejected_count))
+
+        self.checked_count = 0
+        self.rejected_count = 0
@@ -13,6 +13,48 @@ class PublicConfig(HappyConfigBase):
         self.image_width = 300
         self.image_height = 300
         self.eye_diff_threshold = 50
+        self.face_top_k = 0
+        self.analyze_actions = 'age,gender,race,emotion'
+        self.analyze_batch_size = 16
+        self.frame_queue_size = 8
+        self.frame_buffer_pool = 0
+        self.write_queue_size = 64
+        self.writer_workers = 4
+        self.batch_workers = 2
+        self.video_shards = 1
+        self.service_host = '127.0.0.1'
+        self.service_port = 8765
+        self.face_tracking = False
+        self.track_embedding_model = 'Facenet'
+        self.track_iou_threshold = 0.3
+        self.track_similarity_threshold = 0.6
+        self.track_reanalyze_similarity = 0.5
+        self.track_max_gap = 250
+        self.frame_dedup = False
+        self.dedup_hash_distance = 4
+        self.detector_backend = 'retinaface'
+        self.cascade_detector = 'none'
+        self.cascade_max_width = 640
+        self.cascade_roi = False
+        self.yunet_model_path = ''
+        self.checkpoint = True
+        self.frame_sampling = 'keyframes'
+        self.frames_per_cue = 3
+        self.max_frames_per_video = 0
+        self.result_cache_dir = ''
+        self.result_cache_max_mb = 1024
+        self.results_file = 'results.jsonl'
+        self.crop_format = 'jpg'
+        self.crop_quality = 95
+        self.crop_png_compression = 3
+        self.crop_storage = 'files'
+        self.crop_shard_size = 10000
+        self.verbose = False
+        self.perf_report = 'perf_report.json'
+        self.prometheus_textfile = ''
+        self.stream_subtitle_delay = 5.0
+        self.stream_poll_interval = 0.5
+        self.stream_idle_timeout = 30.0
 
 
 class PrivateConfig(HappyConfigBase):
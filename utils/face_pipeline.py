@@ -0,0 +1,223 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+# noinspection PyUnusedLocal
+def interrupt_from_keyboard_handler(signum, frame):
+    hlog.warning('检测到用户发送终止信号，退出程序中......')
+    # 通知运行中的流水线停止，各阶段线程在退出过程中结束
+    FacePipeline.stop_all()
+    exit(1)
+
+
+class FacePipeline:
+    """
+    解码、推理、写图分阶段并行的人脸捕捉流水线
+
+    解码线程将帧放入有界队列，推理线程检测人脸并按批次分析属性，写图线程池负责调整大小和保存图片，
+    各阶段之间的队列长度固定，峰值内存不随视频长度增长
+    """
+
+    # 阻塞等待队列时检查终止信号的间隔（秒）
+    POLL_INTERVAL = 0.2
+
+    _running = set()
+    _running_lock = threading.Lock()
+
+    def __init__(self, frame_source, detect, analyze, write, batch_size, frame_queue_size, write_queue_size,
+                 writer_workers, on_result=None, finish=None, keep_results=True, drain=None, idle=None):
+        """
+        参数:
+            frame_source: 产出 (帧号, 图像) 的可迭代对象，在解码线程中遍历
+            detect: 检测函数 detect(帧号, 图像)，返回等待属性分析的人脸列表
+            analyze: 属性分析函数 analyze(人脸列表)，对一个批次的人脸运行属性模型，返回需要写图的人脸列表
+            write: 写图函数 write(人脸)，返回该人脸的分析结果
+            batch_size: 属性分析批次大小
+            frame_queue_size: 解码线程与推理线程之间的队列长度
+            write_queue_size: 等待写图的最大人脸数量
+            writer_workers: 写图线程数
+            on_result: 每个人脸写图完成后在写图线程中调用的回调函数 on_result(结果)，用于实时获取结果
+            finish: 所有帧处理完成后在推理线程中调用的函数 finish()，返回需要额外写图的人脸列表
+            keep_results: 是否保留写图结果并由 run 返回，处理不限长度的流时关闭，结果只通过 on_result 获取
+            drain: 所有帧处理完成后在推理线程中调用的函数 drain()，返回 detect 暂存、仍需属性分析的人脸列表
+            idle: 暂时没有新的帧时在推理线程中调用的函数 idle()，返回 detect 暂存、已经可以释放的人脸列表
+        """
+        self.frame_source = frame_source
+        self.detect = detect
+        self.analyze = analyze
+        self.write = write
+        self.on_result = on_result
+        self.finish = finish
+        self.drain = drain
+        self.idle = idle
+        self.keep_results = keep_results
+        self.batch_size = max(1, batch_size)
+        self.writer_workers = max(1, writer_workers)
+
+        self.frame_queue = queue.Queue(maxsize=max(1, frame_queue_size))
+        self.write_slots = threading.BoundedSemaphore(max(1, write_queue_size))
+        self.write_futures = []
+        self.stop_event = threading.Event()
+        self.errors = []
+
+    @staticmethod
+    def stop_all():
+        """通知所有运行中的流水线停止，由终止信号处理函数调用"""
+        with FacePipeline._running_lock:
+            for pipeline in FacePipeline._running:
+                pipeline.stop_event.set()
+
+    def _put(self, item):
+        """放入帧队列，队列已满时等待，收到终止信号时返回 False"""
+        while not self.stop_event.is_set():
+            try:
+                self.frame_queue.put(item, timeout=FacePipeline.POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def _fail(self, stage, e):
+        hlog.error('%s阶段出现错误: %s' % (stage, e))
+        self.errors.append(e)
+        self.stop_event.set()
+
+    def _decode_worker(self):
+        try:
+            for item in self.frame_source:
+                if not self._put(item):
+                    break
+        except Exception as e:
+            self._fail('解码', e)
+        finally:
+            # 提前退出时关闭帧生成器，释放其打开的视频
+            if hasattr(self.frame_source, 'close'):
+                self.frame_source.close()
+
+            self._put(None)
+
+    def _analyze_batch(self, executor, faces):
+        self._submit_writes(executor, self.analyze(faces))
+
+    def _submit_writes(self, executor, faces):
+        for face in faces:
+            # 写图队列已满时等待，避免已分析的人脸在内存中堆积
+            while not self.write_slots.acquire(timeout=FacePipeline.POLL_INTERVAL):
+                if self.stop_event.is_set():
+                    return
+
+            future = executor.submit(self.write, face)
+            future.add_done_callback(self._write_done)
+            if self.keep_results:
+                self.write_futures.append(future)
+
+    def _write_done(self, future):
+        self.write_slots.release()
+
+        if not self.keep_results and not future.cancelled() and future.exception() is not None:
+            hlog.error('保存人脸图片时出现错误: %s' % future.exception())
+
+        if self.on_result is not None and not future.cancelled() and future.exception() is None:
+            try:
+                self.on_result(future.result())
+            except Exception as e:
+                hlog.error('处理人脸结果回调时出现错误: %s' % e)
+
+    def _inference_worker(self, executor):
+        pending_faces = []
+
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    item = self.frame_queue.get(timeout=FacePipeline.POLL_INTERVAL)
+                except queue.Empty:
+                    # 暂时没有新的帧时先分析已有的人脸，不等待凑满批次，避免结果延迟
+                    if self.idle is not None:
+                        pending_faces.extend(self.idle())
+
+                    if pending_faces:
+                        self._analyze_batch(executor, pending_faces)
+                        pending_faces = []
+                    continue
+
+                if item is None:
+                    break
+
+                frame_count, frame = item
+                pending_faces.extend(self.detect(frame_count, frame))
+
+                # 凑满一个批次后再运行属性模型
+                if len(pending_faces) >= self.batch_size:
+                    self._analyze_batch(executor, pending_faces)
+                    pending_faces = []
+
+            if self.stop_event.is_set():
+                return
+
+            if self.drain is not None:
+                pending_faces.extend(self.drain())
+
+            if pending_faces:
+                self._analyze_batch(executor, pending_faces)
+
+            if self.finish is not None:
+                self._submit_writes(executor, self.finish())
+        except Exception as e:
+            self._fail('推理', e)
+
+    def run(self):
+        """
+        运行流水线直到所有帧处理完成或收到终止信号
+
+        返回:
+            按帧号顺序排列的写图结果列表
+        """
+        with FacePipeline._running_lock:
+            FacePipeline._running.add(self)
+
+        executor = ThreadPoolExecutor(max_workers=self.writer_workers, thread_name_prefix='face-writer')
+        decode_thread = threading.Thread(target=self._decode_worker, name='face-decoder', daemon=True)
+        inference_thread = threading.Thread(target=self._inference_worker,
+                                            args=(executor,),
+                                            name='face-inference',
+                                            daemon=True)
+
+        try:
+            decode_thread.start()
+            inference_thread.start()
+            inference_thread.join()
+        finally:
+            # 正常结束或被中断时都通知各阶段退出，推理线程处理完当前帧后退出，已提交的图片继续写完
+            self.stop_event.set()
+            while decode_thread.is_alive():
+                try:
+                    self.frame_queue.get_nowait()
+                except queue.Empty:
+                    decode_thread.join(timeout=FacePipeline.POLL_INTERVAL)
+
+            if inference_thread.is_alive():
+                inference_thread.join()
+
+            executor.shutdown(wait=True)
+
+            with FacePipeline._running_lock:
+                FacePipeline._running.discard(self)
+
+        if self.errors:
+            raise self.errors[0]
+
+        results = []
+        for future in self.write_futures:
+            if future.exception() is not None:
+                hlog.error('保存人脸图片时出现错误: %s' % future.exception())
+                continue
+
+            results.append(future.result())
+
+        return results
@@ -0,0 +1,162 @@
+import heapq
+import itertools
+
+import numpy as np
+
+from utils.frame_planner import FramePlanner
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class FaceRanker:
+    """
+    按字幕保留质量最高的人脸
+
+    用清晰度（拉普拉斯方差）、人脸面积和双眼位置估计的正脸程度为每个人脸打分，
+    每条字幕只在有界的最小堆中保留分数最高的 top_k 个人脸；帧按时间顺序到达，
+    字幕结束（加上冗余帧）之后才释放该字幕保留的人脸，属性分析、调整大小和写图只对保留的人脸执行
+    """
+
+    # 拉普拉斯方差达到该值时清晰度得分为 0.5
+    SHARPNESS_SCALE = 100.0
+
+    # 正脸的双眼横向距离约为人脸宽度的 0.4
+    FRONTAL_EYE_RATIO = 0.4
+
+    def __init__(self, top_k, target_size, subtitle_index, frame_redundancy):
+        """
+        参数:
+            top_k: 每条字幕保留的人脸数
+            target_size: 输出图片尺寸 (宽, 高)，人脸小于该尺寸时面积得分按比例降低
+            subtitle_index: 字幕索引 SubtitleIndex，人脸归属于距离所在帧最近的字幕
+            frame_redundancy: 字幕时间前后额外检查的帧数，字幕结束后这些帧仍可能属于该字幕
+        """
+        self.top_k = top_k
+        self.target_area = float(target_size[0] * target_size[1])
+        self.subtitle_index = subtitle_index
+        self.frame_redundancy = frame_redundancy
+
+        # 字幕序号 -> [结束时间（秒）, 已到达的帧号列表, 人脸最小堆]
+        self.cues = {}
+        self.sequence = itertools.count()
+        self.ranked_count = 0
+        self.dropped_count = 0
+
+    @staticmethod
+    def sharpness(image):
+        """计算 BGR 图像灰度的拉普拉斯方差"""
+        gray = image.astype(np.float32) @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+        if gray.shape[0] < 3 or gray.shape[1] < 3:
+            return 0.0
+
+        laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                     - 4 * gray[1:-1, 1:-1])
+
+        return float(laplacian.var())
+
+    def score(self, faces):
+        """
+        计算一帧中各人脸的质量分数（0-1），写入人脸的 quality 字段
+
+        清晰度、面积和正脸程度各占三分之一，面积和正脸程度按整帧的人脸一起计算
+        """
+        if not faces:
+            return faces
+
+        regions = [face['region'] for face in faces]
+        widths = np.array([region['w'] for region in regions], dtype=np.float32)
+        heights = np.array([region['h'] for region in regions], dtype=np.float32)
+        eyes = np.array([list(region.get('left_eye') or (0, 0)) + list(region.get('right_eye') or (0, 0))
+                         for region in regions], dtype=np.float32)
+
+        sharpness = np.array([FaceRanker.sharpness(face['crop']) for face in faces], dtype=np.float32)
+        sharpness_score = sharpness / (sharpness + FaceRanker.SHARPNESS_SCALE)
+
+        area_score = np.minimum(1.0, widths * heights / self.target_area)
+
+        # 双眼横向距离越接近正脸比例、上下偏差越小，正脸程度越高
+        eye_dx = np.abs(eyes[:, 0] - eyes[:, 2])
+        eye_dy = np.abs(eyes[:, 1] - eyes[:, 3])
+        frontal_score = np.clip(eye_dx / np.maximum(widths * FaceRanker.FRONTAL_EYE_RATIO, 1.0), 0.0, 1.0) \
+            * np.clip(1.0 - eye_dy / np.maximum(eye_dx, 1.0), 0.0, 1.0)
+
+        quality = (sharpness_score + area_score + frontal_score) / 3
+        for face, value in zip(faces, quality.tolist()):
+            face['quality'] = round(value, 4)
+
+        return faces
+
+    def add(self, frame_count, fps, faces):
+        """
+        加入一帧的人脸，并释放已经结束的字幕
+
+        参数:
+            frame_count: 帧号
+            fps: 视频帧率
+            faces: 该帧通过过滤的人脸列表
+
+        返回:
+            已结束字幕的 (帧号, 保留的人脸列表) 列表，按帧号排序，包括没有保留人脸的帧
+        """
+        timestamp = frame_count / fps
+        subtitle = self.subtitle_index.find(timestamp)
+        cue_index = None if subtitle is None else subtitle[0]
+
+        cue = self.cues.get(cue_index)
+        if cue is None:
+            end = timestamp if subtitle is None else FramePlanner.time_to_seconds(subtitle[2])
+            cue = self.cues[cue_index] = [end, [], []]
+
+        cue[1].append(frame_count)
+        for face in self.score(faces):
+            self.ranked_count += 1
+            entry = (face['quality'], next(self.sequence), face)
+            if len(cue[2]) < self.top_k:
+                heapq.heappush(cue[2], entry)
+            else:
+                # 丢弃分数最低的人脸，同时释放其裁剪图
+                heapq.heappushpop(cue[2], entry)
+                self.dropped_count += 1
+
+        return self.release(self.finished_cues(timestamp=timestamp, fps=fps, current_cue=cue_index))
+
+    def finished_cues(self, timestamp, fps, current_cue=None):
+        """在该时间点之前已经结束（加上冗余帧）的字幕序号列表，不包括 current_cue"""
+        return [index for index, (end, _, _) in self.cues.items()
+                if index != current_cue and end + self.frame_redundancy / fps < timestamp]
+
+    def expire(self, timestamp, fps):
+        """
+        释放在该时间点之前已经结束的字幕，用于流式输入暂时没有新的帧时，按流的当前时间释放已结束的字幕，
+        不等待下一帧到达
+
+        参数:
+            timestamp: 之后到达的帧都不早于该时间点（秒）
+            fps: 视频帧率
+
+        返回:
+            与 add 相同
+        """
+        return self.release(self.finished_cues(timestamp=timestamp, fps=fps))
+
+    def flush(self):
+        """输入结束时释放所有字幕保留的人脸"""
+        return self.release(list(self.cues))
+
+    def release(self, cue_indexes):
+        frames = {}
+        for cue_index in cue_indexes:
+            _, frame_counts, heap = self.cues.pop(cue_index)
+            for frame_count in frame_counts:
+                frames.setdefault(frame_count, [])
+            for _, _, face in heap:
+                frames[face['frame_count']].append(face)
+
+        return [(frame_count, sorted(faces, key=lambda face: face['face_index']))
+                for frame_count, faces in sorted(frames.items())]
+
+    def log_summary(self):
+        hlog.info('人脸质量排序完成，参与排序人脸数: %s，保留: %s，丢弃: %s' % (
+            self.ranked_count, self.ranked_count - self.dropped_count, self.dropped_count))
@@ -0,0 +1,152 @@
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from utils.face_util import FaceCaptureUtils
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class FaceCaptureJobHandler(BaseHTTPRequestHandler):
+    """
+    人脸捕捉任务接口
+
+    GET  /health  服务状态
+    POST /jobs    提交任务，请求体为 JSON：video_path、sub_path、avatar_output_path 必填，
+                  frame_redundancy、eye_diff_threshold、image_width、image_height 可选，默认使用配置文件中的值；
+                  响应为逐行 JSON（NDJSON），依次返回 started、face（每个人脸一行）、finished 或 error 事件
+    """
+
+    server: 'FaceCaptureService'
+
+    def log_message(self, format, *args):
+        hlog.debug('%s - %s' % (self.address_string(), format % args))
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_event(self, event):
+        self.wfile.write((json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, {'error': '未知的请求路径: %s' % self.path})
+            return
+
+        self.send_json(200, {'status': 'ok', 'busy': self.server.job_lock.locked()})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self.send_json(404, {'error': '未知的请求路径: %s' % self.path})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = json.loads(self.rfile.read(length) or b'{}')
+            job = self.server.build_job(job)
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {'error': '任务参数错误: %s' % e})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.end_headers()
+
+        events = queue.Queue()
+        worker = threading.Thread(target=self.server.run_job, args=(job, events.put), daemon=True)
+        worker.start()
+
+        try:
+            while True:
+                event = events.get()
+                self.send_event(event)
+                if event['event'] in ('finished', 'error'):
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            hlog.warning('客户端已断开连接，任务继续在后台执行: %s' % job['video_path'])
+
+
+class FaceCaptureService(ThreadingHTTPServer):
+    """
+    常驻的人脸捕捉服务
+
+    启动时加载一次模型并常驻内存，通过本地 HTTP 接口接收任务，处理过程中实时返回结果；任务按提交顺序依次执行
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host, port):
+        super().__init__((host, port), FaceCaptureJobHandler)
+        self.job_lock = threading.Lock()
+
+    @staticmethod
+    def build_job(job):
+        """校验任务参数并使用配置文件中的值补全可选参数"""
+        if not isinstance(job, dict):
+            raise ValueError('请求体必须是 JSON 对象')
+
+        for name in ('video_path', 'sub_path', 'avatar_output_path'):
+            if not job.get(name):
+                raise ValueError('缺少参数 %s' % name)
+
+        for name in ('video_path', 'sub_path'):
+            if not Path(job[name]).is_file():
+                raise ValueError('文件（%s）不存在' % job[name])
+
+        public_config = FaceCaptureUtils.public_config
+
+        return {
+            'video_path': job['video_path'],
+            'sub_path': job['sub_path'],
+            'avatar_output_path': job['avatar_output_path'],
+            'frame_redundancy': int(job.get('frame_redundancy', public_config.frame_redundancy)),
+            'eye_diff_threshold': int(job.get('eye_diff_threshold', public_config.eye_diff_threshold)),
+            'target_size': (int(job.get('image_width', public_config.image_width)),
+                            int(job.get('image_height', public_config.image_height))),
+        }
+
+    def run_job(self, job, emit):
+        """执行一个任务，通过 emit 回调逐个发送事件"""
+        with self.job_lock:
+            start_time = time.time()
+            hlog.info('开始处理任务: %s' % job['video_path'])
+            emit({'event': 'started', 'video_path': job['video_path']})
+
+            try:
+                subtitle_times = FaceCaptureUtils.parse_subtitles(job['sub_path'])
+                faces = FaceCaptureUtils.capture_avatar_from_video(
+                    video_path=Path(job['video_path']),
+                    subtitle_times=subtitle_times,
+                    avatar_output_path=Path(job['avatar_output_path']),
+                    frame_redundancy=job['frame_redundancy'],
+                    target_size=job['target_size'],
+                    eye_diff_threshold=job['eye_diff_threshold'],
+                    on_face=lambda face: emit({'event': 'face', 'face': face}))
+            except Exception as e:
+                hlog.error('处理任务（%s）时出现错误: %s' % (job['video_path'], e))
+                emit({'event': 'error', 'error': str(e)})
+                return
+
+            seconds = round(time.time() - start_time, 3)
+            hlog.info('任务处理完成: %s，人脸数: %s，耗时: %s 秒' % (job['video_path'], len(faces), seconds))
+            emit({'event': 'finished', 'face_count': len(faces), 'seconds': seconds})
+
+    @staticmethod
+    def serve(host, port):
+        """预先加载模型后启动服务，直到收到终止信号"""
+        FaceCaptureUtils.get_face_analyzer().warm_up()
+
+        with FaceCaptureService(host, port) as service:
+            hlog.info('人脸捕捉服务已启动: http://%s:%s' % (host, port))
+            service.serve_forever()
@@ -0,0 +1,233 @@
+import numpy as np
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class FaceTracker:
+    """
+    跨帧人脸跟踪与身份聚类
+
+    按人脸位置的 IoU 和特征向量相似度把相邻帧中的人脸连接成轨迹，每条轨迹只做一次属性分析，
+    特征变化较大时才重新分析；视频处理完成后按特征相似度把轨迹聚类为身份，每个身份保留一张最佳人脸
+
+    轨迹只保留最佳人脸的裁剪图、最近一次分析的人脸（属性和特征向量）以及特征向量之和，
+    其他人脸的裁剪图和对齐人脸图像在不再需要时立即释放，内存不随轨迹长度增长
+    """
+
+    # 身份结果中需要从已分析人脸复制的属性字段
+    ATTRIBUTE_KEYS = ('age', 'gender', 'race', 'emotion',
+                      'dominant_gender', 'dominant_race', 'dominant_emotion')
+
+    def __init__(self, iou_threshold, similarity_threshold, reanalyze_similarity, max_frame_gap):
+        """
+        参数:
+            iou_threshold: 人脸位置 IoU 不低于该值时认为属于同一轨迹
+            similarity_threshold: 特征向量余弦相似度不低于该值时认为属于同一轨迹或同一身份
+            reanalyze_similarity: 轨迹中人脸与上次分析时的特征相似度低于该值时重新做属性分析
+            max_frame_gap: 轨迹超过该帧数没有新人脸时结束
+        """
+        self.iou_threshold = iou_threshold
+        self.similarity_threshold = similarity_threshold
+        self.reanalyze_similarity = reanalyze_similarity
+        self.max_frame_gap = max_frame_gap
+
+        self.active_tracks = []
+        self.finished_tracks = []
+        self.track_count = 0
+        self.face_count = 0
+        self.analyze_count = 0
+
+    @staticmethod
+    def region_iou(region_a, region_b):
+        """计算两个人脸位置的交并比"""
+        x1 = max(region_a['x'], region_b['x'])
+        y1 = max(region_a['y'], region_b['y'])
+        x2 = min(region_a['x'] + region_a['w'], region_b['x'] + region_b['w'])
+        y2 = min(region_a['y'] + region_a['h'], region_b['y'] + region_b['h'])
+
+        intersection = max(0, x2 - x1) * max(0, y2 - y1)
+        union = region_a['w'] * region_a['h'] + region_b['w'] * region_b['h'] - intersection
+
+        return intersection / union if union > 0 else 0.0
+
+    @staticmethod
+    def cosine_similarity(embedding_a, embedding_b):
+        """计算两个特征向量的余弦相似度，任一向量缺失时返回 None"""
+        if embedding_a is None or embedding_b is None:
+            return None
+
+        norm = float(np.linalg.norm(embedding_a) * np.linalg.norm(embedding_b))
+
+        return float(np.dot(embedding_a, embedding_b)) / norm if norm > 0 else 0.0
+
+    @staticmethod
+    def face_score(face):
+        """人脸质量分数，用于选择轨迹和身份的最佳人脸"""
+        region = face['region']
+        return face['face_confidence'] * region['w'] * region['h']
+
+    def _new_track(self, frame_count, face):
+        self.track_count += 1
+        track = {
+            'track_id': self.track_count,
+            'frames': [frame_count],
+            'last_frame': frame_count,
+            'last_region': face['region'],
+            'embedding_sum': None if face.get('embedding') is None else face['embedding'].copy(),
+            'best_face': face,
+            'analyzed_face': face,
+        }
+        self.active_tracks.append(track)
+
+        return track
+
+    def _extend_track(self, track, frame_count, face):
+        """把人脸加入轨迹，返回该人脸是否需要重新做属性分析"""
+        if track['frames'][-1] != frame_count:
+            track['frames'].append(frame_count)
+
+        track['last_frame'] = frame_count
+        track['last_region'] = face['region']
+
+        if face.get('embedding') is not None:
+            if track['embedding_sum'] is None:
+                track['embedding_sum'] = face['embedding'].copy()
+            else:
+                track['embedding_sum'] += face['embedding']
+
+        # 只有最佳人脸在处理结束后写图，其他人脸（包括被替换的最佳人脸）不再需要裁剪图
+        if FaceTracker.face_score(face) > FaceTracker.face_score(track['best_face']):
+            track['best_face'].pop('crop', None)
+            track['best_face'] = face
+        else:
+            face.pop('crop', None)
+
+        similarity = FaceTracker.cosine_similarity(track['analyzed_face'].get('embedding'), face.get('embedding'))
+        if similarity is not None and similarity < self.reanalyze_similarity:
+            track['analyzed_face'] = face
+            return True
+
+        return False
+
+    def update(self, frame_count, faces):
+        """
+        把一帧中的人脸关联到已有轨迹或创建新轨迹
+
+        参数:
+            frame_count: 帧号
+            faces: 该帧中通过过滤的人脸列表
+
+        返回:
+            需要做属性分析的人脸列表（新轨迹的人脸或变化较大的人脸）
+        """
+        self.face_count += len(faces)
+
+        # 结束长时间没有新人脸的轨迹
+        for track in list(self.active_tracks):
+            if frame_count - track['last_frame'] > self.max_frame_gap:
+                self.active_tracks.remove(track)
+                self.finished_tracks.append(track)
+
+        candidates = []
+        for face_index, face in enumerate(faces):
+            for track_index, track in enumerate(self.active_tracks):
+                if track['last_frame'] == frame_count:
+                    continue
+
+                iou = FaceTracker.region_iou(track['last_region'], face['region'])
+                similarity = FaceTracker.cosine_similarity(track['analyzed_face'].get('embedding'),
+                                                           face.get('embedding'))
+
+                if iou >= self.iou_threshold or (similarity is not None and similarity >= self.similarity_threshold):
+                    candidates.append((iou + (similarity or 0), face_index, track_index))
+
+        # 按匹配分数从高到低贪心关联，每条轨迹每帧只关联一个人脸
+        matched_faces = {}
+        matched_tracks = set()
+        for _, face_index, track_index in sorted(candidates, reverse=True):
+            if face_index in matched_faces or track_index in matched_tracks:
+                continue
+
+            matched_faces[face_index] = self.active_tracks[track_index]
+            matched_tracks.add(track_index)
+
+        pending_faces = []
+        for face_index, face in enumerate(faces):
+            if face_index not in matched_faces:
+                self._new_track(frame_count=frame_count, face=face)
+                pending_faces.append(face)
+            elif self._extend_track(track=matched_faces[face_index], frame_count=frame_count, face=face):
+                pending_faces.append(face)
+            else:
+                # 不做属性分析的人脸已提取特征向量，不再需要对齐人脸图像
+                face.pop('face', None)
+
+        self.analyze_count += len(pending_faces)
+
+        return pending_faces
+
+    @staticmethod
+    def release_analyzed(faces):
+        """属性分析完成后释放人脸的对齐图像，轨迹只保留分析结果和特征向量"""
+        for face in faces:
+            face.pop('face', None)
+
+    def finish(self):
+        """
+        结束所有轨迹并按特征相似度聚类为身份
+
+        返回:
+            身份列表，每项包含 identity_id、best_face（附带属性分析结果的最佳人脸）、frames（出现的帧号）和 track_ids
+        """
+        tracks = self.finished_tracks + self.active_tracks
+        self.finished_tracks = []
+        self.active_tracks = []
+
+        identities = []
+        for track in sorted(tracks, key=lambda item: len(item['frames']), reverse=True):
+            best_identity = None
+            best_similarity = self.similarity_threshold
+
+            for identity in identities:
+                similarity = FaceTracker.cosine_similarity(identity['embedding_sum'], track['embedding_sum'])
+                if similarity is not None and similarity >= best_similarity:
+                    best_identity = identity
+                    best_similarity = similarity
+
+            if best_identity is None:
+                identities.append({
+                    'embedding_sum': None if track['embedding_sum'] is None else track['embedding_sum'].copy(),
+                    'tracks': [track],
+                })
+                continue
+
+            best_identity['tracks'].append(track)
+            if track['embedding_sum'] is not None:
+                best_identity['embedding_sum'] += track['embedding_sum']
+
+        results = []
+        for identity_id, identity in enumerate(sorted(identities,
+                                                      key=lambda item: min(track['frames'][0]
+                                                                           for track in item['tracks']))):
+            best_track = max(identity['tracks'], key=lambda track: FaceTracker.face_score(track['best_face']))
+            best_face = best_track['best_face']
+
+            # 最佳人脸使用所在轨迹的属性分析结果
+            for key in FaceTracker.ATTRIBUTE_KEYS:
+                if key in best_track['analyzed_face']:
+                    best_face[key] = best_track['analyzed_face'][key]
+
+            results.append({
+                'identity_id': identity_id,
+                'best_face': best_face,
+                'frames': sorted({frame for track in identity['tracks'] for frame in track['frames']}),
+                'track_ids': sorted(track['track_id'] for track in identity['tracks']),
+            })
+
+        hlog.info('人脸跟踪完成，人脸数: %s，轨迹数: %s，身份数: %s，属性分析次数: %s（节省 %s 次）' % (
+            self.face_count, self.track_count, len(results), self.analyze_count,
+            self.face_count - self.analyze_count))
+
+        return results
@@ -1,31 +1,52 @@
-import re
-import av
+import json
+import threading
 import cv2
+import numpy as np
+
+from contextlib import nullcontext
 
 from pathlib import Path
-from deepface import DeepFace
+from typing import TYPE_CHECKING
+from utils.crop_writer import CropWriter
 from utils.character_Info_enum import GenderType, RaceType, EmotionType
+from utils.face_cascade import FaceCascade
 from utils.face_conf import PrivateConfig,PublicConfig
+from utils.frame_buffer_pool import FrameBufferPool
+from utils.face_pipeline import FacePipeline
+from utils.face_ranker import FaceRanker
+from utils.face_tracker import FaceTracker
+from utils.frame_filter import FrameDeduplicator
+from utils.frame_planner import FramePlanner
+from utils.perf_stats import PerfStats
+from utils.result_cache import ResultCache
+from utils.result_sink import ResultSink
+from utils.run_checkpoint import RunCheckpoint
+from utils.stream_source import StreamFrameSource
+from utils.subtitle_index import SubtitleIndex
 
 from happy_python import HappyLog
 
-hlog = HappyLog.get_instance()
-
+if TYPE_CHECKING:
+    from utils.face_analyzer import FaceAnalyzer
 
-# noinspection PyUnusedLocal
-def interrupt_from_keyboard_handler(signum, frame):
-    hlog.warning('检测到用户发送终止信号，退出程序中......')
-    exit(1)
+hlog = HappyLog.get_instance()
 
 
 class FaceCaptureUtils:
     private_config: PrivateConfig
     public_config: PublicConfig
+    face_analyzer: 'FaceAnalyzer | None' = None
+    result_cache: ResultCache | None = None
+
+    # 各写图线程复用的调整大小目标缓冲区
+    resize_buffers = threading.local()
+
+    IDENTITIES_FILE = 'identities.json'
 
     @staticmethod
-    def init(private_config: PrivateConfig):
+    def init(private_config: PrivateConfig, public_config: PublicConfig):
         FaceCaptureUtils.private_config = private_config
-        FaceCaptureUtils.public_config = PublicConfig
+        FaceCaptureUtils.public_config = public_config
 
     @staticmethod
     def ensure_directory_exists(directory_path):
@@ -48,75 +69,105 @@ class FaceCaptureUtils:
     @staticmethod
     def convert_time_to_frames(time_str, fps):
         """将字幕时间字符串 (hh:mm:ss,ms) 转换为对应的视频帧数"""
-        time_parts = time_str.split(',')
-        seconds = time_parts[0]
-        milliseconds = int(time_parts[1])
-
-        h, m, s = map(int, seconds.split(':'))
-        total_seconds = h * 3600 + m * 60 + s + milliseconds / 1000
-        frame_number = int(total_seconds * fps)
-        return frame_number
+        return int(FramePlanner.time_to_seconds(time_str) * fps)
 
     @staticmethod
     def parse_subtitles(srt_file):
         """读取字幕文件并提取每条字幕的时间范围"""
-        with open(srt_file, 'r', encoding='utf-8') as file:
-            content = file.read()
-
-        subtitle_pattern = r"(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})"
-        times = re.findall(subtitle_pattern, content)
-
-        # 返回每一条字幕的开始和结束时间
-        return [(start, end) for start, end in times]
+        return SubtitleIndex.parse_file(srt_file)
 
     @staticmethod
-    def extract_keyframes_from_subtitle_ranges(video_path, subtitle_times, frame_redundancy):
+    def iter_keyframes_from_subtitle_ranges(video_path, subtitle_times, frame_redundancy, intervals=None,
+                                            checkpoint=None, planner=None, stats=None, buffer_pool=None):
         """
-        从字幕时间范围内提取视频关键帧
+        解码并直接产出字幕时间范围内的关键帧图像
+
+        关键帧由 FramePlanner 通过解复用确定，解码时按区间直接定位，不再二次打开视频逐帧定位
 
         参数:
             video_path: 视频文件路径
             subtitle_times: 字幕时间列表，格式为 [(start_time, end_time), ...]
             frame_redundancy: 字幕时间前后需要额外检查的帧数
+            intervals: 只处理指定的帧区间，为 None 时处理全部字幕区间
+            checkpoint: 进度记录 RunCheckpoint，有已保存的选帧计划时直接复用，并跳过已完成的帧
+            planner: 已创建的 FramePlanner，为 None 时按以上参数创建
+            stats: 性能统计 PerfStats，记录选帧、定位和解码的耗时及帧数
+            buffer_pool: 帧缓冲区池 FrameBufferPool，指定时解码帧转换到池中复用的缓冲区
 
         返回:
-            keyframes: 关键帧号的有序列表
+            生成器，按帧号顺序产出 (帧号, BGR 格式的 ndarray)
         """
-        keyframes = set()
-        container = av.open(video_path)
+        if planner is None:
+            public_config = FaceCaptureUtils.public_config
+            planner = FramePlanner(video_path=video_path,
+                                   subtitle_times=subtitle_times,
+                                   frame_redundancy=frame_redundancy,
+                                   intervals=intervals,
+                                   sampling=public_config.frame_sampling,
+                                   frames_per_cue=public_config.frames_per_cue,
+                                   frame_budget=public_config.max_frames_per_video)
+
+        if checkpoint is not None and checkpoint.plan is not None:
+            keyframes = checkpoint.plan
+            hlog.info('复用进度记录中的选帧计划，关键帧数: %s' % len(keyframes))
+        else:
+            keyframes = FaceCaptureUtils.extract_keyframes_from_planner(planner=planner, stats=stats)
+            if checkpoint is not None:
+                checkpoint.save_plan(keyframes)
+
+        if checkpoint is not None:
+            keyframes = checkpoint.remaining_frames(keyframes)
+            hlog.info('剩余需要处理的关键帧数: %s' % len(keyframes))
+
+        if stats is not None:
+            stats.count('frames_planned', len(keyframes))
+
+        yield from planner.iter_frames(frame_numbers=keyframes, stats=stats, buffer_pool=buffer_pool)
 
-        try:
-            stream = container.streams.video[0]
-            fps = int(stream.average_rate)
-            total_frames = stream.frames
-
-            frame_ranges = set()
-            for start_time, end_time in subtitle_times:
-                start_frame = FaceCaptureUtils.convert_time_to_frames(time_str=start_time, fps=fps)
-                end_frame = FaceCaptureUtils.convert_time_to_frames(time_str=end_time, fps=fps)
-
-                # 添加冗余帧范围
-                for frame_num in range(max(0, start_frame - frame_redundancy),
-                                       min(total_frames - 1, end_frame + frame_redundancy) + 1):
-                    frame_ranges.add(frame_num)
-
-            # 遍历视频帧，只保留在指定范围内的关键帧
-            frame_index = 0
-            for frame in container.decode(video=0):
-                if frame_index in frame_ranges and frame.key_frame:
-                    keyframes.add(frame_index)
-                frame_index += 1
+    @staticmethod
+    def extract_keyframes_from_planner(planner, stats=None):
+        keyframes = []
 
+        try:
+            with stats.timer('plan') if stats is not None else nullcontext():
+                keyframes = planner.plan_frames()
         except Exception as e:
             hlog.error('处理视频时出错: %s' % str(e))
-        finally:
-            container.close()
 
-        result = sorted(list(keyframes))
-        hlog.info('需要处理的关键帧位置-> %s' % result)
+        hlog.info('字幕区间数: %s，字幕数: %s，采样方式: %s，需要处理的帧数: %s' % (len(planner.intervals),
+                                                                             len(planner.cue_ranges),
+                                                                             planner.sampling,
+                                                                             len(keyframes)))
+        hlog.debug('需要处理的关键帧位置-> %s' % keyframes)
         hlog.info('获取关键帧完成')
 
-        return result
+        return keyframes
+
+    @staticmethod
+    def extract_keyframes_from_subtitle_ranges(video_path, subtitle_times, frame_redundancy, sampling='keyframes',
+                                               frames_per_cue=3, frame_budget=0):
+        """
+        从字幕时间范围内提取需要处理的视频帧
+
+        参数:
+            video_path: 视频文件路径
+            subtitle_times: 字幕时间列表，格式为 [(start_time, end_time), ...]
+            frame_redundancy: 字幕时间前后需要额外检查的帧数
+            sampling: 采样方式，keyframes 为区间内的全部关键帧，uniform/adaptive 为每条字幕均匀/按运动量采样
+            frames_per_cue: uniform/adaptive 方式下每条字幕的采样帧数
+            frame_budget: 整个视频最多处理的帧数，0 表示不限制
+
+        返回:
+            keyframes: 帧号的有序列表
+        """
+        planner = FramePlanner(video_path=video_path,
+                               subtitle_times=subtitle_times,
+                               frame_redundancy=frame_redundancy,
+                               sampling=sampling,
+                               frames_per_cue=frames_per_cue,
+                               frame_budget=frame_budget)
+
+        return FaceCaptureUtils.extract_keyframes_from_planner(planner=planner)
 
     @staticmethod
     def is_frontal_face(region, eye_diff_threshold):
@@ -140,7 +191,8 @@ class FaceCaptureUtils:
             # 计算眼睛的横坐标差异
             eye_x_diff = abs(left_eye[0] - right_eye[0])
 
-            hlog.info('眼睛横坐标差异: %s' % eye_x_diff)
+            if FaceCaptureUtils.public_config.verbose:
+                hlog.info('眼睛横坐标差异: %s' % eye_x_diff)
 
             # 如果横坐标差异大于阈值，认为是正脸
             return eye_x_diff > eye_diff_threshold  # 如果横坐标差异大于阈值，返回 True
@@ -150,119 +202,722 @@ class FaceCaptureUtils:
             return False
 
     @staticmethod
-    def capture_avatar_from_video(video_path, subtitle_times, avatar_output_path, frame_redundancy, target_size,
-                                  eye_diff_threshold):
-        FaceCaptureUtils.ensure_directory_exists(avatar_output_path)
-        # 提取视频字幕对应的帧
-        video_frames = FaceCaptureUtils.extract_keyframes_from_subtitle_ranges(video_path=video_path,
-                                                                               subtitle_times=subtitle_times,
-                                                                               frame_redundancy=frame_redundancy)
+    def get_face_analyzer():
+        """获取按公共配置创建的人脸分析器，模型只加载一次"""
+        if FaceCaptureUtils.face_analyzer is None:
+            # 在首次使用时才导入 DeepFace，基准测试等场景可以预先设置不依赖模型的分析器
+            from utils.face_analyzer import FaceAnalyzer
+
+            public_config = FaceCaptureUtils.public_config
+            FaceCaptureUtils.face_analyzer = FaceAnalyzer(
+                actions=FaceAnalyzer.parse_actions(public_config.analyze_actions),
+                batch_size=public_config.analyze_batch_size,
+                detector_backend=public_config.detector_backend,
+                embedding_model=public_config.track_embedding_model if public_config.face_tracking else None,
+                cascade=FaceCascade(detector=public_config.cascade_detector,
+                                    max_width=public_config.cascade_max_width,
+                                    yunet_model_path=public_config.yunet_model_path)
+                if public_config.cascade_detector != 'none' else None,
+                cascade_roi=public_config.cascade_roi)
+
+        return FaceCaptureUtils.face_analyzer
 
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise Exception('无法打开视频: %s' % video_path)
+    @staticmethod
+    def get_result_cache():
+        """获取按公共配置创建的结果缓存，未配置缓存目录时返回 None"""
+        public_config = FaceCaptureUtils.public_config
+        if not public_config.result_cache_dir:
+            return None
 
-        detected_faces = []
+        if FaceCaptureUtils.result_cache is None:
+            FaceCaptureUtils.result_cache = ResultCache(
+                cache_dir=public_config.result_cache_dir,
+                max_bytes=public_config.result_cache_max_mb * 1024 * 1024,
+                model_identity=FaceCaptureUtils.get_face_analyzer().model_identity)
 
-        try:
-            for frame_count in video_frames:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
-                ret, frame = cap.read()
-                if not ret:
-                    hlog.error('无法读取第 %s 帧' % frame_count)
-                    continue
+        return FaceCaptureUtils.result_cache
 
-                try:
-                    results = DeepFace.analyze(
-                        frame,
-                        actions=['age', 'gender', 'race', 'emotion'],
-                        detector_backend='retinaface',
-                        enforce_detection=False
-                    )
-
-                    # results = FaceCaptureUtils.deepface_load_model(frame=frame)
-
-                    if not isinstance(results, list):
-                        results = [results]
-
-                    if not results:
-                        hlog.info('第 %s 帧中没有检测到人脸' % frame_count)
-                        continue
-
-                    for i, result in enumerate(results):
-                        if 'face_confidence' not in result or result['face_confidence'] < 0.95:
-                            hlog.warning('第 %s 帧中的人脸 %s 置信度过低，跳过\n' % (frame_count, i + 1))
-                            continue
-
-                        # 增加正脸判断
-                        if 'region' in result:
-                            if not FaceCaptureUtils.is_frontal_face(region=result['region'],
-                                                                    eye_diff_threshold=eye_diff_threshold):
-                                hlog.warning('第 %s 帧中的人脸 %s 不是正脸，跳过\n' % (frame_count, i + 1))
-                                continue
-
-                        gender_confidence = FaceCaptureUtils.get_max_prediction(predictions=result['gender'])
-                        race_confidence = FaceCaptureUtils.get_max_prediction(predictions=result['race'])
-                        emotion_confidence = FaceCaptureUtils.get_max_prediction(predictions=result['emotion'])
-
-                        age = result['age']
-                        gender = FaceCaptureUtils.get_enum_by_value(enum_class=GenderType,
-                                                                    value=gender_confidence[0]).chinese_name
-                        race = FaceCaptureUtils.get_enum_by_value(enum_class=RaceType,
-                                                                  value=race_confidence[0]).chinese_name
-                        emotion = FaceCaptureUtils.get_enum_by_value(enum_class=EmotionType,
-                                                                     value=emotion_confidence[0]).chinese_name
-
-                        hlog.debug('第 %s 帧中的人脸 %s ,置信度 %s, 分析结果:' % (frame_count,
-                                                                                  i + 1,
-                                                                                  result['face_confidence']))
-                        hlog.debug('年龄: %s，' % age)
-                        hlog.debug('性别: %s (置信度: %.2f%%)' % (gender, gender_confidence[1]))
-                        hlog.debug('种族: %s (置信度: %.2f%%)' % (race, race_confidence[1]))
-                        hlog.debug('情绪: %s (置信度: %.2f%%)' % (emotion, emotion_confidence[1]))
-
-                        # 裁剪并调整人脸大小
-                        if 'region' in result:
-                            region = result['region']
-                            x, y, w, h = region['x'], region['y'], region['w'], region['h']
-
-                            if w > 0 and h > 0:
-                                # 扩大裁剪区域以包含更多面部特征
-                                center_x = x + w // 2
-                                center_y = y + h // 2
-                                size = max(w, h)
-                                padding = int(size * 0.3)  # 增加30%的边距
-                                new_size = size + 2 * padding
-
-                                # 计算新的裁剪区域
-                                x1 = max(0, center_x - new_size // 2)
-                                y1 = max(0, center_y - new_size // 2)
-                                x2 = min(frame.shape[1], x1 + new_size)
-                                y2 = min(frame.shape[0], y1 + new_size)
-
-                                # 裁剪人脸
-                                cropped_face = frame[int(y1):int(y2), int(x1):int(x2)]
-
-                                # 调整到统一大小
-                                if cropped_face.size > 0:  # 确保裁剪区域有效
-                                    cropped_face = cv2.resize(cropped_face, target_size,
-                                                              interpolation=cv2.INTER_LANCZOS4)
-
-                                    avatar_file = 'frame_%s_face_%s.jpg' % (frame_count, i)
-                                    face_img_path = str(avatar_output_path / avatar_file)
-
-                                    cv2.imwrite(face_img_path, cropped_face)
-                                    hlog.info('人脸图片已保存到: %s\n' % face_img_path)
-
-                                    detected_faces.append((face_img_path, age, gender, race, emotion))
-                                else:
-                                    hlog.error('第 %s 帧中的人脸 %s 裁剪失败' % (frame_count, i + 1))
-                            else:
-                                hlog.warning('第 %s 帧中的人脸 %s 位置无效，跳过' % (frame_count, i + 1))
+    @staticmethod
+    def analyze_faces(faces, result_cache=None, stats=None):
+        """
+        对人脸做属性分析，指定 result_cache 时跳过已有缓存结果的人脸，并把新的分析结果写入缓存
+        """
+        face_analyzer = FaceCaptureUtils.get_face_analyzer()
+        pending_faces = faces
+        if result_cache is not None:
+            pending_faces = [face for face in faces if face_analyzer.attributes_of(face) is None]
+
+        with stats.timer('analyze', count=len(pending_faces)) if stats is not None else nullcontext():
+            face_analyzer.analyze(pending_faces)
+
+        if result_cache is None:
+            return faces
+
+        for face in pending_faces:
+            if 'cache_key' in face:
+                result_cache.put_attributes(key=face['cache_key'],
+                                            face_index=face['face_index'],
+                                            attributes=face_analyzer.attributes_of(face))
+
+        return faces
+
+    @staticmethod
+    def filter_faces(frame_count, faces, eye_diff_threshold, stats=None):
+        """按检测置信度和正脸判断过滤人脸，返回 (人脸序号, 人脸) 列表"""
+        accepted_faces = []
+        verbose = FaceCaptureUtils.public_config.verbose
+
+        for i, face in enumerate(faces):
+            if face['face_confidence'] < 0.95:
+                if verbose:
+                    hlog.warning('第 %s 帧中的人脸 %s 置信度过低，跳过\n' % (frame_count, i + 1))
+                if stats is not None:
+                    stats.count('faces_rejected_confidence')
+                continue
+
+            # 增加正脸判断
+            if not FaceCaptureUtils.is_frontal_face(region=face['region'], eye_diff_threshold=eye_diff_threshold):
+                if verbose:
+                    hlog.warning('第 %s 帧中的人脸 %s 不是正脸，跳过\n' % (frame_count, i + 1))
+                if stats is not None:
+                    stats.count('faces_rejected_frontal')
+                continue
+
+            accepted_faces.append((i, face))
+
+        return accepted_faces
+
+    @staticmethod
+    def crop_face(frame, region):
+        """按人脸位置扩大 30% 边距裁剪人脸，位置无效或裁剪失败时返回 None"""
+        x, y, w, h = region['x'], region['y'], region['w'], region['h']
+
+        if w <= 0 or h <= 0:
+            return None
+
+        # 扩大裁剪区域以包含更多面部特征
+        center_x = x + w // 2
+        center_y = y + h // 2
+        size = max(w, h)
+        padding = int(size * 0.3)  # 增加30%的边距
+        new_size = size + 2 * padding
+
+        # 计算新的裁剪区域
+        x1 = max(0, center_x - new_size // 2)
+        y1 = max(0, center_y - new_size // 2)
+        x2 = min(frame.shape[1], x1 + new_size)
+        y2 = min(frame.shape[0], y1 + new_size)
+
+        # 裁剪人脸
+        cropped_face = frame[int(y1):int(y2), int(x1):int(x2)]
+
+        return cropped_face if cropped_face.size > 0 else None
+
+    @staticmethod
+    def get_attribute(face, action, enum_class):
+        """获取人脸某项属性概率最高的枚举值及置信度，未分析该属性时返回 (None, None)"""
+        if action not in face:
+            return None, None
+
+        label, confidence = FaceCaptureUtils.get_max_prediction(predictions=face[action])
+
+        return FaceCaptureUtils.get_enum_by_value(enum_class=enum_class, value=label), confidence
+
+    @staticmethod
+    def get_resize_buffer(target_size):
+        """获取当前线程复用的 target_size 大小的 BGR 缓冲区"""
+        shape = (target_size[1], target_size[0], 3)
+        buffer = getattr(FaceCaptureUtils.resize_buffers, 'buffer', None)
+        if buffer is None or buffer.shape != shape:
+            buffer = FaceCaptureUtils.resize_buffers.buffer = np.empty(shape, dtype=np.uint8)
+
+        return buffer
+
+    @staticmethod
+    def write_face(face, crop_writer, target_size, stats=None):
+        """将已完成属性分析的人脸调整大小后保存图片，并返回分析结果"""
+        frame_count = face['frame_count']
+        face_index = face['face_index']
+
+        age = face.get('age')
+        gender, gender_confidence = FaceCaptureUtils.get_attribute(face=face, action='gender', enum_class=GenderType)
+        race, race_confidence = FaceCaptureUtils.get_attribute(face=face, action='race', enum_class=RaceType)
+        emotion, emotion_confidence = FaceCaptureUtils.get_attribute(face=face,
+                                                                     action='emotion',
+                                                                     enum_class=EmotionType)
+
+        gender = gender.chinese_name if gender else None
+        race = race.chinese_name if race else None
+        emotion = emotion.chinese_name if emotion else None
+
+        # 逐个人脸的日志只在详细模式下输出
+        verbose = FaceCaptureUtils.public_config.verbose
+        if verbose:
+            hlog.debug('第 %s 帧中的人脸 %s ,置信度 %s, 分析结果:' % (frame_count,
+                                                                      face_index + 1,
+                                                                      face['face_confidence']))
+            hlog.debug('年龄: %s，' % age)
+            hlog.debug('性别: %s (置信度: %s%%)' % (gender, gender_confidence))
+            hlog.debug('种族: %s (置信度: %s%%)' % (race, race_confidence))
+            hlog.debug('情绪: %s (置信度: %s%%)' % (emotion, emotion_confidence))
+
+        # 调整到统一大小，结果写入当前线程复用的缓冲区，写图完成后不再引用裁剪图所在的整帧
+        with stats.timer('resize') if stats is not None else nullcontext():
+            cropped_face = cv2.resize(face.pop('crop'),
+                                      target_size,
+                                      dst=FaceCaptureUtils.get_resize_buffer(target_size),
+                                      interpolation=cv2.INTER_LANCZOS4)
+
+        avatar_name = face.get('avatar_name', 'frame_%s_face_%s' % (frame_count, face_index))
+        with stats.timer('write') if stats is not None else nullcontext():
+            face_img_path = crop_writer.write(name=avatar_name, image=cropped_face)
+
+        if stats is not None:
+            stats.count('faces_written')
+        if verbose:
+            hlog.info('人脸图片已保存到: %s\n' % face_img_path)
+
+        return face_img_path, age, gender, race, emotion
+
+    @staticmethod
+    def capture_avatar_from_frame(frame_count, frame, eye_diff_threshold, frame_deduplicator=None,
+                                  result_cache=None, stats=None, copy_crop=True):
+        """
+        检测并过滤单帧图像中的人脸，返回裁剪后等待属性分析的人脸列表，检测出错时返回 None
 
+        copy_crop 为 False 时裁剪图是帧的视图，在写图时调整大小之前一直引用整帧；
+        帧来自 FrameBufferPool 时，引用结束后缓冲区自动复用
+
+        指定 frame_deduplicator 时，与上次检测帧近似重复的帧不再检测，直接复用上次的检测结果；
+        指定 result_cache 时，先按帧内容查找缓存的检测结果，未命中时检测并写入缓存；
+        指定 stats 时记录检测和裁剪耗时以及各类帧和人脸的数量
+        """
+        pending_faces = []
+        faces = None
+        verbose = FaceCaptureUtils.public_config.verbose
+
+        if frame_deduplicator is not None:
+            frame_hash, faces = frame_deduplicator.lookup(frame)
+            if faces is not None:
+                if verbose:
+                    hlog.debug('第 %s 帧与上次检测帧近似重复，复用检测结果' % frame_count)
+                if stats is not None:
+                    stats.count('frames_dedup_skipped')
+
+        if faces is None:
+            cache_key = None
+            if result_cache is not None:
+                cache_key = result_cache.frame_key(frame)
+                faces = result_cache.get(cache_key)
+                if faces is not None:
+                    if verbose:
+                        hlog.debug('第 %s 帧命中结果缓存' % frame_count)
+                    if stats is not None:
+                        stats.count('frames_cache_hit')
+
+            if faces is None:
+                try:
+                    with stats.timer('detect') if stats is not None else nullcontext():
+                        faces = FaceCaptureUtils.get_face_analyzer().detect(frame)
                 except Exception as e:
                     hlog.error('处理第 %s 帧时出现错误: %s' % (frame_count, e))
+                    if stats is not None:
+                        stats.count('frames_failed')
+                    return None
+
+                if result_cache is not None:
+                    result_cache.put_faces(key=cache_key, faces=faces)
+
+            if cache_key is not None:
+                for face in faces:
+                    face['cache_key'] = cache_key
+
+            if frame_deduplicator is not None:
+                frame_deduplicator.remember(frame_hash=frame_hash, faces=faces)
+
+        if not faces:
+            if verbose:
+                hlog.info('第 %s 帧中没有检测到人脸' % frame_count)
+            return pending_faces
+
+        if stats is not None:
+            stats.count('faces_detected', len(faces))
+
+        invalid_faces = []
+        for i, face in FaceCaptureUtils.filter_faces(frame_count=frame_count,
+                                                     faces=faces,
+                                                     eye_diff_threshold=eye_diff_threshold,
+                                                     stats=stats):
+            with stats.timer('crop') if stats is not None else nullcontext():
+                cropped_face = FaceCaptureUtils.crop_face(frame=frame, region=face['region'])
+                if cropped_face is not None and copy_crop:
+                    # 复制裁剪结果，不再持有整帧图像
+                    cropped_face = cropped_face.copy()
+
+            if cropped_face is None:
+                invalid_faces.append(i + 1)
+                continue
+
+            face['frame_count'] = frame_count
+            face['face_index'] = i
+            face['crop'] = cropped_face
+            pending_faces.append(face)
+
+        # 位置无效的人脸每帧只输出一次汇总日志
+        if invalid_faces:
+            hlog.warning('第 %s 帧中 %s 个人脸位置无效，跳过: %s' % (frame_count,
+                                                                len(invalid_faces),
+                                                                ', '.join(map(str, invalid_faces))))
+            if stats is not None:
+                stats.count('faces_rejected_region', len(invalid_faces))
+
+        return pending_faces
+
+    @staticmethod
+    def build_face_record(face, result, video_path, fps, subtitle_index):
+        """将完成写图的人脸转换为结果记录，字幕为 subtitle_index（SubtitleIndex）中距离该帧最近的字幕"""
+        frame_count = face['frame_count']
+        region = face['region']
+        timestamp = frame_count / fps if fps else None
+        subtitle = None if timestamp is None else subtitle_index.find(timestamp)
+
+        record = {
+            'video': str(video_path),
+            'frame': frame_count,
+            'face_index': face['face_index'],
+            'timestamp': None if timestamp is None else round(timestamp, 3),
+            'subtitle_index': None if subtitle is None else subtitle[0],
+            'subtitle_start': None if subtitle is None else subtitle[1],
+            'subtitle_end': None if subtitle is None else subtitle[2],
+            'region': {key: int(region[key]) for key in ('x', 'y', 'w', 'h')},
+            'left_eye': None if region.get('left_eye') is None else [int(value) for value in region['left_eye']],
+            'right_eye': None if region.get('right_eye') is None else [int(value) for value in region['right_eye']],
+            'face_confidence': float(face['face_confidence']),
+            'age': result[1],
+            'identity_id': face.get('identity_id'),
+            'crop_path': result[0],
+        }
+
+        for action, enum_class in (('gender', GenderType), ('race', RaceType), ('emotion', EmotionType)):
+            value, confidence = FaceCaptureUtils.get_attribute(face=face, action=action, enum_class=enum_class)
+            record[action] = value.value if value else None
+            record['%s_confidence' % action] = None if confidence is None else float(confidence)
+
+        return record
+
+    @staticmethod
+    def open_results_sink(avatar_output_path):
+        """按公共配置在输出目录中打开结果输出，未配置结果文件时返回 None"""
+        results_file = FaceCaptureUtils.public_config.results_file
+        if not results_file:
+            return None
+
+        return ResultSink.open(Path(avatar_output_path) / results_file)
+
+    @staticmethod
+    def prepare_outputs(avatar_output_path, checkpoints):
+        """
+        处理之前运行留下的结果文件和人脸图片分卷：新的运行删除整个结果文件、所有分卷和 .npy 索引文件；
+        从进度记录恢复时只保留已完成帧的记录和人脸，未完成的帧重新处理后再次写入，输出中不出现重复
+
+        参数:
+            avatar_output_path: 输出目录
+            checkpoints: 写入该输出目录的各进度记录 RunCheckpoint，未开启进度记录时为 None
+        """
+        completed_frames = set()
+        for checkpoint in checkpoints:
+            if checkpoint is not None:
+                completed_frames.update(checkpoint.completed_frames)
+
+        if completed_frames:
+            CropWriter.retain_frames(avatar_output_path, completed_frames)
+        else:
+            CropWriter.remove_shards(avatar_output_path)
+
+        results_file = FaceCaptureUtils.public_config.results_file
+        if not results_file:
+            return
+
+        results_path = Path(avatar_output_path) / results_file
+        if completed_frames:
+            ResultSink.retain_frames(results_path, completed_frames)
+        else:
+            ResultSink.remove(results_path)
+
+    @staticmethod
+    def write_perf_report(stats, avatar_output_path, video_path, intervals=None):
+        """按公共配置输出运行报告和 Prometheus 指标文件"""
+        public_config = FaceCaptureUtils.public_config
+        stats.log_summary()
+
+        if public_config.perf_report:
+            report_path = Path(avatar_output_path) / public_config.perf_report
+            # 分片处理时每个分片单独保存报告
+            if intervals:
+                report_path = report_path.with_name('%s_%s%s' % (report_path.stem, intervals[0][0],
+                                                                  report_path.suffix))
+
+            stats.write_report(report_path, video=str(video_path), intervals=intervals)
+
+        if public_config.prometheus_textfile:
+            stats.write_prometheus(public_config.prometheus_textfile, labels={'video': Path(video_path).name})
+
+    @staticmethod
+    def finish_tracking(face_tracker, avatar_output_path, crop_writer):
+        """结束人脸跟踪，保存身份列表文件，并返回每个身份需要保存的最佳人脸"""
+        identities = face_tracker.finish()
+        best_faces = []
+        identity_records = []
+
+        for identity in identities:
+            best_face = identity['best_face']
+            best_face['avatar_name'] = 'identity_%s' % identity['identity_id']
+            best_face['identity_id'] = identity['identity_id']
+            best_faces.append(best_face)
+
+            identity_records.append({
+                'identity_id': identity['identity_id'],
+                'avatar_file': crop_writer.entry_name(best_face['avatar_name']),
+                'best_frame': best_face['frame_count'],
+                'age': best_face.get('age'),
+                'gender': best_face.get('dominant_gender'),
+                'race': best_face.get('dominant_race'),
+                'emotion': best_face.get('dominant_emotion'),
+                'frames': identity['frames'],
+                'track_ids': identity['track_ids'],
+            })
+
+        identities_path = Path(avatar_output_path) / FaceCaptureUtils.IDENTITIES_FILE
+        with open(identities_path, 'w', encoding='utf-8') as file:
+            json.dump(identity_records, file, ensure_ascii=False, indent=2)
+
+        hlog.info('身份列表已保存到: %s' % identities_path)
+
+        return best_faces
+
+    @staticmethod
+    def open_checkpoint(video_path, subtitle_times, avatar_output_path, frame_redundancy, target_size,
+                        eye_diff_threshold, intervals=None):
+        """
+        按公共配置创建并读取进度记录，未开启进度记录时返回 None
+
+        跟踪模式的轨迹状态无法从单帧结果恢复，不记录进度；进度键包括所有影响选帧、检测和输出文件的配置，
+        任一配置变化后重新处理，不与之前的输出混在一起
+        """
+        public_config = FaceCaptureUtils.public_config
+        if not public_config.checkpoint or public_config.face_tracking:
+            return None
+
+        checkpoint = RunCheckpoint(avatar_output_path=avatar_output_path,
+                                   video_path=video_path,
+                                   subtitle_times=subtitle_times,
+                                   settings={
+                                       'frame_redundancy': frame_redundancy,
+                                       'eye_diff_threshold': eye_diff_threshold,
+                                       'target_size': list(target_size),
+                                       'intervals': intervals,
+                                       'frame_sampling': public_config.frame_sampling,
+                                       'frames_per_cue': public_config.frames_per_cue,
+                                       'max_frames_per_video': public_config.max_frames_per_video,
+                                       'face_top_k': public_config.face_top_k,
+                                       'analyze_actions': public_config.analyze_actions,
+                                       'detector_backend': public_config.detector_backend,
+                                       'cascade_detector': public_config.cascade_detector,
+                                       'cascade_max_width': public_config.cascade_max_width,
+                                       'cascade_roi': public_config.cascade_roi,
+                                       'yunet_model_path': public_config.yunet_model_path,
+                                       'frame_dedup': public_config.frame_dedup,
+                                       'dedup_hash_distance': public_config.dedup_hash_distance,
+                                       'crop_format': public_config.crop_format,
+                                       'crop_quality': public_config.crop_quality,
+                                       'crop_png_compression': public_config.crop_png_compression,
+                                       'crop_storage': public_config.crop_storage,
+                                       'crop_shard_size': public_config.crop_shard_size,
+                                       'results_file': public_config.results_file,
+                                   })
+        checkpoint.load()
+
+        return checkpoint
+
+    @staticmethod
+    def capture_avatar_from_video(video_path, subtitle_times, avatar_output_path, frame_redundancy, target_size,
+                                  eye_diff_threshold, intervals=None, on_face=None, stream_source=None):
+        """
+        处理视频中字幕时间范围内的关键帧，返回人脸分析结果列表
+
+        指定 stream_source（StreamFrameSource）时从流式输入读取帧，字幕在处理过程中增量读取，
+        不记录进度，也不在内存中保留结果（返回空列表），结果只通过结果文件和 on_face 回调输出
+        """
+        FaceCaptureUtils.ensure_directory_exists(avatar_output_path)
+
+        public_config = FaceCaptureUtils.public_config
+        face_analyzer = FaceCaptureUtils.get_face_analyzer()
+        stats = PerfStats()
+
+        checkpoint = None
+        if stream_source is None:
+            checkpoint = FaceCaptureUtils.open_checkpoint(video_path=video_path,
+                                                          subtitle_times=subtitle_times,
+                                                          avatar_output_path=avatar_output_path,
+                                                          frame_redundancy=frame_redundancy,
+                                                          target_size=target_size,
+                                                          eye_diff_threshold=eye_diff_threshold,
+                                                          intervals=intervals)
+
+        # 分片共用一个结果文件和分卷目录，由分片前的主进程处理
+        if intervals is None:
+            FaceCaptureUtils.prepare_outputs(avatar_output_path=avatar_output_path, checkpoints=[checkpoint])
+
+        # 解码帧复用池中的缓冲区，裁剪图保持为帧的视图直到写图；跟踪模式的最佳人脸保留到处理结束，仍复制裁剪图
+        buffer_pool = FrameBufferPool(
+            max_buffers=public_config.frame_buffer_pool) if public_config.frame_buffer_pool > 0 else None
+        copy_crop = buffer_pool is None or public_config.face_tracking
+
+        if stream_source is None:
+            planner = FramePlanner(video_path=video_path,
+                                   subtitle_times=subtitle_times,
+                                   frame_redundancy=frame_redundancy,
+                                   intervals=intervals,
+                                   sampling=public_config.frame_sampling,
+                                   frames_per_cue=public_config.frames_per_cue,
+                                   frame_budget=public_config.max_frames_per_video)
+            subtitle_index = SubtitleIndex(subtitle_times)
+
+            # 在同一次解码过程中直接获取字幕对应的关键帧图像，解码、推理和写图分别在不同线程中执行
+            frame_source = FaceCaptureUtils.iter_keyframes_from_subtitle_ranges(video_path=video_path,
+                                                                               subtitle_times=subtitle_times,
+                                                                               frame_redundancy=frame_redundancy,
+                                                                               intervals=intervals,
+                                                                               checkpoint=checkpoint,
+                                                                               planner=planner,
+                                                                               stats=stats,
+                                                                               buffer_pool=buffer_pool)
+        else:
+            # 流式输入的帧率在开始解码后才能确定，生成结果记录时再读取
+            planner = stream_source
+            subtitle_index = stream_source.subtitle_index
+            frame_source = stream_source.iter_frames(stats=stats, buffer_pool=buffer_pool)
+
+        crop_writer = CropWriter.open(storage=public_config.crop_storage,
+                                      output_path=avatar_output_path,
+                                      image_format=public_config.crop_format,
+                                      quality=public_config.crop_quality,
+                                      png_compression=public_config.crop_png_compression,
+                                      target_size=target_size,
+                                      shard_size=public_config.crop_shard_size)
+
+        # 每个人脸写图完成后立即输出结果记录
+        results_sink = FaceCaptureUtils.open_results_sink(avatar_output_path=avatar_output_path)
+
+        frame_deduplicator = FrameDeduplicator(
+            max_distance=public_config.dedup_hash_distance) if public_config.frame_dedup else None
+        result_cache = FaceCaptureUtils.get_result_cache()
+
+        # 按字幕只保留质量最高的人脸，跟踪模式下每个身份已只保留一张最佳人脸
+        face_ranker = None
+        if public_config.face_top_k > 0 and not public_config.face_tracking:
+            face_ranker = FaceRanker(top_k=public_config.face_top_k,
+                                     target_size=target_size,
+                                     subtitle_index=subtitle_index,
+                                     frame_redundancy=frame_redundancy)
+
+        def begin_frames(frames):
+            """记录各帧等待写图的人脸数量，返回需要属性分析的人脸列表"""
+            pending_faces = []
+            for released_frame, released_faces in frames:
+                if checkpoint is not None:
+                    checkpoint.begin_frame(frame_count=released_frame, face_count=len(released_faces))
+                pending_faces.extend(released_faces)
+
+            return pending_faces
+
+        def detect(frame_count, frame):
+            faces = FaceCaptureUtils.capture_avatar_from_frame(frame_count=frame_count,
+                                                               frame=frame,
+                                                               eye_diff_threshold=eye_diff_threshold,
+                                                               frame_deduplicator=frame_deduplicator,
+                                                               result_cache=result_cache,
+                                                               stats=stats,
+                                                               copy_crop=copy_crop)
+            # 检测出错的帧不记录到进度中，恢复运行时重新处理
+            if faces is None:
+                return []
+
+            if face_ranker is None:
+                return begin_frames([(frame_count, faces)])
+
+            # 字幕结束后才释放该字幕保留的人脸，各帧在释放时才记录等待写图的人脸数量
+            with stats.timer('rank', count=len(faces)):
+                frames = face_ranker.add(frame_count=frame_count, fps=planner.fps, faces=faces)
+
+            return begin_frames(frames)
+
+        drain = None
+        idle = None
+        if face_ranker is not None:
+            def drain():
+                return begin_frames(face_ranker.flush())
+
+            # 流式输入中断一段时间时，不等待下一帧，按流的时间释放已经结束的字幕
+            if stream_source is not None:
+                def idle():
+                    # 先读取时间下限再确认帧队列为空，读取之前产出的帧如果还没有检测，一定仍在队列中
+                    watermark = stream_source.watermark
+                    if watermark is None or not pipeline.frame_queue.empty():
+                        return []
+
+                    return begin_frames(face_ranker.expire(timestamp=watermark, fps=stream_source.fps))
+
+        def write(face):
+            result = FaceCaptureUtils.write_face(face=face,
+                                                 crop_writer=crop_writer,
+                                                 target_size=target_size,
+                                                 stats=stats)
+            if result is not None and results_sink is not None:
+                results_sink.write(FaceCaptureUtils.build_face_record(face=face,
+                                                                      result=result,
+                                                                      video_path=video_path,
+                                                                      fps=planner.fps,
+                                                                      subtitle_index=subtitle_index))
+            if checkpoint is not None:
+                checkpoint.face_done(frame_count=face['frame_count'], face_index=face['face_index'], result=result)
+
+            return result
+
+        def analyze(faces):
+            return FaceCaptureUtils.analyze_faces(faces=faces, result_cache=result_cache, stats=stats)
+
+        finish = None
+
+        # 跟踪模式下只分析新轨迹或变化较大的人脸，处理完成后每个身份只保存一张最佳人脸
+        if public_config.face_tracking:
+            face_tracker = FaceTracker(iou_threshold=public_config.track_iou_threshold,
+                                       similarity_threshold=public_config.track_similarity_threshold,
+                                       reanalyze_similarity=public_config.track_reanalyze_similarity,
+                                       max_frame_gap=public_config.track_max_gap)
+
+            def detect(frame_count, frame):
+                faces = FaceCaptureUtils.capture_avatar_from_frame(frame_count=frame_count,
+                                                                   frame=frame,
+                                                                   eye_diff_threshold=eye_diff_threshold,
+                                                                   frame_deduplicator=frame_deduplicator,
+                                                                   result_cache=result_cache,
+                                                                   stats=stats)
+                if faces is None:
+                    faces = []
+
+                with stats.timer('embed', count=len(faces)):
+                    faces = face_analyzer.embed(faces)
+
+                return face_tracker.update(frame_count=frame_count, faces=faces)
+
+            def analyze(faces):
+                FaceCaptureUtils.analyze_faces(faces=faces, result_cache=result_cache, stats=stats)
+                face_tracker.release_analyzed(faces)
+                return []
+
+            def finish():
+                return FaceCaptureUtils.finish_tracking(face_tracker=face_tracker,
+                                                        avatar_output_path=avatar_output_path,
+                                                        crop_writer=crop_writer)
+
+        pipeline = FacePipeline(
+            frame_source=frame_source,
+            detect=detect,
+            analyze=analyze,
+            write=write,
+            batch_size=face_analyzer.batch_size,
+            frame_queue_size=public_config.frame_queue_size,
+            write_queue_size=public_config.write_queue_size,
+            writer_workers=public_config.writer_workers,
+            on_result=on_face,
+            finish=finish,
+            keep_results=stream_source is None,
+            drain=drain,
+            idle=idle)
+
+        try:
+            detected_faces = pipeline.run()
         finally:
-            cap.release()
+            if checkpoint is not None:
+                checkpoint.close()
+            if results_sink is not None:
+                results_sink.close()
+            crop_writer.close()
+
+        # 从进度记录恢复时，结果包括之前运行已完成的帧
+        if checkpoint is not None:
+            detected_faces = checkpoint.completed_results()
+
+        if frame_deduplicator is not None:
+            frame_deduplicator.log_summary()
+
+        if face_analyzer.cascade is not None:
+            face_analyzer.cascade.log_summary()
+
+        if result_cache is not None:
+            result_cache.log_summary()
+
+        if buffer_pool is not None:
+            buffer_pool.log_summary()
+            stats.count('frame_buffers_allocated', buffer_pool.allocated_count)
+            stats.count('frame_buffers_overflow', buffer_pool.overflow_count)
+
+        if face_ranker is not None:
+            face_ranker.log_summary()
+            stats.count('faces_rejected_rank', face_ranker.dropped_count)
+
+        FaceCaptureUtils.write_perf_report(stats=stats,
+                                           avatar_output_path=avatar_output_path,
+                                           video_path=video_path,
+                                           intervals=intervals)
 
         return detected_faces
+
+    @staticmethod
+    def capture_avatar_from_files(video_path, sub_path, avatar_output_path, intervals=None):
+        """按公共配置处理一组视频和字幕文件，返回人脸分析结果列表，指定 intervals 时只处理这些帧区间"""
+        public_config = FaceCaptureUtils.public_config
+        subtitle_times = FaceCaptureUtils.parse_subtitles(str(sub_path))
+
+        return FaceCaptureUtils.capture_avatar_from_video(video_path=Path(video_path),
+                                                          subtitle_times=subtitle_times,
+                                                          avatar_output_path=Path(avatar_output_path),
+                                                          frame_redundancy=public_config.frame_redundancy,
+                                                          target_size=(public_config.image_width,
+                                                                       public_config.image_height),
+                                                          eye_diff_threshold=public_config.eye_diff_threshold,
+                                                          intervals=intervals)
+
+    @staticmethod
+    def capture_avatar_from_stream(video_url, sub_path, avatar_output_path):
+        """
+        按公共配置处理流式输入，直到输入结束或收到终止信号
+
+        参数:
+            video_url: 视频地址，- 表示标准输入，也可以是命名管道、正在写入的文件或 PyAV 支持的网络地址
+            sub_path: 正在写入的字幕文件路径
+            avatar_output_path: 输出目录
+        """
+        public_config = FaceCaptureUtils.public_config
+
+        # 身份聚类需要在输入结束后才能完成，且轨迹随流的长度增长
+        if public_config.face_tracking:
+            hlog.warning('流式输入不支持人脸跟踪，已关闭')
+            public_config.face_tracking = False
+
+        stream_source = StreamFrameSource(video_url=video_url,
+                                          sub_path=sub_path,
+                                          frame_redundancy=public_config.frame_redundancy,
+                                          subtitle_delay=public_config.stream_subtitle_delay,
+                                          poll_interval=public_config.stream_poll_interval,
+                                          idle_timeout=public_config.stream_idle_timeout)
+
+        return FaceCaptureUtils.capture_avatar_from_video(video_path=video_url,
+                                                          subtitle_times=None,
+                                                          avatar_output_path=Path(avatar_output_path),
+                                                          frame_redundancy=public_config.frame_redundancy,
+                                                          target_size=(public_config.image_width,
+                                                                       public_config.image_height),
+                                                          eye_diff_threshold=public_config.eye_diff_threshold,
+                                                          stream_source=stream_source)
@@ -0,0 +1,75 @@
+import sys
+import threading
+
+import numpy as np
+from av.video.reformatter import VideoReformatter
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class FrameBufferPool:
+    """
+    解码帧的可复用缓冲区池
+
+    解码帧仍由 FFmpeg（libswscale）转换为 BGR，像素与 frame.to_ndarray(format='bgr24') 完全相同，
+    转换结果复制到池中空闲的缓冲区；PyAV 不支持转换到指定的缓冲区，FFmpeg 的转换结果仍每帧分配一次，
+    因此每帧比不使用缓冲区池多复制一次整帧，默认关闭（frame_buffer_pool = 0）；人脸裁剪图是帧缓冲区的视图，
+    缓冲区是否空闲通过引用计数判断（除池本身外没有数组或视图引用时即可复用），各处理阶段不需要显式归还；
+    所有缓冲区都被占用且已达到数量上限时临时分配，用完后由内存回收，不放回池中
+    """
+
+    def __init__(self, max_buffers):
+        """
+        参数:
+            max_buffers: 池中最多保留的缓冲区数量
+        """
+        self.max_buffers = max_buffers
+        self.buffers = []
+        # 复用 libswscale 转换上下文，帧尺寸和像素格式不变时不再重新创建
+        self.reformatter = VideoReformatter()
+        self.lock = threading.Lock()
+        self.allocated_count = 0
+        self.reused_count = 0
+        self.overflow_count = 0
+
+    def acquire(self, shape):
+        """获取一个空闲的缓冲区，内容未初始化"""
+        with self.lock:
+            # 帧尺寸变化后旧的缓冲区不再使用
+            if self.buffers and self.buffers[0].shape != shape:
+                self.buffers = []
+
+            for index in range(len(self.buffers)):
+                # 只有列表和 getrefcount 的参数引用时为空闲
+                if sys.getrefcount(self.buffers[index]) <= 2:
+                    self.reused_count += 1
+                    return self.buffers[index]
+
+            buffer = np.empty(shape, dtype=np.uint8)
+            if len(self.buffers) < self.max_buffers:
+                self.buffers.append(buffer)
+                self.allocated_count += 1
+            else:
+                self.overflow_count += 1
+
+            return buffer
+
+    def to_bgr(self, frame):
+        """将解码帧转换为 BGR 格式的 ndarray，结果从 FFmpeg 分配的帧复制到池中复用的缓冲区"""
+        bgr_frame = self.reformatter.reformat(frame, format='bgr24')
+        width, height = bgr_frame.width, bgr_frame.height
+
+        # 去掉每行末尾的对齐填充
+        plane = bgr_frame.planes[0]
+        source = np.frombuffer(plane, dtype=np.uint8).reshape(height, plane.line_size)[:, :width * 3]
+
+        image = self.acquire((height, width, 3))
+        np.copyto(image, source.reshape(height, width, 3))
+
+        return image
+
+    def log_summary(self):
+        hlog.info('帧缓冲区池: 缓冲区 %s 个，复用 %s 次，超出上限临时分配 %s 次' % (
+            self.allocated_count, self.reused_count, self.overflow_count))
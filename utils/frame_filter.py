@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class FrameDeduplicator:
+    """
+    近似重复帧过滤
+
+    对每帧计算缩小后的差值哈希（dHash），与上一次实际做过人脸检测的帧比较，
+    汉明距离不超过阈值时跳过检测，直接复用该帧的检测结果
+    """
+
+    # dHash 缩放尺寸（宽 9 高 8，相邻像素比较后得到 64 位哈希）
+    HASH_SIZE = (9, 8)
+
+    def __init__(self, max_distance):
+        """
+        参数:
+            max_distance: 与上次检测帧的哈希汉明距离不超过该值时视为重复帧，取值 0-64
+        """
+        self.max_distance = max_distance
+        self.last_hash = None
+        self.last_faces = None
+        self.checked_count = 0
+        self.skipped_count = 0
+
+    @staticmethod
+    def frame_hash(frame):
+        """计算 BGR 图像的 64 位差值哈希"""
+        small = cv2.resize(frame, FrameDeduplicator.HASH_SIZE, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        bits = gray[:, 1:] > gray[:, :-1]
+
+        return int.from_bytes(np.packbits(bits).tobytes(), byteorder='big')
+
+    def lookup(self, frame):
+        """
+        判断帧是否与上次检测帧近似重复
+
+        返回:
+            (帧哈希, 可复用的检测结果)，不可复用时检测结果为 None
+        """
+        self.checked_count += 1
+        current_hash = FrameDeduplicator.frame_hash(frame)
+
+        if self.last_hash is not None and (current_hash ^ self.last_hash).bit_count() <= self.max_distance:
+            self.skipped_count += 1
+            # 复制人脸字典，后续阶段会在人脸上写入帧号、裁剪图和属性结果
+            return current_hash, [dict(face) for face in self.last_faces]
+
+        return current_hash, None
+
+    def remember(self, frame_hash, faces):
+        """记录实际做过检测的帧的哈希和检测结果"""
+        self.last_hash = frame_hash
+        self.last_faces = [dict(face) for face in faces]
+
+    def log_summary(self):
+        saved = self.skipped_count / self.checked_count * 100 if self.checked_count else 0.0
+        hlog.info('近似重复帧过滤完成，检查帧数: %s，跳过帧数: %s，人脸检测调用: %s 次（节省 %.1f%%）' % (
+            self.checked_count, self.skipped_count, self.checked_count - self.skipped_count, saved))
@@ -0,0 +1,476 @@
+import bisect
+import time
+
+import av
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class FramePlanner:
+    """
+    基于区间的选帧规划器
+
+    将字幕时间范围合并为有序、不重叠的帧区间，通过解复用（不解码）读取数据包的关键帧标记来确定关键帧，
+    并按区间直接定位到目标位置，不再遍历整个视频；
+    除处理区间内的全部关键帧外，也可以按字幕固定采样帧数，使处理量只与字幕数有关，而不取决于视频的关键帧间隔
+    """
+
+    # keyframes: 区间内的全部关键帧；uniform: 每条字幕均匀采样；adaptive: 每条字幕按运动量采样
+    SAMPLING_MODES = ('keyframes', 'uniform', 'adaptive')
+
+    def __init__(self, video_path, subtitle_times, frame_redundancy, seek_threshold=None, intervals=None,
+                 sampling='keyframes', frames_per_cue=3, frame_budget=0):
+        """
+        参数:
+            video_path: 视频文件路径
+            subtitle_times: 字幕时间列表，格式为 [(start_time, end_time), ...]
+            frame_redundancy: 字幕时间前后需要额外检查的帧数
+            seek_threshold: 与下一个目标帧的距离超过该帧数时执行定位，否则继续顺序解码，默认为 1 秒的帧数
+            intervals: 直接指定的帧区间列表，用于分片处理，为 None 时根据字幕时间计算
+            sampling: 采样方式，见 SAMPLING_MODES
+            frames_per_cue: uniform/adaptive 方式下每条字幕的采样帧数
+            frame_budget: 整个视频最多处理的帧数，0 表示不限制；分片处理时按分片包含的字幕数比例分配
+        """
+        if sampling not in FramePlanner.SAMPLING_MODES:
+            raise ValueError('无效的采样方式：%s' % sampling)
+
+        self.video_path = str(video_path)
+
+        with av.open(self.video_path) as container:
+            stream = container.streams.video[0]
+            self.fps = float(stream.average_rate)
+            self.total_frames = stream.frames
+            self.time_base = stream.time_base
+            self.start_pts = stream.start_time or 0
+
+        self.seek_threshold = int(self.fps) if seek_threshold is None else seek_threshold
+        if intervals is None:
+            intervals = FramePlanner.build_intervals(subtitle_times=subtitle_times,
+                                                     fps=self.fps,
+                                                     frame_redundancy=frame_redundancy,
+                                                     total_frames=self.total_frames)
+
+        self.intervals = FramePlanner.merge_intervals(intervals)
+        self._interval_starts = [start for start, _ in self.intervals]
+
+        self.sampling = sampling
+        self.frames_per_cue = frames_per_cue
+
+        # 字幕本身（不含冗余帧）的帧区间，分片处理时每条字幕只属于中点所在的分片
+        cue_ranges = FramePlanner.build_cue_ranges(subtitle_times=subtitle_times or (),
+                                                   fps=self.fps,
+                                                   total_frames=self.total_frames)
+        self.cue_ranges = [(start, end) for start, end in cue_ranges if self.contains((start + end) // 2)]
+        if not cue_ranges:
+            self.cue_ranges = list(self.intervals)
+
+        self.frame_budget = frame_budget
+        if frame_budget > 0 and cue_ranges and len(self.cue_ranges) < len(cue_ranges):
+            self.frame_budget = max(1, round(frame_budget * len(self.cue_ranges) / len(cue_ranges)))
+
+    @staticmethod
+    def time_to_seconds(time_str):
+        """将字幕时间字符串 (hh:mm:ss,ms) 转换为秒数"""
+        seconds, milliseconds = time_str.split(',')
+        h, m, s = map(int, seconds.split(':'))
+        return h * 3600 + m * 60 + s + int(milliseconds) / 1000
+
+    @staticmethod
+    def merge_intervals(ranges):
+        """将闭区间列表 [(start, end), ...] 排序并合并重叠或相邻的区间"""
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+
+        return merged
+
+    @staticmethod
+    def build_intervals(subtitle_times, fps, frame_redundancy, total_frames=0):
+        """
+        将字幕时间范围转换为合并后的帧区间
+
+        参数:
+            subtitle_times: 字幕时间列表，格式为 [(start_time, end_time), ...]
+            fps: 视频帧率
+            frame_redundancy: 字幕时间前后需要额外检查的帧数
+            total_frames: 视频总帧数，未知时为 0，此时不限制区间结尾
+
+        返回:
+            帧号闭区间的有序列表 [(start_frame, end_frame), ...]
+        """
+        ranges = []
+        for start_time, end_time in subtitle_times:
+            start_frame = int(FramePlanner.time_to_seconds(start_time) * fps) - frame_redundancy
+            end_frame = int(FramePlanner.time_to_seconds(end_time) * fps) + frame_redundancy
+
+            if total_frames > 0:
+                end_frame = min(total_frames - 1, end_frame)
+
+            start_frame = max(0, start_frame)
+            if start_frame <= end_frame:
+                ranges.append((start_frame, end_frame))
+
+        return FramePlanner.merge_intervals(ranges)
+
+    @staticmethod
+    def build_cue_ranges(subtitle_times, fps, total_frames=0):
+        """
+        将每条字幕的时间范围转换为帧区间，不合并、不扩展冗余帧
+
+        返回:
+            按开始帧排序的帧号闭区间列表 [(start_frame, end_frame), ...]
+        """
+        ranges = []
+        for start_time, end_time in subtitle_times:
+            start_frame = max(0, int(FramePlanner.time_to_seconds(start_time) * fps))
+            end_frame = int(FramePlanner.time_to_seconds(end_time) * fps)
+
+            if total_frames > 0:
+                end_frame = min(total_frames - 1, end_frame)
+
+            if start_frame <= end_frame:
+                ranges.append((start_frame, end_frame))
+
+        return sorted(ranges)
+
+    @staticmethod
+    def allocate_budget(cue_count, frames_per_cue, frame_budget):
+        """
+        在字幕之间分配帧数预算
+
+        预算足够时每条字幕采样 frames_per_cue 帧；不足时平均分配，余数均匀分给各字幕；
+        预算少于字幕数时均匀选取部分字幕各采样 1 帧
+
+        返回:
+            每条字幕的采样帧数列表
+        """
+        if frame_budget <= 0 or cue_count * frames_per_cue <= frame_budget:
+            return [frames_per_cue] * cue_count
+
+        counts = [0] * cue_count
+        if frame_budget < cue_count:
+            for i in range(frame_budget):
+                counts[i * cue_count // frame_budget] = 1
+
+            return counts
+
+        base, extra = divmod(frame_budget, cue_count)
+        counts = [base] * cue_count
+        for i in range(extra):
+            counts[i * cue_count // extra] += 1
+
+        return counts
+
+    @staticmethod
+    def sample_range(start, end, count, keyframes=(), weights=None):
+        """
+        在帧区间内选取 count 个采样帧
+
+        按权重（为 None 时每帧权重相同）将区间分为 count 段，每段选择离该段中点最近的关键帧，
+        段内没有关键帧时选择中点所在的帧，尽量只解码关键帧
+
+        参数:
+            start: 区间开始帧号
+            end: 区间结束帧号（包含）
+            count: 采样帧数
+            keyframes: 关键帧号的有序列表
+            weights: 区间内每一帧的权重列表，长度为 end - start + 1
+
+        返回:
+            采样帧号的有序列表
+        """
+        frame_count = end - start + 1
+        if count <= 0 or frame_count <= 0:
+            return []
+
+        if weights is None:
+            weights = [1] * frame_count
+
+        cumulative = []
+        total = 0
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+
+        samples = set()
+        for i in range(count):
+            low = total * i / count
+            high = total * (i + 1) / count
+
+            first = start + min(frame_count - 1, bisect.bisect_right(cumulative, low))
+            last = start + min(frame_count - 1, bisect.bisect_left(cumulative, high))
+            middle = start + min(frame_count - 1, bisect.bisect_left(cumulative, (low + high) / 2))
+
+            position = bisect.bisect_left(keyframes, first)
+            candidates = keyframes[position:bisect.bisect_right(keyframes, last)]
+            if candidates:
+                samples.add(min(candidates, key=lambda frame: abs(frame - middle)))
+            else:
+                samples.add(middle)
+
+        return sorted(samples)
+
+    @staticmethod
+    def motion_weights(start, end, packets):
+        """
+        根据数据包大小估计区间内每一帧的运动量
+
+        帧间压缩的数据包越大，画面变化通常越大；关键帧的数据包大小与运动无关，按区间内帧间数据包的平均大小计算；
+        每帧再加上平均大小，使静止的片段也保留一定的采样
+
+        参数:
+            packets: 帧号到 (数据包大小, 是否为关键帧) 的字典
+        """
+        sizes = [packets.get(frame, (None, True)) for frame in range(start, end + 1)]
+        inter_sizes = [size for size, is_keyframe in sizes if not is_keyframe]
+        average = sum(inter_sizes) / len(inter_sizes) if inter_sizes else 1.0
+
+        return [(average if is_keyframe else size) + average for size, is_keyframe in sizes]
+
+    @staticmethod
+    def split_intervals(intervals, shard_count, whole_intervals=False):
+        """
+        将有序帧区间按帧数均分为若干个互不重叠的分片，必要时在区间内部切分
+
+        whole_intervals 为 True 时不在区间内部切分，只在区间之间切分，各分片帧数可能不均匀，分片数也可能少于 shard_count；
+        合并后的区间包含完整的字幕帧范围，按字幕保留前 K 个人脸时同一字幕的帧不会分到不同分片
+
+        返回:
+            分片列表，每个分片为帧区间列表，空分片会被丢弃
+        """
+        total = sum(end - start + 1 for start, end in intervals)
+        if total == 0 or shard_count <= 1:
+            return [list(intervals)] if intervals else []
+
+        shard_size = -(-total // shard_count)
+        shards = [[]]
+
+        if whole_intervals:
+            taken = 0
+            for start, end in intervals:
+                # 当前分片已达到均分的累计帧数时，从下一个区间开始新的分片
+                if shards[-1] and taken >= shard_size * len(shards):
+                    shards.append([])
+
+                shards[-1].append((start, end))
+                taken += end - start + 1
+
+            return shards
+
+        remaining = shard_size
+
+        for start, end in intervals:
+            while start <= end:
+                if remaining == 0:
+                    shards.append([])
+                    remaining = shard_size
+
+                take_end = min(end, start + remaining - 1)
+                shards[-1].append((start, take_end))
+                remaining -= take_end - start + 1
+                start = take_end + 1
+
+        return [shard for shard in shards if shard]
+
+    def contains(self, frame_index):
+        """判断帧号是否位于任一区间内"""
+        pos = bisect.bisect_right(self._interval_starts, frame_index) - 1
+        return pos >= 0 and frame_index <= self.intervals[pos][1]
+
+    def pts_to_frame(self, pts):
+        return int(round(float((pts - self.start_pts) * self.time_base) * self.fps))
+
+    def frame_to_pts(self, frame_index):
+        return int(frame_index / self.fps / self.time_base) + self.start_pts
+
+    def scan_keyframes(self, packets=None):
+        """
+        只解复用不解码，根据数据包的关键帧标记找出各区间内的关键帧
+
+        参数:
+            packets: 不为 None 时，记录扫描过的每一帧（包括定位后区间之前的帧）的 (数据包大小, 是否为关键帧)，键为帧号
+
+        返回:
+            keyframes: 关键帧号的有序列表
+        """
+        keyframes = []
+        if not self.intervals:
+            return keyframes
+
+        with av.open(self.video_path) as container:
+            stream = container.streams.video[0]
+            position = -1
+            interval_index = 0
+            sought_index = None
+
+            while interval_index < len(self.intervals):
+                # 与下一区间间隔较大时直接定位，跳过中间不含字幕的部分
+                start = self.intervals[interval_index][0]
+                if start > position + self.seek_threshold and sought_index != interval_index:
+                    container.seek(self.frame_to_pts(start), stream=stream, backward=True, any_frame=False)
+                    sought_index = interval_index
+
+                for packet in container.demux(stream):
+                    if packet.pts is None or packet.dts is None:
+                        continue
+
+                    frame_index = self.pts_to_frame(packet.pts)
+                    position = self.pts_to_frame(packet.dts)
+
+                    if packet.is_keyframe and self.contains(frame_index):
+                        keyframes.append(frame_index)
+                    if packets is not None:
+                        packets[frame_index] = (packet.size, packet.is_keyframe)
+
+                    # 解码顺序时间戳已超出区间，后续数据包不会再落入该区间
+                    while interval_index < len(self.intervals) and position > self.intervals[interval_index][1]:
+                        interval_index += 1
+
+                    if interval_index == len(self.intervals):
+                        break
+
+                    if self.intervals[interval_index][0] > position + self.seek_threshold \
+                            and sought_index != interval_index:
+                        break
+                else:
+                    # 已到达视频结尾
+                    break
+
+        return sorted(set(keyframes))
+
+    def plan_frames(self, packets=None):
+        """
+        按采样方式确定需要解码的帧
+
+        参数:
+            packets: 不为 None 时记录扫描过的数据包，见 scan_keyframes
+
+        返回:
+            帧号的有序列表，frame_budget 大于 0 时不超过该帧数
+        """
+        if packets is None and self.sampling == 'adaptive':
+            packets = {}
+
+        keyframes = self.scan_keyframes(packets=packets)
+        if self.sampling == 'keyframes':
+            if 0 < self.frame_budget < len(keyframes):
+                keyframes = [keyframes[i * len(keyframes) // self.frame_budget] for i in range(self.frame_budget)]
+
+            return keyframes
+
+        counts = FramePlanner.allocate_budget(cue_count=len(self.cue_ranges),
+                                              frames_per_cue=self.frames_per_cue,
+                                              frame_budget=self.frame_budget)
+
+        frames = set()
+        for (start, end), count in zip(self.cue_ranges, counts):
+            weights = FramePlanner.motion_weights(start=start, end=end, packets=packets) \
+                if self.sampling == 'adaptive' else None
+            frames.update(FramePlanner.sample_range(start=start,
+                                                    end=end,
+                                                    count=count,
+                                                    keyframes=keyframes,
+                                                    weights=weights))
+
+        return sorted(frames)
+
+    def estimate_decoded_frames(self, frame_numbers, packets):
+        """
+        按 iter_frames 的定位规则估计需要解码的总帧数
+
+        参数:
+            frame_numbers: 需要处理的帧号有序列表
+            packets: plan_frames 记录的数据包，用于查找目标帧之前最近的关键帧
+
+        返回:
+            预计解码的帧数，定位后从目标帧之前的关键帧开始解码
+        """
+        keyframes = sorted(frame for frame, (_, is_keyframe) in packets.items() if is_keyframe)
+        decoded = 0
+        position = -1
+
+        for target in frame_numbers:
+            if target > position + self.seek_threshold:
+                index = bisect.bisect_right(keyframes, target) - 1
+                position = keyframes[index] - 1 if index >= 0 else -1
+
+            decoded += target - position
+            position = target
+
+        return decoded
+
+    def iter_frames(self, frame_numbers, stats=None, buffer_pool=None):
+        """
+        按帧号顺序解码并产出指定帧的图像，距离较远时直接定位到目标帧之前的关键帧
+
+        参数:
+            frame_numbers: 需要解码的帧号有序列表
+            stats: 性能统计 PerfStats，记录定位和解码耗时（不包括等待下游处理的时间）以及解码帧数
+            buffer_pool: 帧缓冲区池 FrameBufferPool，指定时图像转换到池中复用的缓冲区
+
+        返回:
+            生成器，按帧号顺序产出 (帧号, BGR 格式的 ndarray)
+        """
+        if not frame_numbers:
+            return
+
+        with av.open(self.video_path) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = 'AUTO'
+
+            pending = iter(frame_numbers)
+            target = next(pending)
+            position = -1
+            resume_time = time.perf_counter()
+
+            while target is not None:
+                if target > position + self.seek_threshold:
+                    seek_time = time.perf_counter()
+                    container.seek(self.frame_to_pts(target), stream=stream, backward=True, any_frame=False)
+
+                    if stats is not None:
+                        stats.add_time(stage='decode', seconds=seek_time - resume_time, count=0)
+                        resume_time = time.perf_counter()
+                        stats.add_time(stage='seek', seconds=resume_time - seek_time)
+
+                for frame in container.decode(stream):
+                    if frame.pts is None:
+                        continue
+
+                    position = self.pts_to_frame(frame.pts)
+                    if stats is not None:
+                        stats.count('frames_decoded')
+
+                    while target is not None and target < position:
+                        hlog.warning('第 %s 帧无法准确定位，跳过' % target)
+                        if stats is not None:
+                            stats.count('frames_seek_missed')
+                        target = next(pending, None)
+
+                    if target is None:
+                        break
+
+                    if position == target:
+                        if buffer_pool is not None:
+                            image = buffer_pool.to_bgr(frame)
+                        else:
+                            image = frame.to_ndarray(format='bgr24')
+                        if stats is not None:
+                            stats.add_time(stage='decode', seconds=time.perf_counter() - resume_time)
+
+                        yield position, image
+
+                        resume_time = time.perf_counter()
+                        target = next(pending, None)
+
+                        # 下一个目标距离较远，跳出顺序解码重新定位
+                        if target is None or target > position + self.seek_threshold:
+                            break
+                else:
+                    # 已到达视频结尾
+                    break
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class PerfStats:
+    """
+    运行性能统计
+
+    按阶段累计耗时和调用次数，并记录帧和人脸的计数；流水线各线程共享同一个实例，
+    运行结束后输出 JSON 运行报告，并可输出 Prometheus 文本格式的指标文件（node_exporter textfile collector）
+    """
+
+    METRIC_PREFIX = 'face_capture'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+
+    def add_time(self, stage, seconds, count=1):
+        """累计一个阶段的耗时和处理数量"""
+        with self.lock:
+            total = self.stages.setdefault(stage, [0.0, 0])
+            total[0] += seconds
+            total[1] += count
+
+    @contextmanager
+    def timer(self, stage, count=1):
+        """统计 with 语句块的耗时"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage=stage, seconds=time.perf_counter() - start_time, count=count)
+
+    def count(self, name, value=1):
+        """累加计数"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self, **extra):
+        """
+        生成运行报告
+
+        参数:
+            extra: 附加到报告中的字段，如视频路径
+
+        返回:
+            包含总耗时、各阶段耗时（秒、次数、平均毫秒）和计数的字典
+        """
+        with self.lock:
+            stages = {stage: {'seconds': round(seconds, 4),
+                              'count': count,
+                              'avg_ms': round(seconds / count * 1000, 3) if count else None}
+                      for stage, (seconds, count) in self.stages.items()}
+            counters = dict(self.counters)
+
+        return dict(extra,
+                    wall_seconds=round(time.perf_counter() - self.start_time, 4),
+                    stages=stages,
+                    counters=counters)
+
+    def write_report(self, path, **extra):
+        """保存 JSON 运行报告"""
+        report = self.report(**extra)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+        hlog.info('运行报告已保存到: %s' % path)
+
+        return report
+
+    def write_prometheus(self, path, labels):
+        """
+        保存 Prometheus 文本格式的指标，先写临时文件再替换，采集方不会读到不完整的文件
+
+        参数:
+            path: 指标文件路径
+            labels: 附加到每个指标上的标签字典
+        """
+        report = self.report()
+        label_text = ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                              for key, value in labels.items())
+        prefix = PerfStats.METRIC_PREFIX
+
+        def with_labels(extra=''):
+            text = ','.join(item for item in (label_text, extra) if item)
+            return '{%s}' % text if text else ''
+
+        lines = [
+            '# HELP %s_wall_seconds 最近一次运行的总耗时' % prefix,
+            '# TYPE %s_wall_seconds gauge' % prefix,
+            '%s_wall_seconds%s %s' % (prefix, with_labels(), report['wall_seconds']),
+            '# HELP %s_stage_seconds_total 各阶段累计耗时' % prefix,
+            '# TYPE %s_stage_seconds_total counter' % prefix,
+        ]
+        for stage, total in sorted(report['stages'].items()):
+            lines.append('%s_stage_seconds_total%s %s' % (prefix, with_labels('stage="%s"' % stage), total['seconds']))
+
+        lines += [
+            '# HELP %s_stage_calls_total 各阶段处理次数' % prefix,
+            '# TYPE %s_stage_calls_total counter' % prefix,
+        ]
+        for stage, total in sorted(report['stages'].items()):
+            lines.append('%s_stage_calls_total%s %s' % (prefix, with_labels('stage="%s"' % stage), total['count']))
+
+        for name, value in sorted(report['counters'].items()):
+            lines += [
+                '# TYPE %s_%s_total counter' % (prefix, name),
+                '%s_%s_total%s %s' % (prefix, name, with_labels(), value),
+            ]
+
+        path = Path(path)
+        temp_path = path.with_name('.%s.tmp' % path.name)
+        temp_path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        os.replace(temp_path, path)
+
+    def log_summary(self):
+        """输出各阶段耗时和计数"""
+        report = self.report()
+        stages = '，'.join('%s %.3f 秒/%s 次' % (stage, total['seconds'], total['count'])
+                          for stage, total in report['stages'].items())
+        counters = '，'.join('%s: %s' % (name, value) for name, value in sorted(report['counters'].items()))
+
+        hlog.info('运行耗时: %.3f 秒，各阶段: %s' % (report['wall_seconds'], stages))
+        hlog.info('运行计数: %s' % counters)
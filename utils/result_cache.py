@@ -0,0 +1,172 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class ResultCache:
+    """
+    按帧内容寻址的检测与属性分析结果缓存
+
+    缓存键由解码后的帧内容和检测/分析模型标识计算，保存每帧检测到的人脸位置、置信度、对齐人脸图像和属性分析结果；
+    跨运行、跨视频共享，超过容量时按最近最少使用（LRU）的顺序淘汰
+    """
+
+    DB_FILE = 'face_result_cache.sqlite3'
+
+    def __init__(self, cache_dir, max_bytes, model_identity):
+        """
+        参数:
+            cache_dir: 缓存目录
+            max_bytes: 缓存最大容量（字节）
+            model_identity: 检测与分析模型标识，模型或检测参数变化时缓存自动失效
+        """
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.model_identity = model_identity.encode('utf-8')
+        self.hit_count = 0
+        self.miss_count = 0
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(str(Path(cache_dir) / ResultCache.DB_FILE), check_same_thread=False,
+                                  timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS frames ('
+                        'key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS faces ('
+                        'key TEXT NOT NULL, face_index INTEGER NOT NULL, region TEXT NOT NULL, '
+                        'face_confidence REAL NOT NULL, aligned BLOB, attributes TEXT, '
+                        'PRIMARY KEY (key, face_index))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS frames_last_access ON frames (last_access)')
+        self.db.commit()
+
+    def frame_key(self, frame):
+        """根据帧内容、尺寸和模型标识计算缓存键"""
+        digest = hashlib.blake2b(self.model_identity, digest_size=20)
+        digest.update(str(frame.shape).encode('utf-8'))
+        digest.update(np.ascontiguousarray(frame).data)
+
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        读取一帧的缓存结果
+
+        返回:
+            人脸列表（与 FaceAnalyzer.detect 格式相同，已分析过的人脸附带属性结果），未命中时返回 None
+        """
+        with self.lock:
+            updated = self.db.execute('UPDATE frames SET last_access = ? WHERE key = ?', (time.time(), key))
+            if updated.rowcount == 0:
+                self.miss_count += 1
+                return None
+
+            rows = self.db.execute('SELECT region, face_confidence, aligned, attributes FROM faces '
+                                   'WHERE key = ? ORDER BY face_index', (key,)).fetchall()
+            self.db.commit()
+            self.hit_count += 1
+
+        faces = []
+        for region, face_confidence, aligned, attributes in rows:
+            if aligned is not None:
+                # 对齐人脸按 RGB 保存，与 DeepFace.extract_faces 的输出保持一致
+                aligned = cv2.imdecode(np.frombuffer(aligned, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+                aligned = aligned.astype(np.float32) / 255.0
+
+            face = {
+                'region': json.loads(region),
+                'face_confidence': face_confidence,
+                'face': aligned,
+            }
+            if attributes:
+                face.update(json.loads(attributes))
+
+            faces.append(face)
+
+        return faces
+
+    def put_faces(self, key, faces):
+        """保存一帧的检测结果"""
+        rows = []
+        size = 0
+        for face_index, face in enumerate(faces):
+            # 未检测到人脸时 DeepFace 返回置信度为 0 的整张图像，不保存图像内容
+            encoded = None
+            if face['face_confidence'] > 0:
+                aligned = np.clip(np.asarray(face['face']) * 255.0, 0, 255).astype(np.uint8)
+                encoded = cv2.imencode('.png', aligned)[1].tobytes()
+
+            region = json.dumps(face['region'])
+            rows.append((key, face_index, region, float(face['face_confidence']), encoded))
+            size += len(encoded or b'') + len(region)
+
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO frames (key, size, last_access) VALUES (?, ?, ?)',
+                            (key, size, time.time()))
+            self.db.execute('DELETE FROM faces WHERE key = ?', (key,))
+            self.db.executemany('INSERT INTO faces (key, face_index, region, face_confidence, aligned) '
+                                'VALUES (?, ?, ?, ?, ?)', rows)
+            self.db.commit()
+
+        self.evict()
+
+    def put_attributes(self, key, face_index, attributes):
+        """保存一个人脸的属性分析结果，与已缓存的属性合并"""
+        with self.lock:
+            row = self.db.execute('SELECT attributes FROM faces WHERE key = ? AND face_index = ?',
+                                  (key, face_index)).fetchone()
+            if row is None:
+                return
+
+            merged = json.loads(row[0]) if row[0] else {}
+            merged.update(attributes)
+            encoded = json.dumps(merged, ensure_ascii=False)
+
+            self.db.execute('UPDATE faces SET attributes = ? WHERE key = ? AND face_index = ?',
+                            (encoded, key, face_index))
+            self.db.execute('UPDATE frames SET size = size + ? WHERE key = ?', (len(encoded), key))
+            self.db.commit()
+
+    def evict(self):
+        """缓存超过容量时按最近最少使用的顺序淘汰"""
+        with self.lock:
+            total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM frames').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            evicted = []
+            for key, size in self.db.execute('SELECT key, size FROM frames ORDER BY last_access'):
+                if total <= self.max_bytes * 0.9:
+                    break
+
+                evicted.append((key,))
+                total -= size
+
+            self.db.executemany('DELETE FROM faces WHERE key = ?', evicted)
+            self.db.executemany('DELETE FROM frames WHERE key = ?', evicted)
+            self.db.commit()
+
+        hlog.debug('结果缓存淘汰帧数: %s' % len(evicted))
+
+    def log_summary(self):
+        """输出并清空缓存命中统计"""
+        total = self.hit_count + self.miss_count
+        hit_rate = self.hit_count / total * 100 if total else 0.0
+        hlog.info('结果缓存命中: %s，未命中: %s，命中率: %.1f%%' % (self.hit_count, self.miss_count, hit_rate))
+
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def close(self):
+        with self.lock:
+            self.db.close()
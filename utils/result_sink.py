@@ -0,0 +1,158 @@
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class ResultSink:
+    """
+    人脸结果输出
+
+    每个通过过滤并完成写图的人脸立即写入一条结构化记录，任务运行过程中其他程序即可读取已完成的部分结果；
+    按文件扩展名选择 JSONL 或 SQLite 格式。两种格式都在已有文件上继续写入，新的运行开始前由调用方通过 remove 删除旧结果，
+    从进度记录恢复时通过 retain_frames 只保留已完成帧的结果
+    """
+
+    SQLITE_SUFFIXES = ('.sqlite', '.sqlite3', '.db')
+
+    @staticmethod
+    def open(path):
+        """按文件扩展名创建结果输出，.jsonl 为 JSONL 格式，.sqlite/.sqlite3/.db 为 SQLite 格式"""
+        suffix = Path(path).suffix.lower()
+
+        if suffix == '.jsonl':
+            return JsonlResultSink(path)
+
+        if suffix in ResultSink.SQLITE_SUFFIXES:
+            return SqliteResultSink(path)
+
+        raise ValueError('无法识别的结果文件格式：%s' % path)
+
+    @staticmethod
+    def remove(path):
+        """删除已有的结果文件，SQLite 格式同时删除 WAL 和共享内存文件；新的运行开始前调用，结果不与之前的运行重复"""
+        path = Path(path)
+        for suffix in ('', '-wal', '-shm'):
+            target = path.with_name(path.name + suffix)
+            if target.exists():
+                target.unlink()
+
+    @staticmethod
+    def retain_frames(path, frames):
+        """
+        只保留已有结果文件中指定帧的记录，从进度记录恢复时删除未完成帧的记录，这些帧重新处理后再次写入
+
+        参数:
+            path: 结果文件路径
+            frames: 需要保留的帧号集合
+        """
+        path = Path(path)
+        if not path.exists():
+            return
+
+        if path.suffix.lower() in ResultSink.SQLITE_SUFFIXES:
+            db = sqlite3.connect(str(path), timeout=30)
+            try:
+                if db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'faces'").fetchone():
+                    stale = [(frame,) for (frame,) in db.execute('SELECT DISTINCT frame FROM faces')
+                             if frame not in frames]
+                    db.executemany('DELETE FROM faces WHERE frame = ?', stale)
+                    db.commit()
+            finally:
+                db.close()
+            return
+
+        # 使用临时文件替换，中断时不会留下不完整的结果文件；中断时没有写完整的最后一行同时被丢弃
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(path, 'r', encoding='utf-8') as source, open(temp_path, 'w', encoding='utf-8') as target:
+            for line in source:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                if record.get('frame') in frames:
+                    target.write(line if line.endswith('\n') else line + '\n')
+        os.replace(temp_path, path)
+
+
+class JsonlResultSink:
+    """JSONL 结果输出，每条记录一行，写入后立即刷新到文件"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.record_count = 0
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+
+        # 每条记录一次写入，多个分片进程追加同一文件时不会交错
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.record_count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+        hlog.info('人脸结果已写入: %s，记录数: %s' % (self.path, self.record_count))
+
+
+class SqliteResultSink:
+    """SQLite 结果输出，使用 WAL 模式，其他进程可以在写入过程中查询"""
+
+    COLUMNS = ('video', 'frame', 'face_index', 'timestamp', 'subtitle_index', 'subtitle_start', 'subtitle_end',
+               'region', 'left_eye', 'right_eye', 'face_confidence', 'age', 'gender', 'gender_confidence',
+               'race', 'race_confidence', 'emotion', 'emotion_confidence', 'identity_id', 'crop_path')
+
+    # 需要以 JSON 文本保存的字段
+    JSON_COLUMNS = ('region', 'left_eye', 'right_eye')
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.record_count = 0
+
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS faces ('
+                        'video TEXT NOT NULL, frame INTEGER NOT NULL, face_index INTEGER NOT NULL, '
+                        'timestamp REAL, subtitle_index INTEGER, subtitle_start TEXT, subtitle_end TEXT, '
+                        'region TEXT, left_eye TEXT, right_eye TEXT, face_confidence REAL, age INTEGER, '
+                        'gender TEXT, gender_confidence REAL, race TEXT, race_confidence REAL, '
+                        'emotion TEXT, emotion_confidence REAL, identity_id INTEGER, crop_path TEXT, '
+                        'PRIMARY KEY (video, frame, face_index))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS faces_subtitle ON faces (video, subtitle_index)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS faces_identity ON faces (video, identity_id)')
+        self.db.commit()
+
+        self.insert_sql = 'INSERT OR REPLACE INTO faces (%s) VALUES (%s)' % (
+            ', '.join(SqliteResultSink.COLUMNS), ', '.join('?' * len(SqliteResultSink.COLUMNS)))
+
+    def write(self, record):
+        values = []
+        for column in SqliteResultSink.COLUMNS:
+            value = record.get(column)
+            if value is not None and column in SqliteResultSink.JSON_COLUMNS:
+                value = json.dumps(value)
+            values.append(value)
+
+        # 每条记录单独提交，读取方可以立即看到
+        with self.lock:
+            self.db.execute(self.insert_sql, values)
+            self.db.commit()
+            self.record_count += 1
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+        hlog.info('人脸结果已写入: %s，记录数: %s' % (self.path, self.record_count))
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class RunCheckpoint:
+    """
+    可恢复运行的进度记录
+
+    在输出目录中保存进度清单（选帧计划）和已完成帧的结果记录，文件名由视频指纹、字幕和相关配置计算的键决定；
+    中断后再次运行相同任务时复用选帧计划，并跳过已完成的帧
+    """
+
+    FILE_PREFIX = '.face_capture_progress_'
+
+    # 计算视频指纹时读取的文件头尾字节数
+    FINGERPRINT_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, avatar_output_path, video_path, subtitle_times, settings):
+        """
+        参数:
+            avatar_output_path: 输出目录，进度文件保存在该目录中
+            video_path: 视频文件路径
+            subtitle_times: 字幕时间列表
+            settings: 影响选帧和输出结果的配置项字典
+        """
+        key_source = {
+            'video': RunCheckpoint.fingerprint(video_path),
+            'subtitles': hashlib.sha1(json.dumps(subtitle_times).encode('utf-8')).hexdigest(),
+            'settings': settings,
+        }
+        self.key = hashlib.sha1(json.dumps(key_source, sort_keys=True).encode('utf-8')).hexdigest()
+        self.key_source = key_source
+
+        prefix = Path(avatar_output_path) / ('%s%s' % (RunCheckpoint.FILE_PREFIX, self.key[:16]))
+        self.manifest_path = prefix.with_suffix('.json')
+        self.results_path = prefix.with_suffix('.jsonl')
+
+        self.plan = None
+        self.completed_frames = set()
+        self.results = {}
+        self.pending_frames = {}
+        self.lock = threading.Lock()
+        self.results_file = None
+
+    @staticmethod
+    def fingerprint(video_path):
+        """根据文件大小和头尾各 1MB 内容计算视频指纹，不读取整个文件"""
+        video_path = Path(video_path)
+        size = video_path.stat().st_size
+        digest = hashlib.sha1(str(size).encode('utf-8'))
+
+        with open(video_path, 'rb') as file:
+            digest.update(file.read(RunCheckpoint.FINGERPRINT_CHUNK_SIZE))
+            if size > RunCheckpoint.FINGERPRINT_CHUNK_SIZE:
+                file.seek(max(0, size - RunCheckpoint.FINGERPRINT_CHUNK_SIZE))
+                digest.update(file.read(RunCheckpoint.FINGERPRINT_CHUNK_SIZE))
+
+        return digest.hexdigest()
+
+    def load(self):
+        """读取已有的进度记录，返回是否找到可复用的记录"""
+        if not self.manifest_path.exists():
+            return False
+
+        with open(self.manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+
+        if manifest.get('key') != self.key:
+            return False
+
+        self.plan = manifest.get('plan')
+
+        if self.results_path.exists():
+            with open(self.results_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 中断时最后一行可能没有写完整
+                        continue
+
+                    self.completed_frames.add(record['frame'])
+                    self.results[record['frame']] = [tuple(result) for result in record['results']]
+
+        hlog.info('找到进度记录: %s，已完成帧数: %s' % (self.manifest_path, len(self.completed_frames)))
+
+        return True
+
+    def save_plan(self, keyframes):
+        """保存选帧计划，使用临时文件替换以免中断时留下不完整的清单"""
+        self.plan = list(keyframes)
+        manifest = dict(self.key_source, key=self.key, plan=self.plan)
+
+        temp_path = self.manifest_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file)
+        os.replace(temp_path, self.manifest_path)
+
+        # 选帧计划变化后旧的结果记录不再有效
+        if self.results_path.exists() and not self.completed_frames:
+            self.results_path.unlink()
+
+    def _complete_frame(self, frame_count, results):
+        if self.results_file is None:
+            self.results_file = open(self.results_path, 'a', encoding='utf-8')
+
+        self.results_file.write(json.dumps({'frame': frame_count, 'results': results}, ensure_ascii=False) + '\n')
+        self.results_file.flush()
+
+        self.completed_frames.add(frame_count)
+        self.results[frame_count] = results
+
+    def begin_frame(self, frame_count, face_count):
+        """记录一帧中等待写图的人脸数量，没有人脸时该帧直接完成"""
+        with self.lock:
+            if face_count == 0:
+                self._complete_frame(frame_count, [])
+            else:
+                self.pending_frames[frame_count] = [face_count, []]
+
+    def face_done(self, frame_count, face_index, result):
+        """记录一个人脸的写图结果，该帧所有人脸都完成后按人脸序号写入结果记录"""
+        with self.lock:
+            pending = self.pending_frames.get(frame_count)
+            if pending is None:
+                return
+
+            pending[1].append((face_index, result))
+            if len(pending[1]) == pending[0]:
+                del self.pending_frames[frame_count]
+                self._complete_frame(frame_count, [result for _, result in sorted(pending[1])])
+
+    def remaining_frames(self, keyframes):
+        """过滤掉已完成的帧"""
+        return [frame for frame in keyframes if frame not in self.completed_frames]
+
+    def completed_results(self):
+        """所有已完成帧（包括之前运行完成的帧）的结果，按帧号顺序排列"""
+        return [result for frame in sorted(self.results) for result in self.results[frame]]
+
+    def close(self):
+        with self.lock:
+            if self.results_file is not None:
+                self.results_file.close()
+                self.results_file = None
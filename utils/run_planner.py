@@ -0,0 +1,91 @@
+import time
+
+from utils.frame_planner import FramePlanner
+from utils.subtitle_index import SubtitleIndex
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class RunPlanner:
+    """
+    试运行的选帧规划
+
+    只解析字幕并通过解复用（不解码）计算选帧计划，估计需要解码和需要做人脸检测、属性分析的帧数；
+    不加载模型、不解码图像，也不写任何输出文件
+    """
+
+    @staticmethod
+    def plan_video(video_path, sub_path, public_config):
+        """
+        计算一个视频的选帧计划
+
+        返回:
+            规划结果字典，包括字幕数、帧区间、预计解码帧数（frames_to_decode）和预计分析帧数（frames_to_analyze）
+        """
+        start_time = time.perf_counter()
+        subtitle_times = SubtitleIndex.parse_file(str(sub_path))
+        planner = FramePlanner(video_path=video_path,
+                               subtitle_times=subtitle_times,
+                               frame_redundancy=public_config.frame_redundancy,
+                               sampling=public_config.frame_sampling,
+                               frames_per_cue=public_config.frames_per_cue,
+                               frame_budget=public_config.max_frames_per_video)
+
+        packets = {}
+        frames = planner.plan_frames(packets=packets)
+
+        # 按字幕保留人脸时，写图数量不超过字幕数与每条字幕保留数的乘积
+        max_faces_kept = None
+        if public_config.face_top_k > 0 and not public_config.face_tracking:
+            max_faces_kept = len(planner.cue_ranges) * public_config.face_top_k
+
+        return {
+            'video': str(video_path),
+            'fps': round(planner.fps, 3),
+            'total_frames': planner.total_frames,
+            'subtitle_cues': len(subtitle_times),
+            'intervals': len(planner.intervals),
+            'interval_frames': sum(end - start + 1 for start, end in planner.intervals),
+            'sampling': planner.sampling,
+            'frames_to_decode': planner.estimate_decoded_frames(frame_numbers=frames, packets=packets),
+            'frames_to_analyze': len(frames),
+            'max_faces_kept': max_faces_kept,
+            'plan_seconds': round(time.perf_counter() - start_time, 3),
+        }
+
+    @staticmethod
+    def run(jobs, public_config):
+        """
+        输出每个视频和全部视频合计的预计处理量
+
+        参数:
+            jobs: [(video_path, sub_path), ...]
+
+        返回:
+            各视频的规划结果列表，规划失败的视频不包括在内
+        """
+        plans = []
+        for video_path, sub_path in jobs:
+            try:
+                plan = RunPlanner.plan_video(video_path=video_path, sub_path=sub_path, public_config=public_config)
+            except Exception as e:
+                hlog.error('规划视频（%s）时出错: %s' % (video_path, e))
+                continue
+
+            hlog.info('试运行: %s，字幕数: %s，帧区间: %s 个/%s 帧，选帧方式: %s，预计解码帧数: %s，'
+                      '预计检测和分析帧数: %s，最多保存人脸数: %s，规划耗时: %.3f 秒' % (
+                          plan['video'], plan['subtitle_cues'], plan['intervals'], plan['interval_frames'],
+                          plan['sampling'], plan['frames_to_decode'], plan['frames_to_analyze'],
+                          '不限' if plan['max_faces_kept'] is None else plan['max_faces_kept'],
+                          plan['plan_seconds']))
+            plans.append(plan)
+
+        if len(plans) > 1:
+            hlog.info('试运行合计: 视频数: %s，预计解码帧数: %s，预计检测和分析帧数: %s' % (
+                len(plans),
+                sum(plan['frames_to_decode'] for plan in plans),
+                sum(plan['frames_to_analyze'] for plan in plans)))
+
+        return plans
@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from utils.batch_runner import BatchRunner
+from utils.face_util import FaceCaptureUtils
+from utils.frame_planner import FramePlanner
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class ShardRunner:
+    """
+    单个长视频按时间分片并行处理
+
+    将字幕区间按帧数均分为若干互不重叠的分片，每个分片在独立进程中定位到分片起点处理，
+    最后按帧号顺序合并各分片的结果，输出文件名与不分片时一致
+    """
+
+    # 限制每个分片进程内部计算库使用的线程数，避免多进程时线程数超过 CPU 核数
+    THREAD_ENV_NAMES = ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')
+
+    @staticmethod
+    def process_shard(shard_index, video_path, sub_path, avatar_output_path, intervals):
+        """在工作进程中处理一个分片，返回 (分片序号, 人脸分析结果列表)"""
+        start_time = time.time()
+
+        # 收到终止信号后不再开始新的分片
+        if BatchRunner.interrupted:
+            return shard_index, []
+
+        faces = FaceCaptureUtils.capture_avatar_from_files(video_path=video_path,
+                                                           sub_path=sub_path,
+                                                           avatar_output_path=avatar_output_path,
+                                                           intervals=intervals)
+
+        hlog.info('分片 %s（帧 %s-%s）处理完成，人脸数: %s，耗时: %.3f 秒' % (shard_index,
+                                                                         intervals[0][0],
+                                                                         intervals[-1][1],
+                                                                         len(faces),
+                                                                         time.time() - start_time))
+
+        return shard_index, faces
+
+    @staticmethod
+    def run(video_path, sub_path, avatar_output_path, shard_count, mod_config_path, private_config, public_config):
+        """
+        将一个视频分片后使用进程池并行处理
+
+        返回:
+            按帧号顺序合并后的人脸分析结果列表
+        """
+        subtitle_times = FaceCaptureUtils.parse_subtitles(str(sub_path))
+        planner = FramePlanner(video_path=video_path,
+                               subtitle_times=subtitle_times,
+                               frame_redundancy=public_config.frame_redundancy)
+        # 按字幕保留前 K 个人脸时在各分片内分别进行，同一字幕的帧必须位于同一分片，否则该字幕最多输出 2K 个人脸
+        whole_intervals = public_config.face_top_k > 0 and not public_config.face_tracking
+        shards = FramePlanner.split_intervals(intervals=planner.intervals,
+                                              shard_count=shard_count,
+                                              whole_intervals=whole_intervals)
+        hlog.info('视频（%s）分片数: %s' % (video_path, len(shards)))
+        if whole_intervals and len(shards) < shard_count:
+            hlog.warning('按字幕保留人脸时只在字幕区间之间分片，分片数（%s）少于配置（%s）' % (len(shards), shard_count))
+
+        if not shards:
+            return []
+
+        # 各分片进程向同一个结果文件和分卷目录追加，启动分片前按各分片的进度记录处理之前的输出
+        checkpoints = [FaceCaptureUtils.open_checkpoint(video_path=Path(video_path),
+                                                        subtitle_times=subtitle_times,
+                                                        avatar_output_path=Path(avatar_output_path),
+                                                        frame_redundancy=public_config.frame_redundancy,
+                                                        target_size=(public_config.image_width,
+                                                                     public_config.image_height),
+                                                        eye_diff_threshold=public_config.eye_diff_threshold,
+                                                        intervals=intervals)
+                       for intervals in shards]
+        FaceCaptureUtils.prepare_outputs(avatar_output_path=avatar_output_path, checkpoints=checkpoints)
+
+        threads_per_shard = str(max(1, (os.cpu_count() or 1) // len(shards)))
+        for name in ShardRunner.THREAD_ENV_NAMES:
+            os.environ.setdefault(name, threads_per_shard)
+
+        results = [[] for _ in shards]
+
+        executor = ProcessPoolExecutor(max_workers=len(shards),
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=BatchRunner.init_worker,
+                                       initargs=(mod_config_path, private_config, public_config))
+
+        try:
+            futures = [executor.submit(ShardRunner.process_shard,
+                                       shard_index,
+                                       video_path,
+                                       sub_path,
+                                       avatar_output_path,
+                                       intervals)
+                       for shard_index, intervals in enumerate(shards)]
+
+            for future in futures:
+                shard_index, faces = future.result()
+                results[shard_index] = faces
+        except (KeyboardInterrupt, SystemExit):
+            # 取消未开始的分片，各分片进程收到同一终止信号后停止，已完成的帧记录在进度中，再次运行时继续
+            hlog.warning('分片处理被中断，取消未开始的分片')
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            executor.shutdown(wait=True)
+
+        # 分片按时间顺序排列且互不重叠，依次拼接即为帧号顺序
+        return [face for faces in results for face in faces]
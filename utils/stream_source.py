@@ -0,0 +1,234 @@
+import codecs
+import io
+import stat
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+import av
+
+from utils.subtitle_index import SubtitleIndex
+
+from happy_python import HappyLog
+
+hlog = HappyLog.get_instance()
+
+
+class SubtitleTail:
+    """
+    增量读取正在写入的 SRT 字幕文件
+
+    每次读取文件新增的内容，只解析已经写完整的行，文件不存在时等待其创建
+    """
+
+    def __init__(self, sub_path):
+        self.sub_path = Path(sub_path)
+        self.offset = 0
+        self.buffer = ''
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+
+    def poll(self):
+        """
+        读取上次之后新增的字幕
+
+        返回:
+            新字幕的时间列表 [(start_time, end_time), ...]
+        """
+        if not self.sub_path.exists():
+            return []
+
+        with open(self.sub_path, 'rb') as file:
+            file.seek(self.offset)
+            data = file.read()
+
+        self.offset += len(data)
+        self.buffer += self.decoder.decode(data)
+
+        # 只解析完整的行，最后一行可能还没有写完
+        complete, _, self.buffer = self.buffer.rpartition('\n')
+
+        return SubtitleIndex.SUBTITLE_PATTERN.findall(complete)
+
+    def finished(self, idle_timeout):
+        """字幕文件已读到结尾，且超过 idle_timeout 秒没有修改时，认为字幕已经写完"""
+        if not self.sub_path.exists():
+            return False
+
+        file_stat = self.sub_path.stat()
+
+        return self.offset >= file_stat.st_size and time.time() - file_stat.st_mtime > idle_timeout
+
+
+class GrowingFileReader(io.RawIOBase):
+    """
+    读取正在写入的视频文件，读到文件结尾时等待新数据，超过 idle_timeout 秒没有新数据时认为文件已写完
+
+    读取过程中不能定位，文件必须是可以顺序解码的容器（MPEG-TS、分片 MP4 等），
+    moov 在文件末尾的普通 MP4 无法以这种方式读取
+    """
+
+    def __init__(self, path, idle_timeout, poll_interval):
+        self.file = open(path, 'rb')
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        idle_since = time.monotonic()
+
+        while True:
+            size = self.file.readinto(buffer)
+            if size:
+                return size
+
+            if time.monotonic() - idle_since > self.idle_timeout:
+                return 0
+
+            time.sleep(self.poll_interval)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class StreamFrameSource:
+    """
+    流式输入的帧来源
+
+    顺序解码标准输入、命名管道、正在写入的文件或 PyAV 支持的网络地址，不定位、不依赖总帧数；
+    字幕文件在处理过程中增量读取，关键帧在等待窗口内缓存，时间点落在字幕（前后扩展冗余帧）范围内的关键帧立即交给流水线，
+    超过等待时间仍没有对应字幕的关键帧被丢弃；缓存的关键帧和字幕都按时间淘汰，内存占用不随流的长度增长
+    """
+
+    # 已结束字幕的保留时间（秒），写图线程生成结果记录时仍需按时间查找字幕
+    SUBTITLE_RETENTION = 600
+
+    def __init__(self, video_url, sub_path, frame_redundancy, subtitle_delay, poll_interval, idle_timeout):
+        """
+        参数:
+            video_url: 视频地址，- 表示标准输入，也可以是命名管道、正在写入的文件或 PyAV 支持的网络地址
+            sub_path: 字幕文件路径，处理过程中增量读取
+            frame_redundancy: 字幕时间前后需要额外检查的帧数
+            subtitle_delay: 关键帧等待对应字幕写入的时间（秒），视频时间和实际时间都超过该值后仍没有字幕时丢弃；
+                            输入比实时快时暂停解码等待字幕，缓存的关键帧不超过该时长的视频
+            poll_interval: 检查字幕文件和正在写入的视频文件的间隔（秒）
+            idle_timeout: 正在写入的视频文件超过该时间（秒）没有新数据时认为输入结束
+        """
+        self.video_url = video_url
+        self.subtitle_tail = SubtitleTail(sub_path)
+        self.subtitle_index = SubtitleIndex()
+        self.frame_redundancy = frame_redundancy
+        self.subtitle_delay = subtitle_delay
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.fps = None
+        # 之后产出的关键帧时间都不早于该值（秒，从流的第一帧开始计算），产出第一帧之前为 None
+        self.watermark = None
+
+    def open_input(self):
+        """按地址类型打开输入，已经写完的普通文件按可定位的方式打开，只有正在写入的文件逐步读取"""
+        if self.video_url == '-':
+            return av.open(sys.stdin.buffer, mode='r')
+
+        path = Path(self.video_url)
+        if path.exists() and stat.S_ISREG(path.stat().st_mode):
+            if time.time() - path.stat().st_mtime > self.idle_timeout:
+                return av.open(str(path), mode='r')
+
+            reader = GrowingFileReader(path, idle_timeout=self.idle_timeout, poll_interval=self.poll_interval)
+            return av.open(io.BufferedReader(reader), mode='r')
+
+        # 命名管道和网络地址直接交给 FFmpeg 打开
+        return av.open(self.video_url, mode='r')
+
+    def poll_subtitles(self):
+        for start_time, end_time in self.subtitle_tail.poll():
+            self.subtitle_index.add(start_time=start_time, end_time=end_time)
+
+    def iter_frames(self, stats=None, buffer_pool=None):
+        """
+        生成器，按帧号顺序产出字幕范围内的 (帧号, BGR 格式的 ndarray)，帧号按视频时间和帧率计算；
+        指定 buffer_pool（FrameBufferPool）时图像转换到池中复用的缓冲区
+        """
+        with self.open_input() as container:
+            stream = container.streams.video[0]
+            stream.thread_type = 'AUTO'
+            rate = stream.average_rate or stream.guessed_rate or stream.base_rate
+            self.fps = float(rate) if rate else 25.0
+            margin = self.frame_redundancy / self.fps
+
+            start_time = None
+            last_poll = 0.0
+            pending = deque()
+
+            def release(current_time):
+                """
+                产出已有字幕覆盖的关键帧，丢弃超过等待时间的关键帧，current_time 为 None 表示输入已结束；
+                字幕文件已经写完时不再等待，没有字幕覆盖的关键帧立即丢弃
+                """
+                subtitles_finished = None
+
+                while pending:
+                    frame_count, frame_time, arrival_time, image = pending[0]
+                    if self.subtitle_index.covers(frame_time, margin=margin):
+                        pending.popleft()
+                        # 先更新时间下限再产出，帧进入流水线之前下限不会超过该帧
+                        self.watermark = frame_time
+                        yield frame_count, image
+                        continue
+
+                    if subtitles_finished is None:
+                        subtitles_finished = self.subtitle_tail.finished(self.idle_timeout)
+
+                    if not subtitles_finished:
+                        if current_time is not None and frame_time >= current_time - self.subtitle_delay:
+                            break
+
+                        # 输入比实时快时，字幕可能还没有写入，按实际时间继续等待
+                        if time.monotonic() - arrival_time < self.subtitle_delay:
+                            time.sleep(self.poll_interval)
+                            self.poll_subtitles()
+                            subtitles_finished = None
+                            continue
+
+                    pending.popleft()
+                    if stats is not None:
+                        stats.count('frames_unmatched')
+
+                # 已产出的帧都已交给流水线，之后的帧不早于仍在等待字幕的第一个关键帧
+                if pending:
+                    self.watermark = pending[0][1]
+                elif current_time is not None:
+                    self.watermark = current_time
+
+            for frame in container.decode(stream):
+                if frame.time is None:
+                    continue
+
+                if start_time is None:
+                    start_time = frame.time
+                current_time = frame.time - start_time
+
+                if stats is not None:
+                    stats.count('frames_decoded')
+
+                if time.monotonic() - last_poll >= self.poll_interval:
+                    self.poll_subtitles()
+                    self.subtitle_index.prune(current_time - StreamFrameSource.SUBTITLE_RETENTION)
+                    last_poll = time.monotonic()
+
+                if frame.key_frame:
+                    decode_start = time.perf_counter()
+                    image = buffer_pool.to_bgr(frame) if buffer_pool is not None else frame.to_ndarray(format='bgr24')
+                    pending.append((int(round(current_time * self.fps)), current_time, time.monotonic(), image))
+                    if stats is not None:
+                        stats.add_time(stage='decode', seconds=time.perf_counter() - decode_start)
+
+                yield from release(current_time)
+
+            # 输入结束时读取最后写入的字幕，再处理剩余的关键帧
+            self.poll_subtitles()
+            yield from release(None)
@@ -0,0 +1,127 @@
+import bisect
+import re
+import threading
+
+from utils.frame_planner import FramePlanner
+
+
+class SubtitleIndex:
+    """
+    按时间查找字幕
+
+    字幕按开始时间排序保存，序号为字幕加入的顺序（与字幕文件中的顺序一致）；
+    支持在处理过程中追加新字幕，并淘汰已经结束很久的字幕，使流式处理时占用的内存保持不变
+    """
+
+    SUBTITLE_PATTERN = re.compile(r'(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})')
+
+    def __init__(self, subtitle_times=()):
+        """
+        参数:
+            subtitle_times: 初始字幕时间列表，格式为 [(start_time, end_time), ...]
+        """
+        self.cues = []
+        self.starts = []
+        self.next_index = 0
+        self.max_duration = 0.0
+        self.lock = threading.Lock()
+
+        for start_time, end_time in subtitle_times:
+            self.add(start_time=start_time, end_time=end_time)
+
+    @staticmethod
+    def parse_file(srt_file):
+        """
+        读取 SRT 字幕文件中每条字幕的时间范围
+
+        返回:
+            [(start_time, end_time), ...]
+        """
+        with open(srt_file, 'r', encoding='utf-8') as file:
+            content = file.read()
+
+        return SubtitleIndex.SUBTITLE_PATTERN.findall(content)
+
+    def __len__(self):
+        return len(self.cues)
+
+    def add(self, start_time, end_time):
+        """追加一条字幕，返回字幕序号"""
+        start = FramePlanner.time_to_seconds(start_time)
+        end = FramePlanner.time_to_seconds(end_time)
+
+        with self.lock:
+            index = self.next_index
+            self.next_index += 1
+
+            position = bisect.bisect_right(self.starts, start)
+            self.starts.insert(position, start)
+            self.cues.insert(position, (start, end, index, start_time, end_time))
+            self.max_duration = max(self.max_duration, end - start)
+
+        return index
+
+    def prune(self, before_seconds):
+        """淘汰在该时间点之前已经结束的字幕"""
+        with self.lock:
+            if self.cues and self.starts[0] + self.max_duration < before_seconds:
+                self.cues = [cue for cue in self.cues if cue[1] >= before_seconds]
+                self.starts = [cue[0] for cue in self.cues]
+
+    def covers(self, timestamp, margin=0.0):
+        """判断时间点是否在某条字幕前后各扩展 margin 秒的范围内"""
+        with self.lock:
+            position = bisect.bisect_right(self.starts, timestamp + margin)
+
+            while position > 0:
+                position -= 1
+                start, end = self.cues[position][:2]
+                if end + margin >= timestamp:
+                    return True
+
+                # 更早开始的字幕不可能覆盖该时间点
+                if start + self.max_duration + margin < timestamp:
+                    break
+
+        return False
+
+    def find(self, timestamp):
+        """
+        查找时间点所在的字幕，不在任何字幕时间范围内时（字幕前后的冗余帧）返回距离最近的字幕
+
+        字幕时间重叠时（如较长的字幕中间出现较短的字幕），返回覆盖该时间点的字幕中开始最晚的一条
+
+        返回:
+            (字幕序号, 开始时间, 结束时间)，没有字幕时返回 None
+        """
+        with self.lock:
+            if not self.cues:
+                return None
+
+            position = bisect.bisect_right(self.starts, timestamp)
+            best = None
+            best_distance = 0.0
+
+            # 从开始时间不晚于该时间点的字幕向前查找，不只检查前一条，较早开始的长字幕也可能覆盖该时间点
+            index = position
+            while index > 0:
+                index -= 1
+                start, end = self.cues[index][:2]
+
+                distance = max(0.0, timestamp - end)
+                if best is None or distance < best_distance:
+                    best, best_distance = self.cues[index], distance
+                    if distance == 0:
+                        break
+
+                # 更早开始的字幕结束时间不晚于 start + max_duration，不可能更近
+                if timestamp - (start + self.max_duration) >= best_distance:
+                    break
+
+            # 之后开始的字幕只需比较第一条
+            if position < len(self.cues) and (best is None or self.cues[position][0] - timestamp < best_distance):
+                best = self.cues[position]
+
+        _, _, index, start_time, end_time = best
+
+        return index, start_time, end_time